@@ -1,13 +1,15 @@
+import asyncio
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from decouple import config
 
-from .database import get_db
+from .database import get_async_db
 from .user_models import User
 
 # 設定
@@ -57,27 +59,30 @@ class AuthService:
         except JWTError:
             return None
 
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
     """メールアドレスでユーザー取得"""
-    return db.query(User).filter(User.email == email).first()
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
 
-def get_user_by_username(db: Session, username: str) -> Optional[User]:
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
     """ユーザー名でユーザー取得"""
-    return db.query(User).filter(User.username == username).first()
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
     """ユーザー認証"""
-    user = get_user_by_email(db, email)
+    user = await get_user_by_email(db, email)
     if not user:
         return None
-    if not AuthService.verify_password(password, user.hashed_password):
+    # bcryptの検証は重いのでイベントループを止めないようにスレッドで実行
+    if not await asyncio.to_thread(AuthService.verify_password, password, user.hashed_password):
         return None
     return user
 
-def create_user(db: Session, email: str, username: str, password: str, 
-                store_name: str = None, postal_code: str = None) -> User:
+async def create_user(db: AsyncSession, email: str, username: str, password: str, 
+                      store_name: str = None, postal_code: str = None) -> User:
     """ユーザー作成"""
-    hashed_password = AuthService.get_password_hash(password)
+    hashed_password = await asyncio.to_thread(AuthService.get_password_hash, password)
     db_user = User(
         email=email,
         username=username,
@@ -86,13 +91,13 @@ def create_user(db: Session, email: str, username: str, password: str,
         postal_code=postal_code
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """現在のユーザー取得（認証必須）"""
     credentials_exception = HTTPException(
@@ -109,13 +114,13 @@ def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = get_user_by_email(db, email=email)
+    user = await get_user_by_email(db, email=email)
     if user is None:
         raise credentials_exception
     
     return user
 
-def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     """アクティブユーザー取得"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="非アクティブユーザーです")
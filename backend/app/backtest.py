@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from .data_processor import DataProcessor
+from .models import SalesPredictionModel, DEFAULT_ENGINE
+
+# ワーカープロセスで共有する特徴量行列（フォールドごとに送らない）
+_worker_state: Dict[str, Any] = {}
+
+def _init_worker(X: np.ndarray, y: np.ndarray, engine: str):
+    """ワーカー初期化：特徴量行列を一度だけ受け取る"""
+    _worker_state['X'] = X
+    _worker_state['y'] = y
+    _worker_state['engine'] = engine
+
+def _run_fold(fold: Tuple[int, np.ndarray, np.ndarray]) -> Dict[str, Any]:
+    """1フォール分の再学習と評価"""
+    fold_no, train_idx, test_idx = fold
+    X = _worker_state['X']
+    y = _worker_state['y']
+
+    model = SalesPredictionModel(engine=_worker_state['engine'])
+    result = {'fold': fold_no, 'train_size': len(train_idx), 'test_size': len(test_idx)}
+
+    # 木モデルはスケーリング不要のため、ここでは生の特徴量で学習する
+    for target_no, target in enumerate(('sales', 'customers')):
+        regressor = model._build_regressor()
+        if 'n_jobs' in regressor.get_params():
+            # プロセス並列と競合しないようにスレッド数を1に制限
+            regressor.set_params(n_jobs=1)
+        regressor.fit(X[train_idx], y[train_idx, target_no])
+        pred = regressor.predict(X[test_idx])
+
+        metrics = model._calculate_metrics(y[test_idx, target_no], pred)
+        result[f'{target}_mae'] = metrics['mae']
+        result[f'{target}_mape'] = metrics['mape']
+        result[f'{target}_abs_errors'] = np.abs(y[test_idx, target_no] - pred)
+        result[f'{target}_actuals'] = y[test_idx, target_no]
+
+    return result
+
+class WalkForwardBacktester:
+    """時系列順のローリングオリジン・バックテスト"""
+
+    def __init__(self, n_folds: int = 50, horizon_days: int = 7, min_train_days: int = 60,
+                 engine: str = DEFAULT_ENGINE, max_workers: Optional[int] = None):
+        self.n_folds = n_folds
+        self.horizon_days = horizon_days
+        self.min_train_days = min_train_days
+        self.engine = engine
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def build_folds(self, dates: np.ndarray) -> List[Tuple[int, np.ndarray, np.ndarray]]:
+        """評価起点ごとに学習・検証のインデックスを作成"""
+        # 日付順の並びを一度だけ作成し、各フォールドはそのスライスを使う
+        order = np.argsort(dates, kind='stable')
+        sorted_dates = dates[order]
+        unique_dates = np.unique(sorted_dates)
+
+        if len(unique_dates) < self.min_train_days + self.horizon_days:
+            raise Exception("バックテストに必要なデータ期間が不足しています")
+
+        # 最後の検証期間が末尾に収まるように起点を等間隔に配置
+        first_origin = self.min_train_days
+        last_origin = len(unique_dates) - self.horizon_days
+        origins = np.unique(np.linspace(first_origin, last_origin, self.n_folds).astype(int))
+
+        folds = []
+        for fold_no, origin in enumerate(origins):
+            test_end = min(origin + self.horizon_days, len(unique_dates))
+            train_stop = np.searchsorted(sorted_dates, unique_dates[origin], side='left')
+            test_stop = (
+                len(sorted_dates) if test_end >= len(unique_dates)
+                else np.searchsorted(sorted_dates, unique_dates[test_end], side='left')
+            )
+            folds.append((fold_no, order[:train_stop], order[train_stop:test_stop]))
+
+        return folds
+
+    def run(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """バックテスト実行"""
+        try:
+            # 特徴量行列は一度だけ作成する
+            processor = DataProcessor()
+            X, y = processor.create_features(df)
+            dates = processor.processed_data['date'].values
+
+            X_values = np.ascontiguousarray(X.to_numpy(dtype=np.float64))
+            y_values = np.ascontiguousarray(y[['sales', 'customers']].to_numpy(dtype=np.float64))
+            folds = self.build_folds(dates)
+
+            if self.max_workers > 1:
+                with ProcessPoolExecutor(
+                    max_workers=min(self.max_workers, len(folds)),
+                    initializer=_init_worker,
+                    initargs=(X_values, y_values, self.engine)
+                ) as executor:
+                    fold_results = list(executor.map(_run_fold, folds))
+            else:
+                _init_worker(X_values, y_values, self.engine)
+                fold_results = [_run_fold(fold) for fold in folds]
+
+            return self._summarize(fold_results, folds, dates)
+
+        except Exception as e:
+            raise Exception(f"バックテストエラー: {str(e)}")
+
+    def _summarize(self, fold_results: List[Dict[str, Any]], folds, dates: np.ndarray) -> Dict[str, Any]:
+        """フォールド別・全体の評価指標を集計"""
+        per_fold = []
+        aggregate = {}
+
+        for result, (_, train_idx, test_idx) in zip(fold_results, folds):
+            per_fold.append({
+                'fold': result['fold'],
+                'train_end': pd.Timestamp(dates[train_idx].max()).strftime('%Y-%m-%d'),
+                'test_start': pd.Timestamp(dates[test_idx].min()).strftime('%Y-%m-%d'),
+                'test_end': pd.Timestamp(dates[test_idx].max()).strftime('%Y-%m-%d'),
+                'train_size': result['train_size'],
+                'test_size': result['test_size'],
+                'sales_mae': float(result['sales_mae']),
+                'sales_mape': float(result['sales_mape']),
+                'customers_mae': float(result['customers_mae']),
+                'customers_mape': float(result['customers_mape'])
+            })
+
+        for target in ('sales', 'customers'):
+            abs_errors = np.concatenate([r[f'{target}_abs_errors'] for r in fold_results])
+            actuals = np.concatenate([r[f'{target}_actuals'] for r in fold_results])
+            fold_mae = np.array([r[f'{target}_mae'] for r in fold_results])
+            fold_mape = np.array([r[f'{target}_mape'] for r in fold_results])
+
+            aggregate[f'{target}_metrics'] = {
+                'mae': float(abs_errors.mean()),
+                'mape': float(np.mean(abs_errors / np.clip(actuals, 1, None)) * 100),
+                'fold_mae_mean': float(fold_mae.mean()),
+                'fold_mae_std': float(fold_mae.std()),
+                'fold_mape_mean': float(fold_mape.mean()),
+                'fold_mape_std': float(fold_mape.std())
+            }
+
+        return {
+            'engine': self.engine,
+            'n_folds': len(per_fold),
+            'horizon_days': self.horizon_days,
+            'folds': per_fold,
+            **aggregate
+        }
@@ -3,14 +3,78 @@ import numpy as np
 from datetime import datetime, timedelta
 import holidays
 import io
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, Optional, List
+
+from .memory_monitor import memory_monitor
+from .feature_spec import FeatureSpec, Lag, Rolling, group_starts
+
+# CSVの天気 → 天気コード（該当なしは欠損として前後から補完）
+WEATHER_CODES = {
+    'sunny': 0, 'cloudy': 1, 'rainy': 2,
+    'sleet': 3, 'snow': 4, 'unknown': -1
+}
+
+# 天気予報の表記 → 天気コード（該当なしは-1=不明）
+FORECAST_WEATHER_CODES = {
+    '晴れ': 0, '曇り': 1, '雨': 2,
+    'みぞれ': 3, '雪': 4
+}
+
+# モデルに渡す特徴量（学習の行列と予測の1行を同じ定義から作る）
+FEATURE_SPEC = FeatureSpec(history=[
+    Rolling('sales', 7, 'mean', name='sales_ma7'),
+    Rolling('customers', 7, 'mean', name='customers_ma7'),
+    Lag('sales', 7, name='prev_week_sales'),
+    Lag('customers', 7, name='prev_week_customers')
+])
+
+# 特徴量カラム（順序を含めて学習・予測で共通）
+FEATURE_COLUMNS = FEATURE_SPEC.columns
+
+# 履歴がない場合の売上・客数
+HISTORY_DEFAULTS = {'sales': 50000, 'customers': 50}
+
+# 繰り返しの多い文字列はカテゴリ型で保持する
+CATEGORY_COLUMNS = ['store_id', 'store_name', 'weather']
+
+# 金額・比率は float32 で十分な精度がある
+FLOAT32_COLUMNS = [
+    'sales', 'target_achievement_rate', 'yoy_same_day_ratio',
+    'avg_spending', 'labor_cost_rate', 'cost_rate'
+]
+
+# 特徴量の型（年は int16、その他のカレンダー・コードは int8、履歴特徴量は float32）
+FEATURE_DTYPES = FEATURE_SPEC.dtypes
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """メモリ効率の良い型に揃える（フレームはコピーせず列単位で置き換える）"""
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    
+    for col in FLOAT32_COLUMNS:
+        if col in df.columns and df[col].dtype != np.float32:
+            df[col] = df[col].astype(np.float32)
+    
+    # 客数は値域に応じて int16 / int32（欠損がある場合は float32）
+    if 'customers' in df.columns:
+        customers = df['customers']
+        if customers.isna().any():
+            df['customers'] = customers.astype(np.float32)
+        elif len(customers) == 0 or customers.abs().max() <= np.iinfo(np.int16).max:
+            df['customers'] = customers.astype(np.int16)
+        else:
+            df['customers'] = customers.astype(np.int32)
+    
+    return df
 
 class DataProcessor:
-    def __init__(self):
+    def __init__(self, feature_spec: FeatureSpec = FEATURE_SPEC):
         self.data = None
         self.processed_data = None
-        self.jp_holidays = holidays.Japan()
+        self.feature_spec = feature_spec
     
+    @memory_monitor.stage('process_csv_data')
     def process_csv_data(self, csv_content: bytes) -> pd.DataFrame:
         """CSVデータの読み込みと前処理"""
         try:
@@ -83,110 +147,107 @@ class DataProcessor:
             df['store_id'] = df['store_id'].fillna('default')
             df['store_name'] = df['store_name'].fillna('店舗名なし')
             
+            # 店舗・天気はカテゴリ型、数値は小さい型で保持
+            df = compact_dtypes(df)
+            
             self.data = df
             return df
             
         except Exception as e:
             raise Exception(f"CSV処理エラー: {str(e)}")
     
+    @memory_monitor.stage('create_features')
     def create_features(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """特徴量エンジニアリング"""
-        feature_df = df.copy()
+        if 'store_id' not in df.columns:
+            df = df.assign(store_id='default')
         
-        # 時系列特徴量
-        feature_df['year'] = feature_df['date'].dt.year
-        feature_df['month'] = feature_df['date'].dt.month
-        feature_df['day'] = feature_df['date'].dt.day
-        feature_df['weekday'] = feature_df['date'].dt.weekday  # 0=月曜日
-        feature_df['is_weekend'] = feature_df['weekday'].isin([5, 6]).astype(int)
+        # 店舗ごとの時系列順に並べる（並べ替えで新しいフレームになるのでコピーは不要）
+        feature_df = compact_dtypes(df.sort_values(['store_id', 'date'], kind='stable'))
         
-        # 祝日フラグ
-        feature_df['is_holiday'] = feature_df['date'].apply(
-            lambda x: x.date() in self.jp_holidays
-        ).astype(int)
+        spec = self.feature_spec
         
-        # 天気エンコーディング
-        weather_encoding = {
-            'sunny': 0, 'cloudy': 1, 'rainy': 2, 
-            'sleet': 3, 'snow': 4, 'unknown': -1
-        }
-        feature_df['weather_code'] = feature_df['weather'].map(weather_encoding)
+        # カレンダー・天気特徴量（天気の欠損は後で前後から補完）
+        weather_code = feature_df['weather'].map(WEATHER_CODES).astype(np.float32).to_numpy()
+        calendar = spec.calendar_features(feature_df['date'], self._holiday_flags(feature_df['date']), weather_code)
         
-        # 季節特徴量
-        feature_df['season'] = feature_df['month'].apply(self._get_season)
+        # 履歴特徴量（ラグ・移動集計）を店舗をまたがずに一度に計算し、店舗の先頭行は店舗内の後ろの値で補完
+        starts = group_starts(feature_df['store_id'].cat.codes.to_numpy())
+        history = spec.fill_history(spec.compute_history(
+            {col: feature_df[col].to_numpy(dtype=np.float64) for col in spec.source_columns}, starts
+        ), starts)
         
-        # 過去データ特徴量（7日間移動平均）
-        feature_df = feature_df.sort_values('date')
-        feature_df['sales_ma7'] = feature_df['sales'].rolling(window=7, min_periods=1).mean()
-        feature_df['customers_ma7'] = feature_df['customers'].rolling(window=7, min_periods=1).mean()
+        feature_df = feature_df.assign(
+            **calendar, **{name: values.astype(np.float32) for name, values in history.items()}
+        )
         
-        # 前週同曜日データ
-        feature_df['prev_week_sales'] = feature_df['sales'].shift(7)
-        feature_df['prev_week_customers'] = feature_df['customers'].shift(7)
+        # 残った欠損は欠損のある列だけ前後から補完
+        na_columns = feature_df.columns[feature_df.isna().any()]
+        if len(na_columns) > 0:
+            feature_df[na_columns] = feature_df[na_columns].bfill().ffill()
+        if 'weather_code' in calendar:
+            feature_df['weather_code'] = feature_df['weather_code'].astype(np.int8)
         
-        # 欠損値補完
-        feature_df = feature_df.bfill().ffill()
+        # 時系列順に並べ直す（学習・検証の分割は日付順を前提とする）
+        feature_df = feature_df.sort_values(['date', 'store_id'], kind='stable')
         
         # 特徴量とターゲットを分離
-        feature_columns = [
-            'year', 'month', 'day', 'weekday', 'is_weekend', 'is_holiday',
-            'weather_code', 'season', 'sales_ma7', 'customers_ma7',
-            'prev_week_sales', 'prev_week_customers'
-        ]
-        
-        X = feature_df[feature_columns]
+        X = feature_df[spec.columns]
         y = feature_df[['sales', 'customers']]
         
         self.processed_data = feature_df
         return X, y
     
-    def create_prediction_features(self, target_date: datetime.date, weather_data: dict) -> pd.DataFrame:
-        """予測用特徴量作成"""
-        # 基本特徴量
-        features = {
-            'year': target_date.year,
-            'month': target_date.month,
-            'day': target_date.day,
-            'weekday': target_date.weekday(),
-            'is_weekend': 1 if target_date.weekday() in [5, 6] else 0,
-            'is_holiday': 1 if target_date in self.jp_holidays else 0,
-            'season': self._get_season(target_date.month)
-        }
+    def create_prediction_features(self, target_date: datetime.date, weather_data: dict,
+                                   store_id: Optional[str] = None) -> pd.DataFrame:
+        """予測用特徴量作成（学習と同じ定義で、直近の履歴から1行分を計算）
         
-        # 天気特徴量
-        weather_mapping = {
-            '晴れ': 0, '曇り': 1, '雨': 2, 
-            'みぞれ': 3, '雪': 4
-        }
-        weather_condition = weather_data.get('weather', '不明')
-        features['weather_code'] = weather_mapping.get(weather_condition, -1)
+        ラグ・移動集計は履歴の最終日の翌日を前提にするため、それより先の日付は
+        HorizonForecaster で間の日を予測値で埋めてから予測する。
+        """
+        features = self.create_calendar_features(
+            pd.DatetimeIndex([target_date]), [weather_data.get('weather', '不明')]
+        )
+        
+        history = self.processed_data
+        if history is not None and store_id is not None and 'store_id' in history.columns:
+            history = history[history['store_id'] == store_id]
+        
+        target = pd.Timestamp(target_date)
+        if history is not None:
+            # 予測日以降の実績は使わない
+            history = history[history['date'] < target]
         
-        # 履歴特徴量（実際の実装では過去データから計算）
-        if self.processed_data is not None:
-            recent_data = self.processed_data.tail(30)
-            features['sales_ma7'] = recent_data['sales'].mean()
-            features['customers_ma7'] = recent_data['customers'].mean()
-            features['prev_week_sales'] = recent_data['sales'].iloc[-7] if len(recent_data) >= 7 else recent_data['sales'].mean()
-            features['prev_week_customers'] = recent_data['customers'].iloc[-7] if len(recent_data) >= 7 else recent_data['customers'].mean()
+        spec = self.feature_spec
+        if history is not None and len(history) > 0:
+            gap_days = (target - history['date'].max().normalize()).days - 1
+            if gap_days > 0:
+                raise Exception(
+                    f"履歴の最終日から予測日まで{gap_days}日空いています。HorizonForecaster で予測してください"
+                )
+            recent = history.sort_values('date', kind='stable').tail(spec.history_rows)
+            values = {col: recent[col].to_numpy(dtype=np.float64) for col in spec.source_columns}
         else:
-            # デフォルト値
-            features['sales_ma7'] = 50000
-            features['customers_ma7'] = 50
-            features['prev_week_sales'] = 50000
-            features['prev_week_customers'] = 50
+            values = {col: np.empty(0) for col in spec.source_columns}
         
-        return pd.DataFrame([features])
+        for name, value in spec.next_row(values, HISTORY_DEFAULTS).items():
+            features[name] = np.float32(value)
+        return features
     
-    def _get_season(self, month: int) -> int:
-        """季節を数値に変換"""
-        if month in [3, 4, 5]:
-            return 0  # 春
-        elif month in [6, 7, 8]:
-            return 1  # 夏
-        elif month in [9, 10, 11]:
-            return 2  # 秋
-        else:
-            return 3  # 冬
+    def create_calendar_features(self, dates: pd.DatetimeIndex, weather_conditions: List[str]) -> pd.DataFrame:
+        """複数日分のカレンダー・天気特徴量を一括作成（履歴特徴量はNaN）"""
+        spec = self.feature_spec
+        weather_code = np.array([FORECAST_WEATHER_CODES.get(w, -1) for w in weather_conditions])
+        features = pd.DataFrame(spec.calendar_features(pd.Series(dates), self._holiday_flags(pd.Series(dates)), weather_code))
+        for feature in spec.history:
+            features[feature.name] = np.nan
+        return features[spec.columns].astype(spec.dtypes)
+    
+    def _holiday_flags(self, dates: pd.Series) -> np.ndarray:
+        """祝日フラグをベクトル演算で作成"""
+        years = dates.dt.year.unique().tolist()
+        holiday_dates = pd.to_datetime(list(holidays.Japan(years=years).keys()))
+        return dates.dt.normalize().isin(holiday_dates).astype(int).to_numpy()
     
     def get_basic_stats(self, df: pd.DataFrame) -> Dict[str, Any]:
         """基本統計情報"""
@@ -213,12 +274,11 @@ class DataProcessor:
         if self.processed_data is None:
             if self.data is None:
                 return {}
-            df = self.data.copy()
             # 必要な特徴量を追加
-            df['weekday'] = df['date'].dt.weekday
-            df['is_holiday'] = df['date'].apply(
-                lambda x: x.date() in self.jp_holidays
-            ).astype(int)
+            df = self.data.assign(
+                weekday=self.data['date'].dt.weekday,
+                is_holiday=self._holiday_flags(self.data['date'])
+            )
         else:
             df = self.processed_data
         
@@ -247,7 +307,7 @@ class DataProcessor:
             },
             'monthly_sales': df.groupby(df['date'].dt.month)['sales'].mean().to_dict(),
             'weekday_sales': df.groupby('weekday')['sales'].mean().to_dict(),
-            'weather_impact': df.groupby('weather')['sales'].mean().to_dict(),
+            'weather_impact': df.groupby('weather', observed=True)['sales'].mean().to_dict(),
             'holiday_impact': {
                 'holiday_avg': holiday_avg,
                 'regular_avg': regular_avg
@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from decouple import config
+from typing import Any, Dict, List
 import os
 
 # Railway PostgreSQLの環境変数を優先的に使用
@@ -18,10 +19,35 @@ else:
 if os.getenv('ENVIRONMENT') == 'development':
     DATABASE_URL = "sqlite:///./bakery_sales.db"
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+# 接続プール設定（同期・非同期エンジン共通）
+DB_POOL_SIZE = config('DB_POOL_SIZE', default=5, cast=int)
+DB_MAX_OVERFLOW = config('DB_MAX_OVERFLOW', default=10, cast=int)
+DB_POOL_PRE_PING = config('DB_POOL_PRE_PING', default=True, cast=bool)
+DB_POOL_RECYCLE = config('DB_POOL_RECYCLE', default=1800, cast=int)  # 秒（-1で無効）
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    """エンジン作成時のプール設定"""
+    options = {'pool_pre_ping': DB_POOL_PRE_PING, 'pool_recycle': DB_POOL_RECYCLE}
+    if url.startswith('sqlite'):
+        options['connect_args'] = {'check_same_thread': False}
+        # インメモリSQLiteは接続ごとに別DBになるためプールを使わない
+        if ':memory:' in url or url.rstrip('/').endswith(':'):
+            return options
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    return options
+
+def to_async_url(url: str) -> str:
+    """同期ドライバのURLを非同期ドライバ（asyncpg / aiosqlite）のURLに変換"""
+    for prefix in ('postgresql+psycopg2://', 'postgresql://', 'postgres://'):
+        if url.startswith(prefix):
+            return 'postgresql+asyncpg://' + url[len(prefix):]
+    if url.startswith('sqlite://'):
+        return 'sqlite+aiosqlite://' + url[len('sqlite://'):]
+    return url
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -35,6 +61,78 @@ def get_db():
     finally:
         db.close()
 
-def create_tables():
-    """テーブル作成"""
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+# 非同期エンジンはドライバ（asyncpg / aiosqlite）が必要なので初回利用時に作成
+_async_engine = None
+_async_session_factory = None
+
+def get_async_engine():
+    """非同期エンジン取得"""
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+    return _async_engine
+
+def AsyncSessionLocal():
+    """非同期セッション作成（コミット後も属性を読めるように expire_on_commit=False）"""
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        _async_session_factory = async_sessionmaker(
+            get_async_engine(), autoflush=False, expire_on_commit=False
+        )
+    return _async_session_factory()
+
+async def get_async_db():
+    """非同期データベースセッション取得（イベントループを止めずにクエリを実行）"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def dispose_async_engine():
+    """非同期エンジンの接続を閉じる（終了時）"""
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+def create_tables() -> List[str]:
+    """テーブル作成と、既存テーブルへの列・インデックスの追加（追加した内容を返す）"""
+    Base.metadata.create_all(bind=engine)
+    return migrate_schema()
+
+def migrate_schema(bind=None) -> List[str]:
+    """create_all は既存のテーブルを変更しないため、モデルに追加された列とインデックスを足す
+
+    追加できるのは NULL を許す列のみ（既存の行には NULL が入る）。
+    列の削除・型の変更は行わない。
+    """
+    from sqlalchemy import inspect
+    
+    applied = []
+    with (bind or engine).begin() as conn:
+        inspector = inspect(conn)
+        preparer = conn.dialect.identifier_preparer
+        existing_tables = set(inspector.get_table_names())
+        
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                if not column.nullable:
+                    raise Exception(
+                        f"データベース移行エラー: {table.name}.{column.name} はNULLを許さないため自動で追加できません"
+                    )
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=conn.dialect)}"
+                ))
+                applied.append(f"{table.name}.{column.name}")
+            
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn, checkfirst=True)
+                    applied.append(index.name)
+    return applied
\ No newline at end of file
@@ -0,0 +1,91 @@
+import hashlib
+import json
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .user_models import PredictionHistory, UserDataVersion, UserModel
+
+# ETag の元にするテナント（ユーザー）ごとのバージョン
+RESOURCES = ('data', 'model', 'predictions')
+
+# ブラウザには毎回ETagで再検証させる（ユーザーごとの内容なので共有キャッシュには置かない）
+CACHE_CONTROL = 'private, no-cache'
+
+def _version_statement(user_id: int, resources: Iterable[str]) -> Select:
+    """指定したリソースのバージョンを1回のクエリで取得する select()
+
+    データは UserDataVersion（削除後は1からやり直すので更新時刻も含める）、
+    モデルは再訓練ごとに作り直される UserModel の行、予測履歴は件数と最新の行を使う。
+    """
+    columns = []
+    for resource in resources:
+        if resource == 'data':
+            state = select(UserDataVersion).where(UserDataVersion.user_id == user_id).subquery()
+            columns += [select(state.c.version).scalar_subquery(), select(state.c.updated_at).scalar_subquery()]
+        elif resource == 'model':
+            model = select(func.max(UserModel.id).label('id'), func.max(UserModel.created_at).label('created_at'))\
+                .where(UserModel.user_id == user_id).subquery()
+            columns += [select(model.c.id).scalar_subquery(), select(model.c.created_at).scalar_subquery()]
+        elif resource == 'predictions':
+            history = select(
+                func.count().label('count'),
+                func.max(PredictionHistory.id).label('id'),
+                func.max(PredictionHistory.created_at).label('created_at')
+            ).where(PredictionHistory.user_id == user_id).subquery()
+            columns += [select(history.c[name]).scalar_subquery() for name in ('count', 'id', 'created_at')]
+        else:
+            raise ValueError(f"ETagのリソースは {', '.join(RESOURCES)} のいずれかを指定してください: {resource}")
+    return select(*columns)
+
+def _make_etag(scope: str, user_id: int, versions, request: Request) -> str:
+    """バージョンとクエリ文字列から強いETagを作る"""
+    key = json.dumps([scope, user_id, [str(value) for value in versions], request.url.query])
+    return '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+
+def tenant_etag(db: Session, request: Request, scope: str, user_id: int, resources: Iterable[str]) -> str:
+    """エンドポイント（scope）とテナントのバージョンからETagを作る"""
+    versions = db.execute(_version_statement(user_id, resources)).one()
+    return _make_etag(scope, user_id, versions, request)
+
+async def tenant_etag_async(db: AsyncSession, request: Request, scope: str, user_id: int,
+                            resources: Iterable[str]) -> str:
+    """tenant_etag の非同期セッション版"""
+    versions = (await db.execute(_version_statement(user_id, resources))).one()
+    return _make_etag(scope, user_id, versions, request)
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """圧縮した本文用のETag（エンコーディングごとにバイト列が違うので強いETagも分ける）"""
+    return etag if not encoding else f'{etag[:-1]}-{encoding}"'
+
+def matching_etag(request: Request, etag: str, encodings: Iterable[str] = ()) -> Optional[str]:
+    """If-None-Match のうちETag（または encodings で圧縮した本文のETag）に一致したもの（弱い比較）"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return None
+    if header.strip() == '*':
+        return etag
+    accepted = {etag, *(encoded_etag(etag, encoding) for encoding in encodings)}
+    for value in header.split(','):
+        value = value.strip().removeprefix('W/')
+        if value in accepted:
+            return value
+    return None
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match がETagと一致するか（If-None-Match は弱い比較）"""
+    return matching_etag(request, etag) is not None
+
+def set_etag(response: Response, etag: str):
+    """レスポンスにETagとキャッシュ方針を付与（圧縮済みの本文ならエンコーディングを付けたETag）"""
+    response.headers['ETag'] = encoded_etag(etag, response.headers.get('content-encoding'))
+    response.headers['Cache-Control'] = CACHE_CONTROL
+
+def not_modified(etag: str) -> Response:
+    """304 Not Modified（本文なし）"""
+    response = Response(status_code=304)
+    set_etag(response, etag)
+    return response
@@ -0,0 +1,214 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Any, Iterator, List, Optional, Sequence
+
+from sqlalchemy import select
+
+from .database import SessionLocal
+from .user_models import UserData, PredictionHistory
+
+# サーバーサイドカーソルから一度に取り出す行数
+EXPORT_CHUNK_SIZE = 5000
+
+# 出力形式 → (Content-Type, 拡張子)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow')
+}
+
+# エクスポート対象 → (モデル, カラム, 並び順)
+EXPORT_TABLES = {
+    'data': (
+        UserData,
+        ['store_id', 'store_name', 'date', 'weather', 'sales', 'target_achievement_rate',
+         'yoy_same_day_ratio', 'customers', 'avg_spending', 'labor_cost_rate', 'cost_rate'],
+        ['date', 'id']
+    ),
+    'predictions': (
+        PredictionHistory,
+        ['id', 'store_id', 'prediction_date', 'predicted_sales', 'predicted_customers',
+         'weather_condition', 'temperature', 'confidence_lower_sales', 'confidence_upper_sales',
+         'confidence_lower_customers', 'confidence_upper_customers', 'created_at'],
+        ['created_at', 'id']
+    )
+}
+
+class _ChunkSink:
+    """pyarrowの書き込み先：書かれたバイト列を溜め、チャンクごとに取り出す"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+class DataExporter:
+    """ユーザーデータ・予測履歴のストリーミングエクスポート"""
+
+    def __init__(self, user_id: int, table: str, export_format: str,
+                 start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 chunk_size: int = EXPORT_CHUNK_SIZE, session_factory=SessionLocal):
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"未対応のエクスポート対象です: {table}")
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"未対応の出力形式です: {export_format}")
+        if export_format in ('parquet', 'arrow'):
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ValueError(f"{export_format}形式の出力には pyarrow のインストールが必要です")
+
+        self.user_id = user_id
+        self.table = table
+        self.export_format = export_format
+        self.start = start
+        self.end = end
+        self.chunk_size = chunk_size
+        self.session_factory = session_factory
+        self.model, self.columns, self.order_by = EXPORT_TABLES[table]
+
+    @property
+    def media_type(self) -> str:
+        return EXPORT_FORMATS[self.export_format][0]
+
+    @property
+    def filename(self) -> str:
+        return f"{self.table}_{self.user_id}.{EXPORT_FORMATS[self.export_format][1]}"
+
+    def stream(self) -> Iterator[bytes]:
+        """選択した形式でチャンクごとにバイト列を生成"""
+        writer = {
+            'csv': self._stream_csv,
+            'ndjson': self._stream_ndjson,
+            'parquet': self._stream_parquet,
+            'arrow': self._stream_arrow
+        }[self.export_format]
+        return writer(self._iter_chunks())
+
+    def _iter_chunks(self) -> Iterator[Sequence[Any]]:
+        """サーバーサイドカーソルで行をチャンク単位に取得"""
+        # レスポンス送信中も使えるように独自のセッションを持つ
+        db = self.session_factory()
+        try:
+            # 並び順の先頭カラム（日付）で期間を絞り込む
+            date_column = getattr(self.model, self.order_by[0])
+            statement = select(*[getattr(self.model, c) for c in self.columns])\
+                .where(self.model.user_id == self.user_id)
+            if self.start:
+                statement = statement.where(date_column >= self.start)
+            if self.end:
+                statement = statement.where(date_column < self.end)
+            statement = statement\
+                .order_by(*[getattr(self.model, c) for c in self.order_by])\
+                .execution_options(yield_per=self.chunk_size)
+            result = db.execute(statement)
+            for partition in result.partitions():
+                yield partition
+        finally:
+            db.close()
+
+    def _stream_csv(self, chunks: Iterator[Sequence[Any]]) -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # Excelで文字化けしないようにBOMを付ける
+        buffer.write('\ufeff')
+        writer.writerow(self.columns)
+        for rows in chunks:
+            writer.writerows([_format_value(v) for v in row] for row in rows)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+    def _stream_ndjson(self, chunks: Iterator[Sequence[Any]]) -> Iterator[bytes]:
+        for rows in chunks:
+            lines = [
+                json.dumps(dict(zip(self.columns, row)), ensure_ascii=False, default=_format_value)
+                for row in rows
+            ]
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def _stream_parquet(self, chunks: Iterator[Sequence[Any]]) -> Iterator[bytes]:
+        import pyarrow.parquet as pq
+
+        sink = _ChunkSink()
+        writer = None
+        for rows in chunks:
+            batch = self._to_record_batch(rows)
+            if writer is None:
+                writer = pq.ParquetWriter(sink, batch.schema)
+            writer.write_batch(batch)
+            yield sink.drain()
+        if writer is None:
+            writer = pq.ParquetWriter(sink, self._to_record_batch([]).schema)
+        writer.close()
+        yield sink.drain()
+
+    def _stream_arrow(self, chunks: Iterator[Sequence[Any]]) -> Iterator[bytes]:
+        import pyarrow as pa
+
+        sink = _ChunkSink()
+        writer = None
+        for rows in chunks:
+            batch = self._to_record_batch(rows)
+            if writer is None:
+                writer = pa.ipc.new_stream(sink, batch.schema)
+            writer.write_batch(batch)
+            yield sink.drain()
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, self._to_record_batch([]).schema)
+        writer.close()
+        yield sink.drain()
+
+    def _to_record_batch(self, rows: Sequence[Any]):
+        """行のチャンクを列指向のRecordBatchに変換"""
+        import pyarrow as pa
+
+        columns = list(zip(*rows)) if rows else [[] for _ in self.columns]
+        return pa.RecordBatch.from_arrays(
+            [pa.array(values, type=self._arrow_type(name)) for name, values in zip(self.columns, columns)],
+            names=self.columns
+        )
+
+    def _arrow_type(self, column: str):
+        """SQLAlchemyの型からArrowの型を決める"""
+        import pyarrow as pa
+
+        python_type = getattr(self.model, column).type.python_type
+        if python_type is datetime:
+            return pa.timestamp('us')
+        if python_type is int:
+            return pa.int64()
+        if python_type is float:
+            return pa.float64()
+        return pa.string()
+
+def _format_value(value: Any) -> Any:
+    """CSV・JSON用に日付を文字列化"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
@@ -0,0 +1,64 @@
+"""大きな一覧・統計レスポンス用のJSON出力
+
+DBから読んだ行（検証済みのデータ）は行ごとのPydanticの検証を通さずに辞書にし、
+orjson でまとめてエンコードする。一定以上の大きさの本文はクライアントが受け付ければ gzip で返す。
+"""
+import gzip
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+from decouple import config
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# この大きさ（バイト）以上の本文を gzip で返す（0で圧縮しない）
+JSON_GZIP_MIN_BYTES = config('JSON_GZIP_MIN_BYTES', default=1024, cast=int)
+# 応答時間を優先して中程度の圧縮レベルにする
+JSON_GZIP_LEVEL = config('JSON_GZIP_LEVEL', default=5, cast=int)
+
+def rows_to_dicts(rows: Iterable[Any], keys: List[str]) -> List[Dict[str, Any]]:
+    """select(列, ...) の結果の行をそのまま辞書にする"""
+    return [dict(zip(keys, row)) for row in rows]
+
+def _normalize_keys(value: Any) -> Any:
+    """numpy の整数などのキーを Python の値に変換（pandas の集計結果の辞書用）"""
+    if isinstance(value, dict):
+        return {(key.item() if hasattr(key, 'item') else key): _normalize_keys(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize_keys(item) for item in value]
+    return value
+
+def dumps(content: Any) -> bytes:
+    """JSONにエンコード（orjson がなければ FastAPI の既定と同じ方法）"""
+    if orjson is None:
+        return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+    try:
+        return orjson.dumps(content, option=options)
+    except TypeError:
+        # orjson が扱えないキー（numpy の整数など）や値が含まれる場合
+        try:
+            return orjson.dumps(_normalize_keys(content), option=options)
+        except TypeError:
+            return orjson.dumps(jsonable_encoder(content), option=options)
+
+def json_response(request: Request, content: Any, status_code: int = 200,
+                  headers: Optional[Dict[str, str]] = None) -> Response:
+    """JSONのレスポンス（大きい本文はクライアントが受け付ければ gzip で返す）"""
+    from .static_assets import accepted_encodings
+
+    body = dumps(content)
+    headers = dict(headers or {})
+    if JSON_GZIP_MIN_BYTES:
+        headers['Vary'] = 'Accept-Encoding'
+        if len(body) >= JSON_GZIP_MIN_BYTES and 'gzip' in accepted_encodings(request.headers.get('accept-encoding', '')):
+            body = gzip.compress(body, compresslevel=JSON_GZIP_LEVEL, mtime=0)
+            headers['Content-Encoding'] = 'gzip'
+    return Response(content=body, status_code=status_code, media_type='application/json', headers=headers)
@@ -0,0 +1,255 @@
+"""特徴量の宣言的な定義（カレンダー項目・ラグ・移動集計）
+
+FeatureSpec に並べた特徴量を、店舗・日付順に並んだ連続した NumPy 配列から一度に計算する。
+移動平均・合計・標準偏差は累積和の差、最小・最大はストライド（sliding_window_view）の窓で求めるので、
+pandas のグループ処理のように特徴量ごとに走査とコピーが発生しない。
+学習用の行列（compute_history）と予測用の1行（next_row）は同じ計算を通るため定義がずれない。
+
+ラグ・窓は日数ではなく店舗内の行数で数え、当日の値は含めない（窓は前の行まで）。
+"""
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# 月（1〜12）→ 季節コード（0=春, 1=夏, 2=秋, 3=冬）
+SEASON_BY_MONTH = np.array([3, 3, 3, 0, 0, 0, 1, 1, 1, 2, 2, 2, 3])
+
+# カレンダー項目（weather_code は呼び出し側が天気の表記から変換して渡す）と型
+CALENDAR_DTYPES = {
+    'year': np.int16, 'month': np.int8, 'day': np.int8, 'weekday': np.int8,
+    'is_weekend': np.int8, 'is_holiday': np.int8, 'weather_code': np.int8, 'season': np.int8
+}
+CALENDAR_FIELDS = tuple(CALENDAR_DTYPES)
+
+# 履歴特徴量の元にできる列（スナップショット・特徴量ストアが保持し、複数日予測で予測値を書き足す列）
+SOURCE_COLUMNS = ('sales', 'customers')
+
+ROLLING_AGGREGATIONS = ('mean', 'sum', 'std', 'min', 'max')
+# 累積和から求める集計（残りはストライドの窓で求める）
+CUMULATIVE_AGGREGATIONS = ('mean', 'sum', 'std')
+
+# ストライドの窓を作るときの1回あたりの行数（窓の一時配列のメモリを抑える）
+WINDOW_CHUNK_ROWS = 65536
+
+class Lag:
+    """lag 行前の値（lag=7 で前週同曜日、lag=364 で前年同曜日）"""
+
+    def __init__(self, column: str, lag: int, name: Optional[str] = None):
+        if lag < 1:
+            raise ValueError(f"ラグは1以上を指定してください: {lag}")
+        self.column = column
+        self.lag = lag
+        self.name = name or f"{column}_lag{lag}"
+        self.history_rows = lag
+
+    def __repr__(self):
+        return f"Lag({self.column!r}, {self.lag}, name={self.name!r})"
+
+class Rolling:
+    """直前 window 行の集計（1行でもあれば計算し、標準偏差は2行以上）"""
+
+    def __init__(self, column: str, window: int, agg: str = 'mean', name: Optional[str] = None):
+        if window < 1:
+            raise ValueError(f"窓の行数は1以上を指定してください: {window}")
+        if agg not in ROLLING_AGGREGATIONS:
+            raise ValueError(f"集計は {', '.join(ROLLING_AGGREGATIONS)} のいずれかを指定してください: {agg}")
+        self.column = column
+        self.window = window
+        self.agg = agg
+        self.name = name or f"{column}_{agg}{window}"
+        self.history_rows = window
+
+    def __repr__(self):
+        return f"Rolling({self.column!r}, {self.window}, {self.agg!r}, name={self.name!r})"
+
+def group_starts(keys: np.ndarray) -> np.ndarray:
+    """並べ替え済みのキー（店舗コードなど）から、各行が属するグループの先頭行の位置"""
+    n = len(keys)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    is_start = np.empty(n, dtype=bool)
+    is_start[0] = True
+    is_start[1:] = keys[1:] != keys[:-1]
+    starts = np.flatnonzero(is_start)
+    return starts[np.cumsum(is_start) - 1]
+
+def bfill_within_groups(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """欠損を同じグループ内の後ろの値で補完（グループをまたがない）"""
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+    n = len(values)
+    # 各行以降で最初に値がある行
+    next_valid = np.where(missing, n, np.arange(n))
+    next_valid = np.minimum.accumulate(next_valid[::-1])[::-1]
+    found = next_valid < n
+    source = np.minimum(next_valid, n - 1)
+    same_group = found & (starts[source] == starts)
+    return np.where(missing & same_group, values[source], values)
+
+class FeatureSpec:
+    """モデルに渡す特徴量の列（カレンダー項目 → 履歴特徴量の順）"""
+
+    def __init__(self, calendar: Sequence[str] = CALENDAR_FIELDS, history: Iterable = ()):
+        unknown = [field for field in calendar if field not in CALENDAR_DTYPES]
+        if unknown:
+            raise ValueError(f"未対応のカレンダー項目です: {', '.join(unknown)}")
+        self.calendar = tuple(calendar)
+        self.history = tuple(history)
+        for feature in self.history:
+            if feature.column not in SOURCE_COLUMNS:
+                raise ValueError(f"履歴特徴量の元の列は {', '.join(SOURCE_COLUMNS)} のいずれかを指定してください: {feature.column}")
+
+        self.columns: List[str] = list(self.calendar) + [feature.name for feature in self.history]
+        if len(set(self.columns)) != len(self.columns):
+            raise ValueError("特徴量の名前が重複しています")
+        self.source_columns = [col for col in SOURCE_COLUMNS if any(f.column == col for f in self.history)]
+        # 履歴特徴量の計算に必要な直近の行数
+        self.history_rows = max([feature.history_rows for feature in self.history] + [0])
+        self.dtypes = {
+            **{field: CALENDAR_DTYPES[field] for field in self.calendar},
+            **{feature.name: np.float32 for feature in self.history}
+        }
+        # 保存済みの特徴量・モデルと定義が同じかの判定に使う
+        self.key = repr((self.calendar, self.history))
+
+    def calendar_features(self, dates: pd.Series, is_holiday: np.ndarray,
+                          weather_code: np.ndarray) -> Dict[str, np.ndarray]:
+        """カレンダー項目（weather_code は欠損を含み得るので変換前の値のまま返す）"""
+        dt = pd.Series(dates).dt
+        month = dt.month.to_numpy()
+        weekday = dt.weekday.to_numpy()
+        values = {
+            'year': dt.year.to_numpy(),
+            'month': month,
+            'day': dt.day.to_numpy(),
+            'weekday': weekday,  # 0=月曜日
+            'is_weekend': weekday >= 5,
+            'is_holiday': np.asarray(is_holiday),
+            'weather_code': np.asarray(weather_code),
+            'season': SEASON_BY_MONTH[month]
+        }
+        return {
+            field: values[field] if field == 'weather_code' else values[field].astype(CALENDAR_DTYPES[field])
+            for field in self.calendar
+        }
+
+    def compute_history(self, values: Dict[str, np.ndarray], starts: np.ndarray) -> Dict[str, np.ndarray]:
+        """店舗・日付順に並んだ値から全ての履歴特徴量を一度に計算（履歴が足りない行は NaN）
+
+        values は元の列ごとの配列、starts は各行が属する店舗の先頭行の位置（group_starts）。
+        """
+        n = len(starts)
+        # 元の列を1つの連続した配列にまとめる（行 = 元の列）
+        source = np.empty((len(self.source_columns), n), dtype=np.float64)
+        for row, col in enumerate(self.source_columns):
+            source[row] = values[col]
+        source_row = {col: row for row, col in enumerate(self.source_columns)}
+
+        positions = np.arange(n)
+        # 店舗内で当日より前にある行数
+        rows_before = positions - starts
+
+        cumulative = None
+        rolling_aggs = {f.agg for f in self.history if isinstance(f, Rolling)}
+        if rolling_aggs & set(CUMULATIVE_AGGREGATIONS):
+            # 先頭に0を置いた累積和（[a, b) の合計が cum[b] - cum[a]）。欠損は件数から除く
+            present = ~np.isnan(source)
+            filled = np.where(present, source, 0.0)
+            sums = [filled, present]
+            if 'std' in rolling_aggs:
+                # 二乗和は桁落ちを抑えるため列の平均を引いた値で取る（分散は平行移動で変わらない）
+                counts = np.maximum(present.sum(axis=1, keepdims=True), 1)
+                centered = np.where(present, source - filled.sum(axis=1, keepdims=True) / counts, 0.0)
+                sums += [centered, centered * centered]
+            cumulative = np.zeros((len(sums), len(self.source_columns), n + 1))
+            for k, values in enumerate(sums):
+                np.cumsum(values, axis=1, out=cumulative[k, :, 1:])
+
+        result = {}
+        for feature in self.history:
+            series = source[source_row[feature.column]]
+            if isinstance(feature, Lag):
+                output = np.full(n, np.nan)
+                if feature.lag < n:
+                    output[feature.lag:] = series[:-feature.lag]
+                output[rows_before < feature.lag] = np.nan
+            elif feature.agg in CUMULATIVE_AGGREGATIONS:
+                window_start = np.maximum(positions - feature.window, starts)
+                # cum[:n] は各行の直前までの累積（positions で引くのと同じ）
+                window_sum = lambda k: cumulative[k, source_row[feature.column], :n] \
+                    - cumulative[k, source_row[feature.column]][window_start]
+                count = window_sum(1)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    if feature.agg == 'mean':
+                        output = window_sum(0) / count
+                    elif feature.agg == 'sum':
+                        output = window_sum(0)
+                    else:
+                        # 不偏分散 = (Σd² - (Σd)² / n) / (n - 1)（丸め誤差で負にならないよう0で切る）
+                        centered_sum = window_sum(2)
+                        output = np.sqrt(np.maximum(window_sum(3) - centered_sum * centered_sum / count, 0.0) / (count - 1))
+                        output[count < 2] = np.nan
+                output[count == 0] = np.nan
+            else:
+                output = self._window_aggregate(series, feature.window, feature.agg, rows_before)
+            result[feature.name] = output
+        return result
+
+    def _window_aggregate(self, series: np.ndarray, window: int, agg: str, rows_before: np.ndarray) -> np.ndarray:
+        """直前 window 行の最小・最大（窓はコピーせずストライドで作る）"""
+        n = len(series)
+        # 欠損と窓の外は結果に影響しない値（最小なら +inf、最大なら -inf）に置き換える
+        sentinel = np.inf if agg == 'min' else -np.inf
+        reducer = np.min if agg == 'min' else np.max
+        padded = np.concatenate([np.full(window, sentinel), np.where(np.isnan(series), sentinel, series)])
+        # windows[i] は series[i - window : i]（当日を含まない直前の行）
+        windows = np.lib.stride_tricks.sliding_window_view(padded, window)[:n]
+
+        output = np.empty(n)
+        for lo in range(0, n, WINDOW_CHUNK_ROWS):
+            hi = min(lo + WINDOW_CHUNK_ROWS, n)
+            output[lo:hi] = reducer(windows[lo:hi], axis=1)
+
+        # 他の店舗の行が窓に入る行（店舗の先頭の window 行）だけコピーして除き、集計し直す
+        boundary = np.flatnonzero(rows_before < window)
+        if len(boundary) > 0:
+            chunk = windows[boundary].copy()
+            chunk[np.arange(window)[None, :] < (window - rows_before[boundary])[:, None]] = sentinel
+            output[boundary] = reducer(chunk, axis=1)
+        output[np.isinf(output)] = np.nan
+        return output
+
+    def fill_history(self, features: Dict[str, np.ndarray], starts: np.ndarray) -> Dict[str, np.ndarray]:
+        """学習用：店舗の先頭など履歴が足りない行を同じ店舗の後ろの値で補完"""
+        return {name: bfill_within_groups(values, starts) for name, values in features.items()}
+
+    def next_row(self, history: Dict[str, np.ndarray], defaults: Dict[str, float]) -> Dict[str, float]:
+        """予測用：日付順の直近の値（1店舗分）から次の行の履歴特徴量を計算
+
+        学習と同じ compute_history で計算し、履歴が足りない項目は履歴の平均
+        （標準偏差は0、履歴がなければ defaults）で補う。
+        """
+        length = min(len(history[col]) for col in self.source_columns) if self.source_columns else 0
+        # 必要な直近の行だけを使い、末尾に予測する行（値は未知）を足す
+        used = min(length, self.history_rows)
+        values = {
+            col: np.append(np.asarray(history[col][length - used:length], dtype=np.float64), np.nan)
+            for col in self.source_columns
+        }
+        computed = self.compute_history(values, np.zeros(used + 1, dtype=np.int64))
+
+        row = {}
+        for feature in self.history:
+            value = computed[feature.name][-1]
+            if np.isnan(value):
+                past = np.asarray(history[feature.column][:length], dtype=np.float64)
+                if isinstance(feature, Rolling) and feature.agg == 'std':
+                    value = 0.0
+                elif len(past) > 0 and not np.isnan(past).all():
+                    value = float(np.nanmean(past))
+                else:
+                    value = float(defaults[feature.column])
+            row[feature.name] = float(value)
+        return row
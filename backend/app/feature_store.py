@@ -0,0 +1,195 @@
+import pandas as pd
+import numpy as np
+import os
+import pickle
+import uuid
+from typing import Tuple, Dict, Any, Optional
+
+from .data_processor import DataProcessor, FEATURE_COLUMNS, FEATURE_SPEC, compact_dtypes
+
+# ラグ・移動集計の計算に必要な直近行数
+TAIL_ROWS = max(FEATURE_SPEC.history_rows, 1)
+
+# 特徴量計算に使う生データのカラム
+RAW_COLUMNS = ['store_id', 'date', 'weather', 'sales', 'customers']
+
+class FeatureStore:
+    """ユーザーごとの特徴量ストア（新しい日付の行だけを追記する）"""
+
+    def __init__(self, user_id: int, base_dir: str = "models/users"):
+        self.user_id = user_id
+        self.path = os.path.join(base_dir, str(user_id), "feature_store.pkl")
+        self._state = None
+
+    def exists(self) -> bool:
+        """特徴量ストアが保存済みかチェック"""
+        return os.path.exists(self.path)
+
+    def load(self) -> Optional[pd.DataFrame]:
+        """保存済みの特徴量行を読み込み"""
+        state = self._load_state()
+        return state['features'] if state else None
+
+    def get_training_data(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """学習用の特徴量とターゲットを取得"""
+        features = self.load()
+        if features is None:
+            raise Exception("特徴量ストアがありません")
+        return features[FEATURE_COLUMNS], features[['sales', 'customers']]
+
+    def sync(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """生データと同期（新しい日付だけ追記し、過去が変わっていれば再構築）"""
+        raw = self._normalize(df)
+        state = self._load_state()
+
+        if state is None or state.get('feature_spec') != FEATURE_SPEC.key \
+                or not self._history_unchanged(raw, state['fingerprint']):
+            return self.rebuild(raw)
+
+        last_dates = _last_dates_by_row(raw['store_id'], state['fingerprint'])
+        # 未知の店舗（NaT）は比較が偽になるので全行が新規扱いになる
+        new_rows = raw[~(raw['date'].to_numpy() <= last_dates)]
+
+        if len(new_rows) == 0:
+            return {'mode': 'unchanged', 'appended_rows': 0, 'total_rows': len(state['features'])}
+
+        return self.append(new_rows)
+
+    def append(self, new_rows: pd.DataFrame) -> Dict[str, Any]:
+        """新しい日付の行を直近の状態から計算して追記"""
+        state = self._load_state()
+        new_rows = self._normalize(new_rows)
+        if state is None:
+            return self.rebuild(new_rows)
+        if state.get('feature_spec') != FEATURE_SPEC.key:
+            # 特徴量の定義が変わっていれば保存済みの行も作り直す
+            return self.rebuild(pd.concat([state['features'][RAW_COLUMNS], new_rows], ignore_index=True))
+
+        stored = state['features']
+        fingerprint = state['fingerprint']
+
+        # 履歴が TAIL_ROWS 行未満の店舗は履歴特徴量を店舗内で後方補完するため全体を再構築する
+        short_history = [
+            store_id for store_id in new_rows['store_id'].unique()
+            if store_id in fingerprint and fingerprint[store_id]['count'] < TAIL_ROWS
+        ]
+        if short_history:
+            return self.rebuild(pd.concat([stored[RAW_COLUMNS], new_rows], ignore_index=True))
+
+        # 直近の状態（店舗ごとの末尾 TAIL_ROWS 行）と新規行だけで特徴量を計算
+        tail = stored[stored['store_id'].isin(new_rows['store_id'].unique())]\
+            .groupby('store_id', sort=False, observed=True).tail(TAIL_ROWS)[RAW_COLUMNS]
+        window = pd.concat([tail.assign(_is_new=False), new_rows.assign(_is_new=True)], ignore_index=True)
+
+        processor = DataProcessor()
+        processor.create_features(window.drop(columns='_is_new'))
+        window_features = processor.processed_data
+        appended = window_features[window['_is_new'].loc[window_features.index].to_numpy()]
+
+        # 既存の末尾より後の日付だけなら並べ替えずに連結する（カテゴリが変わる場合に備えて型を揃え直す）
+        features = compact_dtypes(pd.concat([stored, appended], ignore_index=True))
+        if appended['date'].min() < stored['date'].max():
+            features = features.sort_values(['date', 'store_id'], kind='stable', ignore_index=True)
+
+        self._save(features, self._update_fingerprint(fingerprint, new_rows))
+        return {'mode': 'append', 'appended_rows': len(appended), 'total_rows': len(features)}
+
+    def rebuild(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """全履歴から特徴量を作り直す"""
+        raw = self._normalize(df)
+        processor = DataProcessor()
+        processor.create_features(raw)
+        features = processor.processed_data.reset_index(drop=True)
+
+        self._save(features, self._update_fingerprint({}, raw))
+        return {'mode': 'rebuild', 'appended_rows': len(features), 'total_rows': len(features)}
+
+    def clear(self):
+        """特徴量ストアを削除"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._state = None
+
+    def _normalize(self, df: pd.DataFrame) -> pd.DataFrame:
+        """特徴量計算に必要なカラムだけを共通の省メモリ型で取り出す"""
+        store_ids = df['store_id'] if 'store_id' in df.columns else pd.Series('default', index=df.index)
+        if not isinstance(store_ids.dtype, pd.CategoricalDtype):
+            store_ids = store_ids.astype(str)
+        weather = df['weather']
+        if not isinstance(weather.dtype, pd.CategoricalDtype):
+            weather = weather.astype(str)
+        
+        raw = pd.DataFrame({
+            'store_id': store_ids,
+            'date': pd.to_datetime(df['date']),
+            'weather': weather,
+            'sales': df['sales'],
+            'customers': df['customers']
+        }, index=df.index)
+        return compact_dtypes(raw)
+
+    def _history_unchanged(self, raw: pd.DataFrame, fingerprint: Dict[str, Dict[str, Any]]) -> bool:
+        """保存済みの期間の生データが変わっていないかを件数と行ハッシュで判定"""
+        last_dates = _last_dates_by_row(raw['store_id'], fingerprint)
+        current = self._summarize(raw[raw['date'].to_numpy() <= last_dates])
+
+        if set(current.index) != set(fingerprint.keys()):
+            return False
+
+        for store_id, row in current.iterrows():
+            fp = fingerprint[store_id]
+            if row['count'] != fp['count'] or int(row['row_hash']) != fp['row_hash']:
+                return False
+        return True
+
+    def _summarize(self, rows: pd.DataFrame) -> pd.DataFrame:
+        """店舗ごとの最終日・件数・行ハッシュの合計（順序に依存しない）"""
+        # CSV由来とDB由来で型が異なってもハッシュが一致するように数値は float64 で計算する
+        # （カテゴリ型のハッシュは元の文字列と同じ値になる）
+        hashed = rows[RAW_COLUMNS].astype({'sales': np.float64, 'customers': np.float64})
+        row_hashes = pd.util.hash_pandas_object(hashed, index=False).to_numpy()
+        return rows.assign(_row_hash=row_hashes).groupby('store_id', observed=True).agg(
+            last_date=('date', 'max'), count=('sales', 'size'),
+            row_hash=('_row_hash', lambda h: int(np.sum(h.to_numpy(), dtype=np.uint64)))
+        )
+
+    def _update_fingerprint(self, fingerprint: Dict[str, Dict[str, Any]], rows: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+        """店舗ごとの最終日・件数・行ハッシュを更新"""
+        updated = {store_id: dict(fp) for store_id, fp in fingerprint.items()}
+
+        for store_id, row in self._summarize(rows).iterrows():
+            fp = updated.setdefault(store_id, {'count': 0, 'row_hash': 0})
+            fp['last_date'] = max(row['last_date'], fp.get('last_date', row['last_date']))
+            fp['count'] += int(row['count'])
+            fp['row_hash'] = (fp['row_hash'] + int(row['row_hash'])) % (1 << 64)
+        return updated
+
+    def _load_state(self) -> Optional[Dict[str, Any]]:
+        """保存ファイルを読み込み（インスタンス内でキャッシュ）"""
+        if self._state is None and os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                self._state = pickle.load(f)
+        return self._state
+
+    def _save(self, features: pd.DataFrame, fingerprint: Dict[str, Dict[str, Any]]):
+        """一時ファイルに書いてから置き換える（再訓練プロセスと同時に書いても混ざらないよう書き手ごとの名前）"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        state = {'features': features, 'fingerprint': fingerprint, 'feature_spec': FEATURE_SPEC.key}
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._state = state
+
+def _last_dates_by_row(store_ids: pd.Series, fingerprint: Dict[str, Dict[str, Any]]) -> np.ndarray:
+    """店舗ごとの保存済み最終日を各行に展開（カテゴリコード経由、未知の店舗はNaT）"""
+    last_dates = pd.Series(
+        {store_id: fp['last_date'] for store_id, fp in fingerprint.items()}, dtype='datetime64[ns]'
+    )
+    categories = store_ids.cat.categories
+    return last_dates.reindex(categories).to_numpy()[store_ids.cat.codes.to_numpy()]
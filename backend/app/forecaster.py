@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+from typing import Dict, Any, List, Optional
+
+from .data_processor import DataProcessor, HISTORY_DEFAULTS
+from .models import SalesPredictionModel
+
+# 予測できる最大日数
+MAX_HORIZON_DAYS = 14
+
+# データの最終日の翌日から予測開始日の前日までを予測値で埋めてよい最大日数
+MAX_GAP_DAYS = 31
+
+class ForecastGapError(Exception):
+    """データの最終日から予測開始日までが離れすぎている"""
+
+class HorizonForecaster:
+    """複数日の再帰予測（前日までの予測値を翌日の履歴特徴量に反映する）"""
+
+    def __init__(self, model: SalesPredictionModel):
+        self.model = model
+
+    def forecast(self, history: Optional[pd.DataFrame], start_date: date, days: int,
+                 weather_by_date: Dict[str, str]) -> List[Dict[str, Any]]:
+        """start_date から days 日分を予測
+
+        ラグ・移動集計が正しい日付を指すよう、データの最終日の翌日から予測を始め、
+        start_date の前日までの予測値も履歴として使う（返すのは start_date 以降のみ）。
+        start_date 以降の実績は使わない。
+        """
+        if not 1 <= days <= MAX_HORIZON_DAYS:
+            raise Exception(f"予測日数は1〜{MAX_HORIZON_DAYS}日で指定してください")
+
+        start = pd.Timestamp(start_date)
+        gap_days = 0
+        if history is not None and len(history) > 0:
+            history = history[history['date'] < start]
+            if len(history) > 0:
+                gap_days = (start - history['date'].max().normalize()).days - 1
+        if gap_days > MAX_GAP_DAYS:
+            raise ForecastGapError(
+                f"データの最終日から予測開始日まで{gap_days}日空いています（{MAX_GAP_DAYS}日まで）。"
+                f"最新のデータをアップロードしてください"
+            )
+
+        dates = pd.date_range(start - pd.Timedelta(days=gap_days), periods=gap_days + days, freq='D')
+        weathers = [weather_by_date.get(d.strftime('%Y-%m-%d'), '不明') for d in dates]
+
+        # カレンダー・天気特徴量は全日分を一度に作成
+        processor = DataProcessor()
+        spec = processor.feature_spec
+        features = processor.create_calendar_features(dates, weathers)
+        X = features[self.model.feature_columns].to_numpy(dtype=np.float64)
+        col = {name: i for i, name in enumerate(self.model.feature_columns)}
+
+        # 直近の実績＋予測日数分の配列を確保し、予測値を末尾に書き足していく
+        recent = self._recent_history(history, spec.history_rows)
+        length = len(recent)
+        sales = np.empty(length + len(dates))
+        customers = np.empty(length + len(dates))
+        sales[:length] = recent['sales'].to_numpy(dtype=np.float64)
+        customers[:length] = recent['customers'].to_numpy(dtype=np.float64)
+
+        for t in range(len(dates)):
+            # 学習と同じ定義で、前日までの実績・予測値から履歴特徴量を計算
+            row = spec.next_row({'sales': sales[:length + t], 'customers': customers[:length + t]},
+                                HISTORY_DEFAULTS)
+            for name, value in row.items():
+                X[t, col[name]] = value
+
+            sales_pred, customers_pred = self.model.predict_arrays(X[t:t + 1])
+            sales[length + t] = sales_pred[0]
+            customers[length + t] = customers_pred[0]
+
+        # 予測開始日より前の穴埋め分は返さない
+        sales_preds = sales[length + gap_days:]
+        customers_preds = customers[length + gap_days:]
+        dates, weathers = dates[gap_days:], weathers[gap_days:]
+
+        # 信頼区間は特徴量が確定した後にまとめて計算
+        intervals = self.model.predict_intervals(X[gap_days:], sales_preds, customers_preds)
+
+        return [
+            {
+                'date': d.strftime('%Y-%m-%d'),
+                'predicted_sales': float(sales_preds[i]),
+                'predicted_customers': int(customers_preds[i]),
+                'weather': weathers[i],
+                'confidence_interval': {key: float(values[i]) for key, values in intervals.items()}
+            }
+            for i, d in enumerate(dates)
+        ]
+
+    def _recent_history(self, history: Optional[pd.DataFrame], rows: int) -> pd.DataFrame:
+        """履歴特徴量の計算に必要な直近の実績（日付順）"""
+        if history is None or len(history) == 0 or rows == 0:
+            return pd.DataFrame({'sales': [], 'customers': []})
+        return history.sort_values('date', kind='stable').tail(rows)
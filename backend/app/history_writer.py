@@ -0,0 +1,133 @@
+import asyncio
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from decouple import config
+from sqlalchemy import insert
+
+from .database import SessionLocal
+from .user_models import PredictionHistory
+
+# まとめて書き込む行数・間隔とキューの上限
+HISTORY_FLUSH_ROWS = config('HISTORY_FLUSH_ROWS', default=100, cast=int)
+HISTORY_FLUSH_INTERVAL_MS = config('HISTORY_FLUSH_INTERVAL_MS', default=200, cast=int)
+HISTORY_QUEUE_SIZE = config('HISTORY_QUEUE_SIZE', default=10000, cast=int)
+# キューが満杯のときに空きを待つ最大時間（過ぎたら行を捨てる）
+HISTORY_ENQUEUE_TIMEOUT_MS = config('HISTORY_ENQUEUE_TIMEOUT_MS', default=500, cast=int)
+
+# 書き込み失敗時の再試行回数
+MAX_FLUSH_RETRIES = 3
+
+class PredictionHistoryWriter:
+    """予測履歴の遅延一括書き込み（N行ごと、またはT ミリ秒ごとにフラッシュ）"""
+
+    def __init__(self, session_factory=SessionLocal, batch_size: int = HISTORY_FLUSH_ROWS,
+                 flush_interval_ms: int = HISTORY_FLUSH_INTERVAL_MS, max_queue_size: int = HISTORY_QUEUE_SIZE,
+                 enqueue_timeout_ms: int = HISTORY_ENQUEUE_TIMEOUT_MS):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        # 上限付きキュー：DBが遅いときは投入側を少しだけ待たせ、それでも空かなければ捨てる
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue_size)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.written_rows = 0
+        self.failed_rows = 0
+        self.dropped_rows = 0
+        self.unflushed_rows = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """書き込みスレッド開始"""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="prediction-history-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 10.0):
+        """キューに残った行を書き込んでから停止（timeout までに書けなかった行は記録して諦める）"""
+        if not self.is_running:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # デーモンスレッドなのでプロセス終了時に残りの行は失われる
+            left = self._queue.qsize()
+            self.unflushed_rows += left
+            print(f"予測履歴の書き込みが{timeout}秒以内に終わりませんでした（未書き込み{left}件＋書き込み中の行）")
+        self._thread = None
+
+    async def submit(self, row: Dict[str, Any]):
+        """予測履歴1行を投入（キューが満杯なら enqueue_timeout まで空きを待ち、空かなければ捨てる）"""
+        # 作成日時はフラッシュ時ではなく予測時点の値にする
+        row.setdefault('created_at', datetime.now(timezone.utc))
+
+        if not self.is_running:
+            # 書き込みスレッドがない環境（スクリプト・停止後）では1行ずつ書き込む（再試行の待ちでループを止めない）
+            await asyncio.to_thread(self._write_batch, [row])
+            return
+
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # 共有スレッドプールのスレッドを待ち続けで占有しないよう、待つ時間に上限を設ける
+            try:
+                await asyncio.to_thread(self._queue.put, row, True, self.enqueue_timeout)
+            except queue.Full:
+                self.dropped_rows += 1
+                if self.dropped_rows % 100 == 1:
+                    print(f"予測履歴のキューが満杯のため行を破棄しました（累計{self.dropped_rows}件）")
+
+    def _run(self):
+        """行を集めて件数または時間で一括書き込み"""
+        while not (self._stop_event.is_set() and self._queue.empty()):
+            batch = self._collect_batch()
+            if batch:
+                self._write_batch(batch)
+
+    def _collect_batch(self) -> List[Dict[str, Any]]:
+        """最初の1行から flush_interval 以内に届いた行を最大 batch_size 件集める"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        """1トランザクションで一括INSERT"""
+        for attempt in range(1, MAX_FLUSH_RETRIES + 1):
+            db = self.session_factory()
+            try:
+                db.execute(insert(PredictionHistory), batch)
+                db.commit()
+                self.written_rows += len(batch)
+                return
+            except Exception as e:
+                db.rollback()
+                print(f"予測履歴書き込みエラー（{attempt}/{MAX_FLUSH_RETRIES}回目）: {e}")
+                time.sleep(0.1 * attempt)
+            finally:
+                db.close()
+
+        self.failed_rows += len(batch)
+
+# アプリ全体で共有する書き込みキュー
+prediction_history_writer = PredictionHistoryWriter()
@@ -1,25 +1,31 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, date
-import pandas as pd
-import numpy as np
+import asyncio
 import pickle
 import os
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from .models import SalesPredictionModel
-from .data_processor import DataProcessor
+# pandas / scikit-learn を使うモジュールは起動を速くするため使う時点で読み込む
+# （起動後は warmup がバックグラウンドで先読みする）
+from .prediction_cache import prediction_cache
+from .history_writer import prediction_history_writer
+from .warmup import ml_warmup
+from .memory_monitor import memory_monitor, MemoryLimitExceeded
+from .etag import etag_matches, matching_etag, not_modified, set_etag, tenant_etag
+from .static_assets import IndexPage, PrecompressedStaticFiles
+from .fast_json import json_response
 from .weather_service import WeatherService
-from .database import get_db, create_tables
+from .database import get_db, get_async_db, create_tables, dispose_async_engine
 from .auth import get_current_active_user
 from .user_models import User, PredictionHistory
-from .user_data_processor import UserDataProcessor
 from .user_routes import router as auth_router, user_router
-from .schemas import UserPredictionRequest
+from .schemas import UserPredictionRequest, HorizonPredictionRequest
 
 app = FastAPI(
     title="パン屋売上予測API",
@@ -74,20 +80,23 @@ for index_file in potential_index_files:
 if not simple_html_mode:
     # 静的ファイルをルートパスで配信（CSSとJSファイルを正しく読み込むため）
     # Reactビルドでは static/static/css と static/static/js の構造になる
+    # 圧縮版（python -m app.static_assets static で作成）があれば Accept-Encoding に応じて返す
     static_dir = os.path.join(react_build_dir, "static")
     if os.path.exists(static_dir):
-        app.mount("/static", StaticFiles(directory=static_dir), name="static")
+        app.mount("/static", PrecompressedStaticFiles(directory=static_dir), name="static")
+    # SPAの各ページで返す index.html はメモリに保持する
+    index_page = IndexPage(os.path.join(react_build_dir, "index.html"))
     print(f"✅ Reactアプリを配信: {react_build_dir}")
 else:
     print("⚠️ Reactアプリが見つかりません。シンプル版で起動します。")
 
 @app.get("/", include_in_schema=False)
-async def serve_frontend():
+async def serve_frontend(request: Request):
     """フロントエンドページを配信"""
     
     if not simple_html_mode:
         # Reactアプリを配信
-        return FileResponse(os.path.join(react_build_dir, "index.html"))
+        return index_page.response(request)
     
     # シンプルHTML版を配信
     html_content = """
@@ -237,22 +246,7 @@ async def manifest():
             return FileResponse(manifest_path)
     raise HTTPException(status_code=404, detail="Not Found")
 
-@app.get("/{path:path}", include_in_schema=False)
-async def serve_frontend_routes(path: str):
-    """React Router対応"""
-    # API、docs、redocパスはスキップ
-    if path.startswith("api/") or path.startswith("docs") or path.startswith("redoc"):
-        raise HTTPException(status_code=404, detail="Not Found")
-    
-    if not simple_html_mode:
-        # Reactアプリの場合、SPAルーティング対応
-        return FileResponse(os.path.join(react_build_dir, "index.html"))
-    else:
-        # シンプル版の場合はルートにリダイレクト
-        raise HTTPException(status_code=404, detail="Page not found")
-
 # グローバル変数
-data_processor = DataProcessor()
 weather_service = WeatherService()
 prediction_model = None
 
@@ -262,10 +256,19 @@ class PredictionRequest(BaseModel):
 
 class PredictionResponse(BaseModel):
     date: str
+    store_id: Optional[str] = None
     predicted_sales: float
     predicted_customers: int
     weather_forecast: dict
     confidence_interval: dict
+    cached: bool = False  # 予測キャッシュから返した場合True
+
+class HorizonPredictionResponse(BaseModel):
+    start_date: str
+    days: int
+    store_id: Optional[str] = None
+    forecasts: List[dict]
+    weather_forecast: dict
 
 @app.on_event("startup")
 async def startup_event():
@@ -273,8 +276,16 @@ async def startup_event():
     global prediction_model
     
     # データベースの初期化
-    create_tables()
+    migrated = create_tables()
     print("データベーステーブルを初期化しました")
+    if migrated:
+        print(f"既存のテーブルに列・インデックスを追加しました: {', '.join(migrated)}")
+    
+    # 予測履歴の書き込みキューを開始
+    prediction_history_writer.start()
+    
+    # ポートの待受開始後に機械学習スタックを裏で読み込む
+    ml_warmup.schedule()
     
     # 学習済みモデルの読み込み（存在する場合）
     model_path = "models/trained/sales_model.pkl"
@@ -286,11 +297,43 @@ async def startup_event():
         except Exception as e:
             print(f"モデル読み込みエラー: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """アプリケーション終了時の後処理"""
+    # 未書き込みの予測履歴をフラッシュ
+    prediction_history_writer.stop()
+    
+    # 非同期エンジンの接続を閉じる
+    await dispose_async_engine()
+
 @app.get("/api/health")
 async def health_check():
     """ヘルスチェック"""
     return {"message": "パン屋売上予測APIが稼働中です"}
 
+@app.get("/api/ready")
+async def readiness_check(db: AsyncSession = Depends(get_async_db)):
+    """レディネスチェック（DB接続と機械学習スタックの読み込み状況）"""
+    try:
+        await db.execute(text("SELECT 1"))
+        database_ok = True
+    except Exception:
+        database_ok = False
+    
+    ml_status = ml_warmup.status()
+    # ウォームアップ無効時は初回リクエストで読み込むので待たない
+    ready = database_ok and ml_status['error'] is None and (ml_status['warmed'] or not ml_status['enabled'])
+    
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "database": database_ok, "ml": ml_status}
+    )
+
+@app.get("/api/debug/memory")
+async def memory_status(current_user: User = Depends(get_current_active_user)):
+    """段階ごとのメモリのピーク・増分（MEMORY_TRACKING が off の場合は記録なし）"""
+    return memory_monitor.status(current_user.id)
+
 @app.post("/api/upload-data")
 async def upload_data(
     file: UploadFile = File(...),
@@ -303,62 +346,129 @@ async def upload_data(
         contents = await file.read()
         
         # ユーザー専用データ処理
+        from .user_data_processor import UserDataProcessor
+        # DB書き込みとpandasの処理はイベントループを止めないようにスレッドで実行
+        user_processor = UserDataProcessor(current_user.id, db)
+        # 前回と同じファイルなら解析・保存をせずに前回の結果（件数・期間・統計情報）を返す
+        result = await asyncio.to_thread(user_processor.upload_user_csv, contents)
+        
+        return {
+            "message": "データが正常にアップロードされました" if not result['unchanged']
+                       else "前回と同じデータのため更新はありません",
+            **result
+        }
+    except MemoryLimitExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"データ処理エラー: {str(e)}")
+
+@app.post("/api/upload-data/bulk")
+async def upload_data_bulk(
+    files: List[UploadFile] = File(...),
+    replace: bool = False,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """複数のCSV・ZIPの一括アップロード（replace=true で既存データを置き換え、既定は統合）"""
+    try:
+        contents = [(file.filename or f"file{i}.csv", await file.read()) for i, file in enumerate(files)]
+        
+        from .user_data_processor import UserDataProcessor
         user_processor = UserDataProcessor(current_user.id, db)
-        df = user_processor.process_user_csv_data(contents)
+        df, summary = await asyncio.to_thread(user_processor.process_user_csv_files, contents, replace)
         
-        # 基本統計情報
-        stats = user_processor.get_user_stats()
+        stats = await asyncio.to_thread(user_processor.get_user_stats)
         
         return {
-            "message": "データが正常にアップロードされました",
+            "message": f"{len(summary['files'])}件のファイルを取り込みました",
             "records_count": len(df),
             "date_range": {
                 "start": df['date'].min().strftime('%Y-%m-%d'),
                 "end": df['date'].max().strftime('%Y-%m-%d')
             },
+            "import_summary": summary,
             "stats": stats
         }
+    except MemoryLimitExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"データ処理エラー: {str(e)}")
 
 @app.post("/api/train-model")
 async def train_model(
+    mode: str = 'auto',
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """機械学習モデルの訓練（ユーザー専用）"""
+    """機械学習モデルの訓練（ユーザー専用、mode=full で常に全件再訓練）"""
+    from .user_data_processor import TRAINING_MODES
+    if mode not in TRAINING_MODES:
+        raise HTTPException(status_code=400, detail=f"mode は {', '.join(TRAINING_MODES)} のいずれかを指定してください")
+    
     try:
         # ユーザー専用データ処理
+        from .user_data_processor import UserDataProcessor
         user_processor = UserDataProcessor(current_user.id, db)
         
         # データの確認
-        if not user_processor.has_data():
+        if not await asyncio.to_thread(user_processor.has_data):
             raise HTTPException(status_code=400, detail="訓練データがありません。まずCSVファイルをアップロードしてください。")
         
         # モデル訓練
-        metrics = user_processor.train_user_model()
+        metrics = await asyncio.to_thread(user_processor.train_user_model, mode)
         
         return {
             "message": "モデル訓練が完了しました",
             "metrics": metrics,
             "model_saved": f"models/users/{current_user.id}/sales_model.pkl"
         }
+    except MemoryLimitExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"モデル訓練エラー: {str(e)}")
 
+@app.post("/api/backtest")
+async def backtest_model(
+    n_folds: int = 50,
+    horizon_days: int = 7,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """時系列ウォークフォワード・バックテスト（ユーザー専用）"""
+    if not 1 <= n_folds <= 200 or not 1 <= horizon_days <= 60:
+        raise HTTPException(status_code=400, detail="n_foldsは1〜200、horizon_daysは1〜60で指定してください")
+    
+    try:
+        from .user_data_processor import UserDataProcessor
+        user_processor = UserDataProcessor(current_user.id, db)
+        
+        if not await asyncio.to_thread(user_processor.has_data):
+            raise HTTPException(status_code=400, detail="データがありません。まずCSVファイルをアップロードしてください。")
+        
+        return await asyncio.to_thread(user_processor.backtest_user_model, n_folds, horizon_days)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"バックテストエラー: {str(e)}")
+
 @app.post("/api/predict", response_model=PredictionResponse)
 async def predict_sales(
     request: UserPredictionRequest,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """売上予測（ユーザー専用）"""
+    """売上予測（ユーザー専用、複数店舗で store_id を省略した場合は全店舗の合計）"""
+    from .forecaster import ForecastGapError
+    from .models import UnknownStoreError
+    
     try:
         # ユーザー専用データ処理
+        from .user_data_processor import UserDataProcessor
         user_processor = UserDataProcessor(current_user.id, db)
         
         # モデルの確認
-        if not user_processor.has_model():
+        model_version = await asyncio.to_thread(user_processor.get_model_version)
+        if model_version is None:
             raise HTTPException(status_code=400, detail="予測モデルが訓練されていません。")
         
         # 日付解析
@@ -367,65 +477,191 @@ async def predict_sales(
         # 郵便番号設定（リクエストまたはユーザーのデフォルト）
         postal_code = request.postal_code or current_user.postal_code or "1000001"
         
-        # 天気予報取得
+        # 天気予報取得（予測対象日の予報を使用）
         weather_data = await weather_service.get_weather_forecast(postal_code)
+        weather_data = weather_service.get_weather_for_date(weather_data, target_date.date())
         
-        # 予測実行
-        sales_pred, customers_pred, confidence = user_processor.predict_sales(target_date, weather_data)
+        # データの最終日から予測日の前日までを埋めるときも、予報のある日は予報の天気を使う（複数日予測と同じ）
+        weather_by_date = {
+            day: weather for day, weather in weather_service.get_weather_by_date(weather_data).items()
+            if day < target_date.strftime('%Y-%m-%d')
+        }
         
-        # 予測履歴を保存
-        prediction_history = PredictionHistory(
-            user_id=current_user.id,
-            prediction_date=target_date,
-            predicted_sales=sales_pred,
-            predicted_customers=customers_pred,
-            weather_condition=weather_data.get('weather'),
-            temperature=weather_data.get('temperature'),
-            confidence_lower_sales=confidence.get('sales_lower'),
-            confidence_upper_sales=confidence.get('sales_upper'),
-            confidence_lower_customers=confidence.get('customers_lower'),
-            confidence_upper_customers=confidence.get('customers_upper')
+        # 同じ条件の予測結果があればキャッシュから返す
+        cache_key = prediction_cache.make_key(
+            current_user.id, request.date, weather_service.get_city_code(postal_code),
+            weather_data, model_version, store_id=request.store_id, weather_by_date=weather_by_date
         )
-        db.add(prediction_history)
-        db.commit()
+        cached_result = prediction_cache.get(cache_key)
+        
+        if cached_result is not None:
+            sales_pred, customers_pred, confidence = cached_result
+        else:
+            # 予測実行
+            sales_pred, customers_pred, confidence = await asyncio.to_thread(
+                user_processor.predict_sales, target_date, weather_data, request.store_id, weather_by_date
+            )
+            prediction_cache.set(cache_key, (sales_pred, customers_pred, confidence))
+        
+        # 予測履歴を保存（書き込みキュー経由でまとめてINSERT）
+        await prediction_history_writer.submit({
+            'user_id': current_user.id,
+            'store_id': request.store_id,
+            'prediction_date': target_date,
+            'predicted_sales': float(sales_pred),
+            'predicted_customers': int(customers_pred),
+            'weather_condition': weather_data.get('weather'),
+            'temperature': weather_data.get('temperature'),
+            'confidence_lower_sales': confidence.get('sales_lower'),
+            'confidence_upper_sales': confidence.get('sales_upper'),
+            'confidence_lower_customers': confidence.get('customers_lower'),
+            'confidence_upper_customers': confidence.get('customers_upper')
+        })
         
         return PredictionResponse(
             date=request.date,
+            store_id=request.store_id,
             predicted_sales=float(sales_pred),
             predicted_customers=int(customers_pred),
             weather_forecast=weather_data,
-            confidence_interval=confidence
+            confidence_interval=confidence,
+            cached=cached_result is not None
         )
         
+    except HTTPException:
+        raise
+    except UnknownStoreError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ForecastGapError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"予測エラー: {str(e)}")
+
+@app.post("/api/predict/horizon", response_model=HorizonPredictionResponse)
+async def predict_horizon(
+    request: HorizonPredictionRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """複数日の売上予測（ユーザー専用、複数店舗で store_id を省略した場合は全店舗の合計）"""
+    from .forecaster import MAX_HORIZON_DAYS, ForecastGapError
+    from .models import UnknownStoreError
+    
+    if not 1 <= request.days <= MAX_HORIZON_DAYS:
+        raise HTTPException(status_code=400, detail=f"予測日数は1〜{MAX_HORIZON_DAYS}日で指定してください")
+    
+    try:
+        from .user_data_processor import UserDataProcessor
+        user_processor = UserDataProcessor(current_user.id, db)
+        
+        if not await asyncio.to_thread(user_processor.has_model):
+            raise HTTPException(status_code=400, detail="予測モデルが訓練されていません。")
+        
+        start_date = datetime.strptime(request.start_date, '%Y-%m-%d')
+        postal_code = request.postal_code or current_user.postal_code or "1000001"
+        
+        # 天気予報取得（日付ごとに照合）
+        weather_data = await weather_service.get_weather_forecast(postal_code)
+        weather_by_date = weather_service.get_weather_by_date(weather_data)
+        
+        forecasts = await asyncio.to_thread(
+            user_processor.forecast_horizon, start_date, request.days, weather_by_date, request.store_id
+        )
+        
+        # 予測履歴を保存（書き込みキュー経由でまとめてINSERT）
+        for forecast in forecasts:
+            await prediction_history_writer.submit({
+                'user_id': current_user.id,
+                'store_id': request.store_id,
+                'prediction_date': datetime.strptime(forecast['date'], '%Y-%m-%d'),
+                'predicted_sales': forecast['predicted_sales'],
+                'predicted_customers': forecast['predicted_customers'],
+                'weather_condition': forecast['weather'],
+                'temperature': None,
+                'confidence_lower_sales': forecast['confidence_interval']['sales_lower'],
+                'confidence_upper_sales': forecast['confidence_interval']['sales_upper'],
+                'confidence_lower_customers': forecast['confidence_interval']['customers_lower'],
+                'confidence_upper_customers': forecast['confidence_interval']['customers_upper']
+            })
+        
+        return HorizonPredictionResponse(
+            start_date=request.start_date,
+            days=request.days,
+            store_id=request.store_id,
+            forecasts=forecasts,
+            weather_forecast=weather_data
+        )
+        
+    except HTTPException:
+        raise
+    except UnknownStoreError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ForecastGapError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"予測エラー: {str(e)}")
 
 @app.get("/api/model-status")
 async def get_model_status(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """モデル状況確認（ユーザー専用）"""
+    """モデル状況確認（ユーザー専用、データ・モデルが変わっていなければ 304）"""
+    etag = await asyncio.to_thread(tenant_etag, db, request, 'model-status', current_user.id, ('data', 'model'))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    
+    from .user_data_processor import UserDataProcessor
     user_processor = UserDataProcessor(current_user.id, db)
     
+    model_trained = await asyncio.to_thread(user_processor.has_model)
     return {
-        "model_trained": user_processor.has_model(),
-        "data_loaded": user_processor.has_data(),
-        "model_path": f"models/users/{current_user.id}/sales_model.pkl" if user_processor.has_model() else None
+        "model_trained": model_trained,
+        "data_loaded": await asyncio.to_thread(user_processor.has_data),
+        "model_path": f"models/users/{current_user.id}/sales_model.pkl" if model_trained else None
     }
 
 @app.get("/api/data-stats")
 async def get_data_stats(
+    request: Request,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """データ統計情報（ユーザー専用）"""
+    """データ統計情報（ユーザー専用、データが変わっていなければ 304）"""
+    etag = await asyncio.to_thread(tenant_etag, db, request, 'data-stats', current_user.id, ('data',))
+    # 本文は gzip で返すことがあるので、圧縮版のETagでも一致とする
+    matched = matching_etag(request, etag, encodings=('gzip',))
+    if matched is not None:
+        return not_modified(matched)
+    
+    from .user_data_processor import UserDataProcessor
     user_processor = UserDataProcessor(current_user.id, db)
     
-    if not user_processor.has_data():
+    if not await asyncio.to_thread(user_processor.has_data):
         raise HTTPException(status_code=400, detail="データがロードされていません")
     
-    return user_processor.get_user_stats()
+    # pandas の集計結果（numpy の数値を含む）をそのまま orjson でエンコードする
+    result = json_response(request, await asyncio.to_thread(user_processor.get_user_stats))
+    set_etag(result, etag)
+    return result
+
+# SPAのフォールバックは全てのAPIルートより後に登録する（先に登録するとGETのAPIを横取りする）
+@app.get("/{path:path}", include_in_schema=False)
+async def serve_frontend_routes(path: str, request: Request):
+    """React Router対応"""
+    # API、docs、redocパスはスキップ
+    if path.startswith("api/") or path.startswith("docs") or path.startswith("redoc"):
+        raise HTTPException(status_code=404, detail="Not Found")
+    
+    if not simple_html_mode:
+        # Reactアプリの場合、SPAルーティング対応
+        return index_page.response(request)
+    else:
+        # シンプル版の場合はルートにリダイレクト
+        raise HTTPException(status_code=404, detail="Page not found")
 
 if __name__ == "__main__":
     import uvicorn
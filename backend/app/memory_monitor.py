@@ -0,0 +1,325 @@
+import contextlib
+import contextvars
+import functools
+import gc
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from decouple import config
+
+# メモリ計測の方式（off / rss: プロセスのRSSを定期的に取得 / tracemalloc: Pythonの割り当てを追跡、遅い）
+MEMORY_TRACKING = config('MEMORY_TRACKING', default='off')
+# 1ジョブ（アップロード・訓練）が扱ってよいデータ量の上限（MB、0で無制限）
+# 段階の境目でジョブごとの推定量を、ワーカープロセスではタスクの境目でRSSの増分を確認する
+MEMORY_JOB_LIMIT_MB = config('MEMORY_JOB_LIMIT_MB', default=0, cast=int)
+MEMORY_SAMPLE_INTERVAL_MS = config('MEMORY_SAMPLE_INTERVAL_MS', default=50, cast=int)
+# デバッグ用に保持する直近の段階の記録数
+MEMORY_HISTORY_SIZE = config('MEMORY_HISTORY_SIZE', default=200, cast=int)
+
+TRACKING_MODES = ('off', 'rss', 'tracemalloc')
+
+_MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# プロセスプールのワーカーでの (起動時のRSS, 上限)（init_worker_memory で設定）
+_worker_limit: Optional[tuple] = None
+
+class MemoryLimitExceeded(Exception):
+    """ジョブのメモリ上限を超えたため処理を中断した"""
+
+def data_bytes(value: Any, depth: int = 2) -> int:
+    """段階の入出力（DataFrame・配列・バイト列とそれらのタプル・リスト・辞書）の推定サイズ（バイト）"""
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, memoryview, str)):
+        return len(value)
+    if depth > 0 and isinstance(value, (tuple, list)):
+        return sum(data_bytes(item, depth - 1) for item in value)
+    if depth > 0 and isinstance(value, dict):
+        return sum(data_bytes(item, depth - 1) for item in value.values())
+    return 0
+
+def init_worker_memory(limit_bytes: int):
+    """プロセスプールのワーカーの initializer（起動時のRSSを基準に、タスクの境目で上限を確認する）"""
+    global _worker_limit
+    _worker_limit = (current_rss(), limit_bytes) if limit_bytes else None
+
+def check_worker_memory():
+    """ワーカーのタスクの開始・終了時に呼ぶ（起動時からのRSSの増分が上限を超えていれば MemoryLimitExceeded）
+
+    ワーカーは1つのジョブのタスクだけを実行するので、RSSは他のジョブの影響を受けない。
+    タスクの実行中には止めないため、厳密な上限ではない。
+    """
+    if _worker_limit is None:
+        return
+    base, limit = _worker_limit
+    used = current_rss() - base
+    if used > limit:
+        raise MemoryLimitExceeded(f"ワーカープロセス: RSS +{used / _MB:.0f}MB")
+
+def current_rss() -> int:
+    """プロセスの現在のRSS（バイト）。/proc がない環境では最大RSSで代用"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class _Job:
+    """実行中のジョブ（推定データ量の上限の確認と、段階ごとのRSSのピークの更新を行う）"""
+
+    def __init__(self, kind: str, user_id: Optional[int], limit_bytes: int, sample_rss: bool):
+        self.kind = kind
+        self.user_id = user_id
+        self.limit_bytes = limit_bytes
+        self.start_rss = current_rss()
+        self.peak_rss = self.start_rss
+        # このジョブの段階の入出力から推定したデータ量のピーク（他のジョブの影響を受けない）
+        self.peak_data_bytes = 0
+        self.exceeded_stage: Optional[str] = None
+        # コミット後の後処理など、途中で止めると不整合になる区間では中断しない
+        self.abortable = True
+        self.active_stages: List[Dict[str, Any]] = []
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._sample_rss = sample_rss
+
+    def start(self):
+        if self._sample_rss:
+            self._sampler = threading.Thread(target=self._sample, name=f"memory-{self.kind}", daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def account(self, stage: str, size: int):
+        """段階の推定データ量を記録し、上限を超えていれば段階の境目で中断する"""
+        self.peak_data_bytes = max(self.peak_data_bytes, size)
+        if self.limit_bytes and size > self.limit_bytes and self.exceeded_stage is None:
+            self.exceeded_stage = stage
+
+    def check(self):
+        """段階の開始時に呼ぶ（前の段階までに上限を超えていれば MemoryLimitExceeded）"""
+        if self.exceeded_stage is not None and self.abortable:
+            raise MemoryLimitExceeded(self.exceeded_stage)
+
+    def _sample(self):
+        """RSS（プロセス全体）を定期的に取得して段階ごとのピークを記録（計測用で中断には使わない）"""
+        interval = MEMORY_SAMPLE_INTERVAL_MS / 1000
+        while not self._stop.wait(interval):
+            rss = current_rss()
+            self.peak_rss = max(self.peak_rss, rss)
+            for stage in list(self.active_stages):
+                stage['peak_rss'] = max(stage['peak_rss'], rss)
+
+_current_job: contextvars.ContextVar[Optional[_Job]] = contextvars.ContextVar('memory_job', default=None)
+
+class MemoryMonitor:
+    """段階ごと（CSV解析・DB保存・特徴量作成・訓練など）のメモリのピークと増分を記録"""
+
+    def __init__(self, mode: str = MEMORY_TRACKING, job_limit_mb: int = MEMORY_JOB_LIMIT_MB,
+                 history_size: int = MEMORY_HISTORY_SIZE):
+        if mode not in TRACKING_MODES:
+            raise ValueError(f"MEMORY_TRACKING は {', '.join(TRACKING_MODES)} のいずれかを指定してください: {mode}")
+        self.mode = mode
+        self.job_limit_mb = job_limit_mb
+        self.history: "deque[Dict[str, Any]]" = deque(maxlen=history_size)
+        self.aborted_jobs = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != 'off' or self.job_limit_mb > 0
+
+    def job(self, kind: str):
+        """ジョブ単位の監視を行うデコレータ（上限を超えたら次の段階の開始時に MemoryLimitExceeded で中断）
+
+        メソッドに付けた場合は self.user_id を記録する。
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or _current_job.get() is not None:
+                    return func(*args, **kwargs)
+
+                user_id = getattr(args[0], 'user_id', None) if args else None
+                job = _Job(kind, user_id, self.job_limit_mb * _MB, sample_rss=self.mode != 'off')
+                token = _current_job.set(job)
+                job.start()
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    # 段階の境目での中断（ワーカーで超えた分を含む）と MemoryError（例外の連鎖をたどる）
+                    cause = _find_cause(e, (MemoryLimitExceeded, MemoryError)) if job.limit_bytes else None
+                    if cause is not None:
+                        raise self._abort(job, cause) from e
+                    raise
+                finally:
+                    job.stop()
+                    _current_job.reset(token)
+            return wrapper
+        return decorator
+
+    def stage(self, name: str):
+        """段階の計測と上限の確認を行うデコレータ（どちらも無効なら何もしない）"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                job = _current_job.get()
+                if self.mode == 'off' and (job is None or not job.limit_bytes):
+                    return func(*args, **kwargs)
+                return self._run_stage(name, func, args, kwargs)
+            return wrapper
+        return decorator
+
+    @contextlib.contextmanager
+    def no_abort(self):
+        """コミット後の後処理など、途中で中断すると不整合になる区間（上限を超えても中断しない）"""
+        job = _current_job.get()
+        if job is None:
+            yield
+            return
+        abortable = job.abortable
+        job.abortable = False
+        try:
+            yield
+        finally:
+            job.abortable = abortable
+
+    def worker_limit_bytes(self) -> int:
+        """プロセスプールのワーカーのRSSの増分の上限（init_worker_memory の引数）"""
+        return self.job_limit_mb * _MB
+
+    def _run_stage(self, name: str, func, args, kwargs):
+        job = _current_job.get()
+        input_bytes = 0
+        if job is not None and job.limit_bytes:
+            # 入力（self 以外の引数）の推定サイズで確認してから処理を始める
+            input_bytes = data_bytes(list(args[1:]) + list(kwargs.values()), depth=3)
+            job.account(name, input_bytes)
+            job.check()
+
+        if self.mode == 'off':
+            result = func(*args, **kwargs)
+            job.account(name, input_bytes + data_bytes(result))
+            return result
+
+        use_tracemalloc = self.mode == 'tracemalloc'
+        if use_tracemalloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            traced_start = tracemalloc.get_traced_memory()[0]
+
+        record = {
+            'stage': name,
+            'job': job.kind if job else None,
+            'user_id': job.user_id if job else getattr(args[0], 'user_id', None) if args else None,
+            'start_rss': current_rss(),
+            'started_at': time.time()
+        }
+        record['peak_rss'] = record['start_rss']
+        if job is not None:
+            job.active_stages.append(record)
+
+        start_time = time.perf_counter()
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        finally:
+            if job is not None:
+                job.active_stages.remove(record)
+            end_rss = current_rss()
+            entry = {
+                'stage': name,
+                'job': record['job'],
+                'user_id': record['user_id'],
+                'started_at': record['started_at'],
+                'seconds': round(time.perf_counter() - start_time, 4),
+                'rss_mb': round(end_rss / _MB, 1),
+                'rss_delta_mb': round((end_rss - record['start_rss']) / _MB, 1),
+                'rss_peak_delta_mb': round((max(record['peak_rss'], end_rss) - record['start_rss']) / _MB, 1)
+            }
+            if job is not None and job.limit_bytes:
+                # 入力＋出力の推定データ量（このジョブの分のみ。RSSはプロセス全体）
+                size = input_bytes + data_bytes(result)
+                job.account(name, size)
+                entry['data_mb'] = round(size / _MB, 1)
+            if use_tracemalloc:
+                current, peak = tracemalloc.get_traced_memory()
+                entry['traced_delta_mb'] = round((current - traced_start) / _MB, 2)
+                entry['traced_peak_mb'] = round((peak - traced_start) / _MB, 2)
+            self._record(entry)
+
+    def _record(self, entry: Dict[str, Any]):
+        with self._lock:
+            self.history.append(entry)
+        peak = entry.get('traced_peak_mb', entry['rss_peak_delta_mb'])
+        print(f"メモリ計測 {entry['stage']}: ピーク+{peak}MB 増分{entry['rss_delta_mb']:+}MB "
+              f"RSS {entry['rss_mb']}MB（{entry['seconds']}秒, user={entry['user_id']}）")
+
+    def _abort(self, job: _Job, cause: BaseException) -> MemoryLimitExceeded:
+        with self._lock:
+            self.aborted_jobs += 1
+        # 中断した処理が確保したメモリをすぐに返す
+        gc.collect()
+        if job.exceeded_stage is not None:
+            detail = f"{job.exceeded_stage}: 推定{job.peak_data_bytes / _MB:.0f}MB"
+        elif isinstance(cause, MemoryLimitExceeded):
+            # ワーカーで超えた場合はワーカーのRSSの増分
+            detail = str(cause)
+        else:
+            detail = 'MemoryError'
+        message = f"メモリ上限（{self.job_limit_mb}MB）を超えたため{job.kind}を中断しました（{detail}）"
+        print(f"{message} user={job.user_id}")
+        return MemoryLimitExceeded(message)
+
+    def status(self, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """設定・現在のRSS・段階ごとの集計と直近の記録（user_id を指定するとそのユーザーの記録のみ）"""
+        with self._lock:
+            entries = [e for e in self.history if user_id is None or e['user_id'] == user_id]
+
+        stages: Dict[str, Dict[str, Any]] = {}
+        for entry in entries:
+            peak = entry.get('traced_peak_mb', entry['rss_peak_delta_mb'])
+            stats = stages.setdefault(entry['stage'], {'count': 0, 'max_peak_mb': 0.0, 'total_seconds': 0.0})
+            stats['count'] += 1
+            stats['max_peak_mb'] = max(stats['max_peak_mb'], peak)
+            stats['total_seconds'] = round(stats['total_seconds'] + entry['seconds'], 4)
+
+        return {
+            'mode': self.mode,
+            'job_limit_mb': self.job_limit_mb,
+            'rss_mb': round(current_rss() / _MB, 1),
+            'aborted_jobs': self.aborted_jobs,
+            'stages': stages,
+            'recent': entries[-50:]
+        }
+
+def _find_cause(error: BaseException, types) -> Optional[BaseException]:
+    """例外またはその原因（__cause__ / __context__）のうち指定の型のもの（なければNone）"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, types):
+            return error
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+# アプリ全体で共有するメモリ計測
+memory_monitor = MemoryMonitor()
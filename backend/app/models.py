@@ -5,41 +5,129 @@ from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.preprocessing import StandardScaler
 import joblib
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, Optional, List
+from concurrent.futures import ProcessPoolExecutor
+import os
+import time
 import warnings
 warnings.filterwarnings('ignore')
 
+from .memory_monitor import memory_monitor, init_worker_memory, check_worker_memory
+
+# 利用可能な学習エンジン
+SUPPORTED_ENGINES = ('random_forest', 'hist_gradient_boosting', 'xgboost')
+DEFAULT_ENGINE = 'random_forest'
+
+# 信頼区間に使う分位点（95%区間）
+INTERVAL_QUANTILES = (0.025, 0.975)
+
+# 差分再訓練（ランダムフォレストのみ）：1回で置き換える木の割合と、新しい木の訓練に使う直近の行数
+INCREMENTAL_TREE_FRACTION = 0.03
+INCREMENTAL_WINDOW_ROWS = 730
+# 新しい行ほど重くする（この行数だけ古くなると重みが半分）
+RECENCY_HALF_LIFE_ROWS = 180
+# 差分再訓練をこの回数続けたら全件で再訓練する（置き換わる木が全体の半分を超える前に）
+INCREMENTAL_MAX_UPDATES = 14
+# 新しい行での誤差（MAPE）が訓練時の検証誤差のこの倍率を超えたらドリフトとみなす
+DRIFT_MAPE_RATIO = 1.5
+DRIFT_MIN_ROWS = 7
+
+class UnknownStoreError(Exception):
+    """モデル・データにない店舗IDが指定された"""
+
 class SalesPredictionModel:
-    def __init__(self):
-        self.sales_model = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=10,
-            min_samples_split=5,
-            min_samples_leaf=2,
-            random_state=42
-        )
-        self.customers_model = RandomForestRegressor(
+    # 差分再訓練用の状態（以前に保存したモデルにはないのでクラス属性を既定値にする）
+    baseline_mape: Optional[float] = None
+    update_count = 0
+    trained_until = None
+    training_rows: Optional[int] = None
+    # 訓練に使った特徴量の定義（FeatureSpec.key）
+    feature_spec: Optional[str] = None
+    
+    def __init__(self, engine: str = DEFAULT_ENGINE):
+        if engine not in SUPPORTED_ENGINES:
+            raise ValueError(f"未対応の学習エンジンです: {engine}")
+        
+        self.engine = engine
+        self.sales_model = self._build_regressor()
+        self.customers_model = self._build_regressor()
+        # 分位点モデル（HistGradientBoosting / XGBoostのみ）
+        self.sales_interval_models = None
+        self.customers_interval_models = None
+        self.scaler = StandardScaler()
+        self.is_trained = False
+        self.feature_columns = None
+    
+    def _build_regressor(self, quantile: Optional[float] = None):
+        """エンジンに応じた回帰モデルを生成"""
+        if self.engine == 'hist_gradient_boosting':
+            from sklearn.ensemble import HistGradientBoostingRegressor
+            params = {
+                'max_iter': 200,
+                'learning_rate': 0.1,
+                'max_depth': 10,
+                'min_samples_leaf': 20,
+                'random_state': 42
+            }
+            if quantile is not None:
+                params.update({'loss': 'quantile', 'quantile': quantile})
+            return HistGradientBoostingRegressor(**params)
+        
+        if self.engine == 'xgboost':
+            from xgboost import XGBRegressor
+            params = {
+                'n_estimators': 200,
+                'learning_rate': 0.1,
+                'max_depth': 8,
+                'tree_method': 'hist',
+                'device': 'cpu',
+                'n_jobs': -1,
+                'random_state': 42
+            }
+            if quantile is not None:
+                params.update({'objective': 'reg:quantileerror', 'quantile_alpha': quantile})
+            return XGBRegressor(**params)
+        
+        return RandomForestRegressor(
             n_estimators=100,
             max_depth=10,
             min_samples_split=5,
             min_samples_leaf=2,
             random_state=42
         )
-        self.scaler = StandardScaler()
-        self.is_trained = False
-        self.feature_columns = None
+    
+    def _fit_interval_models(self, X_scaled: np.ndarray, y: pd.Series) -> Optional[Tuple[Any, Any]]:
+        """分位点回帰で信頼区間の下限・上限モデルを訓練"""
+        if self.engine == 'random_forest':
+            return None
         
+        lower_model = self._build_regressor(quantile=INTERVAL_QUANTILES[0])
+        upper_model = self._build_regressor(quantile=INTERVAL_QUANTILES[1])
+        lower_model.fit(X_scaled, y)
+        upper_model.fit(X_scaled, y)
+        return lower_model, upper_model
+    
+    def _feature_importances(self, model) -> Dict[str, float]:
+        """特徴量重要度（提供しないエンジンは0とする）"""
+        importances = getattr(model, 'feature_importances_', None)
+        if importances is None:
+            importances = np.zeros(len(self.feature_columns))
+        return {col: float(value) for col, value in zip(self.feature_columns, importances)}
+        
+    @memory_monitor.stage('SalesPredictionModel.train')
     def train(self, X: pd.DataFrame, y: pd.DataFrame) -> Dict[str, Any]:
         """モデル訓練"""
         try:
             # 特徴量カラム名を保存
             self.feature_columns = X.columns.tolist()
             
-            # データ分割
+            # データ分割（時系列順：未来のデータを学習に混ぜない）
             X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=0.2, random_state=42
+                X, y, test_size=0.2, shuffle=False
             )
             
+            start_time = time.perf_counter()
+            
             # 特徴量スケーリング
             X_train_scaled = self.scaler.fit_transform(X_train)
             X_test_scaled = self.scaler.transform(X_test)
@@ -52,34 +140,104 @@ class SalesPredictionModel:
             self.customers_model.fit(X_train_scaled, y_train['customers'])
             customers_pred = self.customers_model.predict(X_test_scaled)
             
+            # 信頼区間用の分位点モデル訓練
+            self.sales_interval_models = self._fit_interval_models(X_train_scaled, y_train['sales'])
+            self.customers_interval_models = self._fit_interval_models(X_train_scaled, y_train['customers'])
+            
+            training_seconds = time.perf_counter() - start_time
+            
             # 評価指標計算
             sales_metrics = self._calculate_metrics(y_test['sales'], sales_pred)
             customers_metrics = self._calculate_metrics(y_test['customers'], customers_pred)
             
             # 特徴量重要度
-            sales_feature_importance = dict(zip(
-                self.feature_columns,
-                self.sales_model.feature_importances_
-            ))
-            customers_feature_importance = dict(zip(
-                self.feature_columns,
-                self.customers_model.feature_importances_
-            ))
+            sales_feature_importance = self._feature_importances(self.sales_model)
+            customers_feature_importance = self._feature_importances(self.customers_model)
             
             self.is_trained = True
+            self.baseline_mape = sales_metrics['mape']
+            self.update_count = 0
             
             return {
+                'engine': self.engine,
                 'sales_metrics': sales_metrics,
                 'customers_metrics': customers_metrics,
                 'sales_feature_importance': sales_feature_importance,
                 'customers_feature_importance': customers_feature_importance,
                 'training_samples': len(X_train),
-                'test_samples': len(X_test)
+                'test_samples': len(X_test),
+                'training_seconds': float(training_seconds)
             }
             
         except Exception as e:
             raise Exception(f"モデル訓練エラー: {str(e)}")
     
+    def can_update(self) -> bool:
+        """差分再訓練できるか（ランダムフォレストで訓練時の検証誤差が分かっている場合のみ）"""
+        return self.is_trained and self.engine == 'random_forest' and self.baseline_mape is not None
+    
+    @memory_monitor.stage('SalesPredictionModel.update')
+    def update(self, X: pd.DataFrame, y: pd.DataFrame, new_mask: np.ndarray) -> Optional[Dict[str, Any]]:
+        """差分再訓練：古い木の一部を直近データ（新しい行ほど重い）で訓練した木に置き換える
+        
+        X, y は時系列順の全履歴、new_mask は前回の訓練後に追加された行。
+        新しい行でドリフトを検出した場合は何もせずNoneを返す（呼び出し側で全件再訓練する）。
+        """
+        if not self.can_update():
+            return None
+        
+        try:
+            new_mask = np.asarray(new_mask, dtype=bool)
+            start_time = time.perf_counter()
+            
+            # 更新前のモデルで新しい行を予測（未学習データでの評価兼ドリフト検出）
+            X_new_scaled = self.scaler.transform(X.loc[new_mask, self.feature_columns])
+            sales_metrics = self._calculate_metrics(y.loc[new_mask, 'sales'], self.sales_model.predict(X_new_scaled))
+            customers_metrics = self._calculate_metrics(y.loc[new_mask, 'customers'], self.customers_model.predict(X_new_scaled))
+            
+            if new_mask.sum() >= DRIFT_MIN_ROWS and sales_metrics['mape'] > self.baseline_mape * DRIFT_MAPE_RATIO:
+                return None
+            
+            # スケーラーは既存の木と揃えるため更新しない
+            X_window = self.scaler.transform(X[self.feature_columns].iloc[-INCREMENTAL_WINDOW_ROWS:])
+            y_window = y.iloc[-INCREMENTAL_WINDOW_ROWS:]
+            age = np.arange(len(X_window))[::-1]
+            weights = 0.5 ** (age / RECENCY_HALF_LIFE_ROWS)
+            
+            self.update_count += 1
+            replaced = self._replace_trees(self.sales_model, X_window, y_window['sales'], weights)
+            self._replace_trees(self.customers_model, X_window, y_window['customers'], weights)
+            
+            return {
+                'engine': self.engine,
+                'mode': 'incremental',
+                'replaced_trees': replaced,
+                'sales_metrics': sales_metrics,
+                'customers_metrics': customers_metrics,
+                'sales_feature_importance': self._feature_importances(self.sales_model),
+                'customers_feature_importance': self._feature_importances(self.customers_model),
+                'training_samples': len(X_window),
+                'test_samples': int(new_mask.sum()),
+                'training_seconds': float(time.perf_counter() - start_time)
+            }
+            
+        except Exception as e:
+            raise Exception(f"差分再訓練エラー: {str(e)}")
+    
+    def _replace_trees(self, forest: RandomForestRegressor, X: np.ndarray, y: pd.Series, weights: np.ndarray) -> int:
+        """最も古い木を新しく訓練した木で置き換え、置き換えた本数を返す"""
+        from sklearn.base import clone
+        
+        n_replace = max(1, int(round(len(forest.estimators_) * INCREMENTAL_TREE_FRACTION)))
+        new_trees = clone(forest).set_params(
+            n_estimators=n_replace,
+            random_state=(forest.random_state or 0) + self.update_count
+        )
+        new_trees.fit(X, y, sample_weight=weights)
+        # 木は追加順に並んでいるので先頭が最も古い
+        forest.estimators_ = forest.estimators_[n_replace:] + new_trees.estimators_
+        return n_replace
+    
     def predict(self, X: pd.DataFrame) -> Tuple[float, int, Dict[str, float]]:
         """予測実行"""
         if not self.is_trained:
@@ -93,25 +251,65 @@ class SalesPredictionModel:
             X_scaled = self.scaler.transform(X_ordered)
             
             # 予測
-            sales_pred = self.sales_model.predict(X_scaled)[0]
-            customers_pred = self.customers_model.predict(X_scaled)[0]
-            
-            # 信頼区間の概算（標準偏差ベース）
-            sales_std = np.std([tree.predict(X_scaled)[0] for tree in self.sales_model.estimators_[:10]])
-            customers_std = np.std([tree.predict(X_scaled)[0] for tree in self.customers_model.estimators_[:10]])
-            
-            confidence_interval = {
-                'sales_lower': max(0, sales_pred - 1.96 * sales_std),
-                'sales_upper': sales_pred + 1.96 * sales_std,
-                'customers_lower': max(0, customers_pred - 1.96 * customers_std),
-                'customers_upper': customers_pred + 1.96 * customers_std
-            }
+            sales_pred = float(self.sales_model.predict(X_scaled)[0])
+            customers_pred = float(self.customers_model.predict(X_scaled)[0])
+            
+            confidence_interval = self._confidence_interval(X_scaled, sales_pred, customers_pred)
             
             return sales_pred, int(customers_pred), confidence_interval
             
         except Exception as e:
             raise Exception(f"予測エラー: {str(e)}")
     
+    def predict_arrays(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """特徴量配列（feature_columns順）から点予測のみを返す"""
+        if not self.is_trained:
+            raise Exception("モデルが訓練されていません")
+        
+        X_scaled = self.scaler.transform(X)
+        return self.sales_model.predict(X_scaled), self.customers_model.predict(X_scaled)
+    
+    def predict_intervals(self, X: np.ndarray, sales_pred: np.ndarray, customers_pred: np.ndarray) -> Dict[str, np.ndarray]:
+        """特徴量配列（feature_columns順）の各行について信頼区間を計算"""
+        return self._confidence_intervals(self.scaler.transform(X), sales_pred, customers_pred)
+    
+    def _confidence_interval(self, X_scaled: np.ndarray, sales_pred: float, customers_pred: float) -> Dict[str, float]:
+        """信頼区間計算（1行分）"""
+        intervals = self._confidence_intervals(
+            X_scaled[:1], np.array([sales_pred]), np.array([customers_pred])
+        )
+        return {key: float(values[0]) for key, values in intervals.items()}
+    
+    def _confidence_intervals(self, X_scaled: np.ndarray, sales_pred: np.ndarray, customers_pred: np.ndarray) -> Dict[str, np.ndarray]:
+        """信頼区間計算（分位点モデルがあればそれを使用）"""
+        sales_intervals = getattr(self, 'sales_interval_models', None)
+        customers_intervals = getattr(self, 'customers_interval_models', None)
+        
+        if sales_intervals is not None and customers_intervals is not None:
+            sales_lower = sales_intervals[0].predict(X_scaled).astype(float)
+            sales_upper = sales_intervals[1].predict(X_scaled).astype(float)
+            customers_lower = customers_intervals[0].predict(X_scaled).astype(float)
+            customers_upper = customers_intervals[1].predict(X_scaled).astype(float)
+            
+            # 分位点の交差を補正し、点予測を必ず区間内に含める
+            return {
+                'sales_lower': np.maximum(0, np.minimum.reduce([sales_lower, sales_upper, sales_pred])),
+                'sales_upper': np.maximum.reduce([sales_lower, sales_upper, sales_pred]),
+                'customers_lower': np.maximum(0, np.minimum.reduce([customers_lower, customers_upper, customers_pred])),
+                'customers_upper': np.maximum.reduce([customers_lower, customers_upper, customers_pred])
+            }
+        
+        # 信頼区間の概算（標準偏差ベース）
+        sales_std = np.std([tree.predict(X_scaled) for tree in self.sales_model.estimators_[:10]], axis=0)
+        customers_std = np.std([tree.predict(X_scaled) for tree in self.customers_model.estimators_[:10]], axis=0)
+        
+        return {
+            'sales_lower': np.maximum(0, sales_pred - 1.96 * sales_std),
+            'sales_upper': sales_pred + 1.96 * sales_std,
+            'customers_lower': np.maximum(0, customers_pred - 1.96 * customers_std),
+            'customers_upper': customers_pred + 1.96 * customers_std
+        }
+    
     def _calculate_metrics(self, y_true: pd.Series, y_pred: np.ndarray) -> Dict[str, float]:
         """評価指標計算"""
         mae = mean_absolute_error(y_true, y_pred)
@@ -136,8 +334,8 @@ class SalesPredictionModel:
             return {}
         
         return {
-            'sales': dict(zip(self.feature_columns, self.sales_model.feature_importances_)),
-            'customers': dict(zip(self.feature_columns, self.customers_model.feature_importances_))
+            'sales': self._feature_importances(self.sales_model),
+            'customers': self._feature_importances(self.customers_model)
         }
     
     def save_model(self, filepath: str):
@@ -146,8 +344,11 @@ class SalesPredictionModel:
             raise Exception("訓練されていないモデルは保存できません")
         
         model_data = {
+            'engine': self.engine,
             'sales_model': self.sales_model,
             'customers_model': self.customers_model,
+            'sales_interval_models': self.sales_interval_models,
+            'customers_interval_models': self.customers_interval_models,
             'scaler': self.scaler,
             'feature_columns': self.feature_columns,
             'is_trained': self.is_trained
@@ -159,8 +360,11 @@ class SalesPredictionModel:
         """モデル読み込み"""
         model_data = joblib.load(filepath)
         
+        self.engine = model_data.get('engine', DEFAULT_ENGINE)
         self.sales_model = model_data['sales_model']
         self.customers_model = model_data['customers_model']
+        self.sales_interval_models = model_data.get('sales_interval_models')
+        self.customers_interval_models = model_data.get('customers_interval_models')
         self.scaler = model_data['scaler']
         self.feature_columns = model_data['feature_columns']
         self.is_trained = model_data['is_trained']
@@ -182,39 +386,40 @@ class EnsembleModel(SalesPredictionModel):
         }
         
         self.model_weights = {'random_forest': 0.5, 'gradient_boosting': 0.3, 'linear_regression': 0.2}
+        # 訓練済みモデル（名前 → (売上モデル, 客数モデル)）
+        self.fitted_models = {}
     
     def train(self, X: pd.DataFrame, y: pd.DataFrame) -> Dict[str, Any]:
         """アンサンブルモデル訓練"""
         try:
             self.feature_columns = X.columns.tolist()
             
+            # 時系列順に分割
             X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=0.2, random_state=42
+                X, y, test_size=0.2, shuffle=False
             )
             
             X_train_scaled = self.scaler.fit_transform(X_train)
             X_test_scaled = self.scaler.transform(X_test)
             
             # 各モデルを訓練
-            sales_predictions = []
-            customers_predictions = []
-            
+            self.fitted_models = {}
             for name, model in self.models.items():
                 # 売上予測モデル
                 sales_model = model.__class__(**model.get_params())
                 sales_model.fit(X_train_scaled, y_train['sales'])
-                sales_pred = sales_model.predict(X_test_scaled)
-                sales_predictions.append(sales_pred * self.model_weights[name])
                 
                 # 客数予測モデル
                 customers_model = model.__class__(**model.get_params())
                 customers_model.fit(X_train_scaled, y_train['customers'])
-                customers_pred = customers_model.predict(X_test_scaled)
-                customers_predictions.append(customers_pred * self.model_weights[name])
+                
+                self.fitted_models[name] = (sales_model, customers_model)
+            
+            # 信頼区間（木の予測のばらつき）にはランダムフォレストを使う
+            self.sales_model, self.customers_model = self.fitted_models['random_forest']
             
             # アンサンブル予測
-            ensemble_sales_pred = np.sum(sales_predictions, axis=0)
-            ensemble_customers_pred = np.sum(customers_predictions, axis=0)
+            ensemble_sales_pred, ensemble_customers_pred = self._ensemble_predict(X_test_scaled)
             
             # 評価指標
             sales_metrics = self._calculate_metrics(y_test['sales'], ensemble_sales_pred)
@@ -231,4 +436,216 @@ class EnsembleModel(SalesPredictionModel):
             }
             
         except Exception as e:
-            raise Exception(f"アンサンブルモデル訓練エラー: {str(e)}")
\ No newline at end of file
+            raise Exception(f"アンサンブルモデル訓練エラー: {str(e)}")
+    
+    def _ensemble_predict(self, X_scaled: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """各モデルの予測の重み付き和"""
+        sales_pred = np.zeros(len(X_scaled))
+        customers_pred = np.zeros(len(X_scaled))
+        for name, (sales_model, customers_model) in self.fitted_models.items():
+            sales_pred += sales_model.predict(X_scaled) * self.model_weights[name]
+            customers_pred += customers_model.predict(X_scaled) * self.model_weights[name]
+        return sales_pred, customers_pred
+    
+    def predict(self, X: pd.DataFrame) -> Tuple[float, int, Dict[str, float]]:
+        """予測実行"""
+        if not self.is_trained:
+            raise Exception("モデルが訓練されていません")
+        
+        try:
+            X_scaled = self.scaler.transform(X[self.feature_columns])
+            sales_pred, customers_pred = self._ensemble_predict(X_scaled[:1])
+            confidence_interval = self._confidence_interval(X_scaled, float(sales_pred[0]), float(customers_pred[0]))
+            return float(sales_pred[0]), int(customers_pred[0]), confidence_interval
+            
+        except Exception as e:
+            raise Exception(f"予測エラー: {str(e)}")
+    
+    def predict_arrays(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """特徴量配列（feature_columns順）から点予測のみを返す"""
+        if not self.is_trained:
+            raise Exception("モデルが訓練されていません")
+        
+        return self._ensemble_predict(self.scaler.transform(X))
+
+def _train_store_shard(args: Tuple[str, str, pd.DataFrame, pd.DataFrame]) -> Tuple[str, 'SalesPredictionModel', Dict[str, Any]]:
+    """1店舗分のモデル訓練（プロセスプールから呼ばれる）"""
+    store_id, engine, X, y = args
+    check_worker_memory()
+    model = SalesPredictionModel(engine=engine)
+    metrics = model.train(X, y)
+    check_worker_memory()
+    return store_id, model, metrics
+
+class StoreShardedModel:
+    """店舗別モデル（店舗ごとにSalesPredictionModelを保持）"""
+    
+    MIN_STORE_SAMPLES = 10
+    
+    # 差分再訓練用の状態（SalesPredictionModelと同じ）
+    update_count = 0
+    trained_until = None
+    training_rows: Optional[int] = None
+    # 訓練に使った特徴量の定義（FeatureSpec.key）
+    feature_spec: Optional[str] = None
+    
+    def __init__(self, engine: str = DEFAULT_ENGINE, max_workers: Optional[int] = None):
+        if engine not in SUPPORTED_ENGINES:
+            raise ValueError(f"未対応の学習エンジンです: {engine}")
+        
+        self.engine = engine
+        self.max_workers = max_workers
+        self.store_models: Dict[str, SalesPredictionModel] = {}
+        self.is_trained = False
+        self.feature_columns = None
+    
+    @memory_monitor.stage('StoreShardedModel.train')
+    def train(self, X: pd.DataFrame, y: pd.DataFrame, store_ids: pd.Series) -> Dict[str, Any]:
+        """店舗ごとのモデルを並列に訓練"""
+        try:
+            self.feature_columns = X.columns.tolist()
+            
+            # 店舗ごとの行インデックスを一度のグループ化で取得
+            store_index = pd.Series(np.asarray(store_ids)).groupby(np.asarray(store_ids), sort=True).indices
+            shards = [
+                (str(store_id), self.engine, X.iloc[idx], y.iloc[idx])
+                for store_id, idx in store_index.items()
+                if len(idx) >= self.MIN_STORE_SAMPLES
+            ]
+            
+            if not shards:
+                raise Exception(f"各店舗で最低{self.MIN_STORE_SAMPLES}件のデータが必要です")
+            
+            max_workers = min(self.max_workers or os.cpu_count() or 1, len(shards))
+            if max_workers > 1:
+                # ワーカーのメモリはジョブのスレッドからは見えないので、各プロセスがタスクの境目で確認する
+                with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker_memory,
+                                         initargs=(memory_monitor.worker_limit_bytes(),)) as executor:
+                    results = list(executor.map(_train_store_shard, shards, chunksize=max(1, len(shards) // (max_workers * 4))))
+            else:
+                results = [_train_store_shard(shard) for shard in shards]
+            
+            self.store_models = {store_id: model for store_id, model, _ in results}
+            store_metrics = {store_id: metrics for store_id, _, metrics in results}
+            self.is_trained = True
+            
+            return {
+                'engine': self.engine,
+                'model_type': 'store_sharded',
+                'store_count': len(self.store_models),
+                'skipped_stores': [str(s) for s, idx in store_index.items() if len(idx) < self.MIN_STORE_SAMPLES],
+                'sales_metrics': self._weighted_metrics(store_metrics, 'sales_metrics'),
+                'customers_metrics': self._weighted_metrics(store_metrics, 'customers_metrics'),
+                'training_samples': sum(m['training_samples'] for m in store_metrics.values()),
+                'test_samples': sum(m['test_samples'] for m in store_metrics.values()),
+                'training_seconds': float(sum(m['training_seconds'] for m in store_metrics.values())),
+                'stores': {
+                    store_id: {
+                        'sales_metrics': metrics['sales_metrics'],
+                        'customers_metrics': metrics['customers_metrics'],
+                        'training_samples': metrics['training_samples'],
+                        'test_samples': metrics['test_samples']
+                    }
+                    for store_id, metrics in store_metrics.items()
+                }
+            }
+            
+        except Exception as e:
+            raise Exception(f"店舗別モデル訓練エラー: {str(e)}")
+    
+    def can_update(self) -> bool:
+        """差分再訓練できるか"""
+        return self.is_trained and self.engine == 'random_forest'
+    
+    def update(self, X: pd.DataFrame, y: pd.DataFrame, store_ids: pd.Series, new_mask: np.ndarray) -> Optional[Dict[str, Any]]:
+        """新しい行がある店舗だけ差分再訓練（ドリフトした店舗・新しい店舗はその店舗だけ全件で訓練）"""
+        if not self.can_update():
+            return None
+        
+        try:
+            new_mask = np.asarray(new_mask, dtype=bool)
+            store_index = pd.Series(np.asarray(store_ids)).groupby(np.asarray(store_ids), sort=True).indices
+            
+            store_metrics = {}
+            retrained = []
+            for store_id, idx in store_index.items():
+                store_id = str(store_id)
+                if not new_mask[idx].any() or len(idx) < self.MIN_STORE_SAMPLES:
+                    continue
+                
+                model = self.store_models.get(store_id)
+                metrics = model.update(X.iloc[idx], y.iloc[idx], new_mask[idx]) if model is not None else None
+                if metrics is None:
+                    _, model, metrics = _train_store_shard((store_id, self.engine, X.iloc[idx], y.iloc[idx]))
+                    self.store_models[store_id] = model
+                    retrained.append(store_id)
+                store_metrics[store_id] = metrics
+            
+            if not store_metrics:
+                return None
+            
+            self.update_count += 1
+            
+            return {
+                'engine': self.engine,
+                'model_type': 'store_sharded',
+                'mode': 'incremental',
+                'store_count': len(self.store_models),
+                'updated_stores': sorted(set(store_metrics) - set(retrained)),
+                'retrained_stores': retrained,
+                'sales_metrics': self._weighted_metrics(store_metrics, 'sales_metrics'),
+                'customers_metrics': self._weighted_metrics(store_metrics, 'customers_metrics'),
+                'training_samples': sum(m['training_samples'] for m in store_metrics.values()),
+                'test_samples': sum(m['test_samples'] for m in store_metrics.values()),
+                'training_seconds': float(sum(m['training_seconds'] for m in store_metrics.values()))
+            }
+            
+        except Exception as e:
+            raise Exception(f"店舗別モデル差分再訓練エラー: {str(e)}")
+    
+    def _weighted_metrics(self, store_metrics: Dict[str, Dict[str, Any]], key: str) -> Dict[str, float]:
+        """検証件数で重み付けした店舗横断の評価指標"""
+        weights = np.array([m['test_samples'] for m in store_metrics.values()], dtype=float)
+        names = next(iter(store_metrics.values()))[key].keys()
+        return {
+            name: float(np.average([m[key][name] for m in store_metrics.values()], weights=weights))
+            for name in names
+        }
+    
+    def get_store_ids(self) -> List[str]:
+        """モデルを持つ店舗IDの一覧"""
+        return sorted(self.store_models.keys())
+    
+    def predict(self, X: pd.DataFrame, store_id: Optional[str] = None) -> Tuple[float, int, Dict[str, float]]:
+        """指定店舗のモデルで予測"""
+        if not self.is_trained:
+            raise Exception("モデルが訓練されていません")
+        
+        return self.get_store_model(store_id).predict(X)
+    
+    def get_store_model(self, store_id: Optional[str] = None) -> SalesPredictionModel:
+        """店舗IDに対応するモデルを取得（単一店舗なら省略可）"""
+        if store_id is None:
+            if len(self.store_models) != 1:
+                raise Exception("複数店舗のモデルです。store_idを指定してください")
+            store_id = next(iter(self.store_models))
+        
+        model = self.store_models.get(store_id)
+        if model is None:
+            raise UnknownStoreError(f"店舗 {store_id} のモデルがありません")
+        
+        return model
+    
+    def get_feature_importance(self) -> Dict[str, Dict[str, float]]:
+        """特徴量重要度取得（店舗平均）"""
+        if not self.is_trained:
+            return {}
+        
+        importances = [model.get_feature_importance() for model in self.store_models.values()]
+        return {
+            target: {
+                col: float(np.mean([imp[target][col] for imp in importances]))
+                for col in self.feature_columns
+            }
+            for target in ('sales', 'customers')
+        }
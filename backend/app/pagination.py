@@ -0,0 +1,79 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query
+
+# 1ページの最大件数
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    """(並び順の値, id) を不透明なカーソル文字列に変換"""
+    payload = json.dumps([sort_value.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """カーソル文字列を (並び順の値, id) に戻す"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="カーソルが不正です")
+
+def _keyset_query(query, sort_column, id_column, cursor: Optional[str], limit: int,
+                  descending: bool, offset: int):
+    """キーセット条件・並び順・件数を付与（Query / select() のどちらにも使える）"""
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limitは1〜{MAX_PAGE_SIZE}で指定してください")
+
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        key = tuple_(sort_column, id_column)
+        query = query.filter(key < tuple_(sort_value, row_id) if descending else key > tuple_(sort_value, row_id))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    if offset and not cursor:
+        query = query.offset(offset)
+
+    # 1件多く取得して次ページの有無を判定
+    return query.limit(limit + 1)
+
+def _split_page(rows: List[Any], sort_column, id_column, limit: int) -> Tuple[List[Any], Optional[str]]:
+    """limit+1件の結果をページと次ページのカーソルに分ける"""
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+def keyset_page(query: Query, sort_column, id_column, cursor: Optional[str], limit: int,
+                descending: bool = False, offset: int = 0) -> Tuple[List[Any], Optional[str]]:
+    """(sort_column, id) のキーセットで1ページ取得し、次ページのカーソルを返す
+
+    offset は旧クライアント互換用（カーソル指定時は無視する）
+    """
+    query = _keyset_query(query, sort_column, id_column, cursor, limit, descending, offset)
+    return _split_page(query.all(), sort_column, id_column, limit)
+
+async def keyset_page_async(db: AsyncSession, statement: Select, sort_column, id_column, cursor: Optional[str],
+                            limit: int, descending: bool = False, offset: int = 0,
+                            scalars: bool = True) -> Tuple[List[Any], Optional[str]]:
+    """keyset_page の非同期セッション版
+
+    statement は select(Model)。scalars=False なら select(列, ...) の行をそのまま返す
+    （並び順の列とidを含めること）
+    """
+    statement = _keyset_query(statement, sort_column, id_column, cursor, limit, descending, offset)
+    result = await db.execute(statement)
+    rows = result.scalars().all() if scalars else result.all()
+    return _split_page(rows, sort_column, id_column, limit)
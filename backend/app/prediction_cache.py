@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from decouple import config
+
+# キャッシュ件数の上限と有効期限（秒）
+PREDICTION_CACHE_SIZE = config('PREDICTION_CACHE_SIZE', default=10000, cast=int)
+PREDICTION_CACHE_TTL = config('PREDICTION_CACHE_TTL', default=6 * 60 * 60, cast=int)
+
+class PredictionCache:
+    """予測結果のメモ化（ユーザー・対象日・地域・天気・モデル版をキーにする）"""
+
+    def __init__(self, max_entries: int = PREDICTION_CACHE_SIZE, ttl_seconds: int = PREDICTION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(user_id: int, target_date: str, city_code: str, weather_data: Dict[str, Any],
+                 model_version: str, store_id: Optional[str] = None,
+                 weather_by_date: Optional[Dict[str, str]] = None) -> Tuple:
+        """キャッシュキー作成（天気は予測に使う値だけで署名する）"""
+        weather_signature = (
+            weather_data.get('weather'), weather_data.get('temperature'),
+            tuple(sorted((weather_by_date or {}).items()))
+        )
+        return (user_id, target_date, store_id, city_code, weather_signature, model_version)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """キャッシュ取得（期限切れは削除）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """キャッシュ保存（上限を超えたら古いものから削除）"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        """ユーザーのキャッシュを全て破棄（再訓練・アップロード時）"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        """全キャッシュ破棄"""
+        with self._lock:
+            self._entries.clear()
+
+# アプリ全体で共有するキャッシュ
+prediction_cache = PredictionCache()
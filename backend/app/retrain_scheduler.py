@@ -0,0 +1,238 @@
+"""古くなったユーザーモデルの一括再訓練
+
+前回の訓練後にデータが更新されたユーザーを探し、データの変化量と直近の予測回数で
+優先順位を付けて、上限付きのプロセスプールで再訓練する。深夜などの時間帯に実行し、
+時間帯を過ぎたら新しい再訓練は始めずに残りを次回に回す。結果はJSONのレポートに残す。
+
+    cd backend
+    python -m app.retrain_scheduler            # 毎日 RETRAIN_WINDOW の時間帯に実行し続ける
+    python -m app.retrain_scheduler --once     # 今すぐ1回だけ実行
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from decouple import config
+from sqlalchemy import func, select
+
+from .database import SessionLocal, engine
+from .user_models import PredictionHistory, UserData, UserDataSnapshot, UserModel
+
+# 実行する時間帯（ローカル時刻 HH:MM-HH:MM、日付をまたいでもよい）
+RETRAIN_WINDOW = config('RETRAIN_WINDOW', default='02:00-05:00')
+# 同時に再訓練するユーザー数（プロセス数）
+RETRAIN_MAX_WORKERS = config('RETRAIN_MAX_WORKERS', default=2, cast=int)
+# 1回の実行で再訓練する最大ユーザー数（0で無制限）
+RETRAIN_MAX_TENANTS = config('RETRAIN_MAX_TENANTS', default=0, cast=int)
+# 優先度に使う予測回数の集計期間
+RETRAIN_PREDICTION_LOOKBACK_DAYS = config('RETRAIN_PREDICTION_LOOKBACK_DAYS', default=7, cast=int)
+RETRAIN_REPORT_DIR = config('RETRAIN_REPORT_DIR', default='models/retrain_reports')
+
+def parse_window(window: str) -> Tuple[int, int]:
+    """'HH:MM-HH:MM' → (開始分, 終了分)"""
+    try:
+        start, end = window.split('-')
+        to_minutes = lambda value: int(value.split(':')[0]) * 60 + int(value.split(':')[1])
+        return to_minutes(start), to_minutes(end)
+    except Exception:
+        raise ValueError(f"RETRAIN_WINDOW の形式が正しくありません（例: 02:00-05:00）: {window}")
+
+def in_window(now: datetime, window: Tuple[int, int]) -> bool:
+    """時刻が実行時間帯に入っているか"""
+    minutes = now.hour * 60 + now.minute
+    start, end = window
+    if start <= end:
+        return start <= minutes < end
+    return minutes >= start or minutes < end
+
+def seconds_until_window(now: datetime, window: Tuple[int, int]) -> float:
+    """次に実行時間帯が始まるまでの秒数"""
+    start_time = now.replace(hour=window[0] // 60, minute=window[0] % 60, second=0, microsecond=0)
+    if start_time <= now:
+        start_time += timedelta(days=1)
+    return (start_time - now).total_seconds()
+
+def find_stale_tenants(db, lookback_days: int = RETRAIN_PREDICTION_LOOKBACK_DAYS) -> List[Dict[str, Any]]:
+    """モデルの訓練後にデータが更新されたユーザーを優先度順に取得
+
+    データの更新時刻はアップロードごとに作り直される直近スナップショットの時刻を使う。
+    優先度はデータ件数の変化率と、直近の予測回数（最多のユーザーを1とする）の和。
+    """
+    data_updated = select(
+        UserDataSnapshot.user_id,
+        func.max(UserDataSnapshot.updated_at).label('data_updated_at')
+    ).group_by(UserDataSnapshot.user_id).subquery()
+    data_rows = select(
+        UserData.user_id, func.count().label('rows')
+    ).group_by(UserData.user_id).subquery()
+    predictions = select(
+        PredictionHistory.user_id, func.count().label('predictions')
+    ).where(
+        PredictionHistory.created_at >= datetime.now(timezone.utc) - timedelta(days=lookback_days)
+    ).group_by(PredictionHistory.user_id).subquery()
+
+    model_updated_at = func.coalesce(UserModel.updated_at, UserModel.created_at)
+    rows = db.execute(
+        select(
+            UserModel.user_id, UserModel.training_data_count, model_updated_at.label('model_updated_at'),
+            data_updated.c.data_updated_at, data_rows.c.rows,
+            func.coalesce(predictions.c.predictions, 0).label('predictions')
+        )
+        .join(data_updated, data_updated.c.user_id == UserModel.user_id)
+        .join(data_rows, data_rows.c.user_id == UserModel.user_id)
+        .outerjoin(predictions, predictions.c.user_id == UserModel.user_id)
+        .where(data_updated.c.data_updated_at > model_updated_at)
+    ).all()
+
+    max_predictions = max([row.predictions for row in rows] + [1])
+    tenants = []
+    for row in rows:
+        changed_ratio = abs(row.rows - row.training_data_count) / max(row.training_data_count, 1)
+        tenants.append({
+            'user_id': row.user_id,
+            'data_rows': row.rows,
+            'training_rows': row.training_data_count,
+            'changed_ratio': round(changed_ratio, 4),
+            'recent_predictions': row.predictions,
+            'priority': round(changed_ratio + row.predictions / max_predictions, 4)
+        })
+    return sorted(tenants, key=lambda t: t['priority'], reverse=True)
+
+def _init_worker():
+    # 親プロセスから引き継いだ接続をワーカーで使わない
+    engine.dispose(close=False)
+
+def _retrain_tenant(user_id: int) -> Dict[str, Any]:
+    """1ユーザー分の再訓練（プロセスプールから呼ばれる）"""
+    from .user_data_processor import UserDataProcessor
+
+    start_time = time.perf_counter()
+    db = SessionLocal()
+    try:
+        # 店舗別モデルは店舗ごとの並列訓練をせず、プールのワーカー数で同時実行数を抑える
+        metrics = UserDataProcessor(user_id, db).train_user_model('auto', max_workers=1)
+        return {
+            'status': 'retrained',
+            'mode': metrics.get('mode'),
+            'full_retrain_reason': metrics.get('full_retrain_reason'),
+            'sales_mape': metrics['sales_metrics']['mape'],
+            'seconds': round(time.perf_counter() - start_time, 3)
+        }
+    except Exception as e:
+        return {'status': 'failed', 'error': str(e), 'seconds': round(time.perf_counter() - start_time, 3)}
+    finally:
+        db.close()
+
+class RetrainScheduler:
+    """古くなったモデルを時間帯内に上限付きの並列数で再訓練"""
+
+    def __init__(self, max_workers: int = RETRAIN_MAX_WORKERS, max_tenants: int = RETRAIN_MAX_TENANTS,
+                 window: str = RETRAIN_WINDOW, report_dir: str = RETRAIN_REPORT_DIR, session_factory=SessionLocal):
+        self.max_workers = max(1, max_workers)
+        self.max_tenants = max_tenants
+        self.window_text = window
+        self.window = parse_window(window)
+        self.report_dir = report_dir
+        self.session_factory = session_factory
+
+    def run_once(self, respect_window: bool = True) -> Dict[str, Any]:
+        """1回分の再訓練を実行してレポートを返す"""
+        started_at = datetime.now()
+        start_time = time.perf_counter()
+
+        db = self.session_factory()
+        try:
+            tenants = find_stale_tenants(db)
+        finally:
+            db.close()
+        if self.max_tenants:
+            tenants = tenants[:self.max_tenants]
+
+        pending = list(tenants)
+        running = {}
+        if pending:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(pending)), initializer=_init_worker) as executor:
+                while pending or running:
+                    # 時間帯を過ぎたら新しい再訓練は始めない（実行中のものは最後まで待つ）
+                    while pending and len(running) < self.max_workers \
+                            and (not respect_window or in_window(datetime.now(), self.window)):
+                        tenant = pending.pop(0)
+                        running[executor.submit(_retrain_tenant, tenant['user_id'])] = tenant
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        tenant = running.pop(future)
+                        try:
+                            tenant.update(future.result())
+                        except Exception as e:
+                            # ワーカーのプロセスが落ちた場合など
+                            tenant.update({'status': 'failed', 'error': str(e)})
+        for tenant in pending:
+            tenant['status'] = 'skipped'
+
+        report = {
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'seconds': round(time.perf_counter() - start_time, 3),
+            'window': self.window_text if respect_window else None,
+            'max_workers': self.max_workers,
+            'stale_tenants': len(tenants),
+            'retrained': sum(1 for t in tenants if t['status'] == 'retrained'),
+            'incremental': sum(1 for t in tenants if t.get('mode') == 'incremental'),
+            'failed': sum(1 for t in tenants if t['status'] == 'failed'),
+            'skipped': len(pending),
+            'tenants': tenants
+        }
+        self._save_report(report, started_at)
+        return report
+
+    def run_forever(self):
+        """毎日、実行時間帯の始まりまで待ってから再訓練する"""
+        while True:
+            now = datetime.now()
+            if not in_window(now, self.window):
+                wait_seconds = seconds_until_window(now, self.window)
+                print(f"次の再訓練まで {wait_seconds / 3600:.1f} 時間待機します（{self.window_text}）")
+                time.sleep(wait_seconds)
+            report = self.run_once()
+            print(f"再訓練レポート: 対象{report['stale_tenants']}件 完了{report['retrained']}件 "
+                  f"失敗{report['failed']}件 持ち越し{report['skipped']}件（{report['seconds']:.1f}秒）")
+            # 同じ時間帯で繰り返さないよう、時間帯の終わりまで待つ
+            while in_window(datetime.now(), self.window):
+                time.sleep(60)
+
+    def _save_report(self, report: Dict[str, Any], started_at: datetime) -> Optional[str]:
+        """レポートをJSONで保存"""
+        try:
+            os.makedirs(self.report_dir, exist_ok=True)
+            path = os.path.join(self.report_dir, f"retrain_{started_at:%Y%m%d_%H%M%S}.json")
+            with open(path, 'w') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            report['report_path'] = path
+            return path
+        except Exception as e:
+            print(f"再訓練レポートの保存エラー: {e}")
+            return None
+
+def main():
+    parser = argparse.ArgumentParser(description="古くなったユーザーモデルの一括再訓練")
+    parser.add_argument('--once', action='store_true', help="時間帯に関係なく今すぐ1回だけ実行")
+    parser.add_argument('--max-workers', type=int, default=RETRAIN_MAX_WORKERS)
+    parser.add_argument('--max-tenants', type=int, default=RETRAIN_MAX_TENANTS)
+    parser.add_argument('--window', default=RETRAIN_WINDOW)
+    args = parser.parse_args()
+
+    scheduler = RetrainScheduler(max_workers=args.max_workers, max_tenants=args.max_tenants, window=args.window)
+    if args.once:
+        report = scheduler.run_once(respect_window=False)
+        print(json.dumps({k: v for k, v in report.items() if k != 'tenants'}, ensure_ascii=False, indent=2))
+    else:
+        scheduler.run_forever()
+
+if __name__ == "__main__":
+    main()
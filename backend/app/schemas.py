@@ -8,6 +8,7 @@ class UserBase(BaseModel):
     username: str
     store_name: Optional[str] = None
     postal_code: Optional[str] = None
+    model_engine: Optional[str] = None
 
 class UserCreate(UserBase):
     password: str
@@ -16,6 +17,7 @@ class UserUpdate(BaseModel):
     username: Optional[str] = None
     store_name: Optional[str] = None
     postal_code: Optional[str] = None
+    model_engine: Optional[str] = None  # random_forest / hist_gradient_boosting / xgboost
     password: Optional[str] = None
 
 class UserResponse(UserBase):
@@ -40,6 +42,7 @@ class TokenResponse(BaseModel):
 # データ関連スキーマ
 class UserDataResponse(BaseModel):
     id: int
+    store_id: Optional[str] = None
     date: datetime
     weather: Optional[str]
     sales: float
@@ -60,6 +63,7 @@ class UserDataStats(BaseModel):
 # 予測履歴スキーマ
 class PredictionHistoryResponse(BaseModel):
     id: int
+    store_id: Optional[str] = None
     prediction_date: datetime
     predicted_sales: float
     predicted_customers: int
@@ -74,6 +78,14 @@ class PredictionHistoryResponse(BaseModel):
 class UserPredictionRequest(BaseModel):
     date: str
     postal_code: Optional[str] = None  # ユーザーのデフォルト郵便番号を使用
+    store_id: Optional[str] = None  # 複数店舗の場合に予測対象店舗を指定（省略すると全店舗の合計）
+
+# 複数日予測リクエスト
+class HorizonPredictionRequest(BaseModel):
+    start_date: str
+    days: int = 7  # 1〜14日
+    postal_code: Optional[str] = None
+    store_id: Optional[str] = None
 
 # ダッシュボード統計
 class DashboardStats(BaseModel):
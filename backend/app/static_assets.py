@@ -0,0 +1,165 @@
+"""フロントエンドのビルド成果物の配信
+
+ビルド時に作った gzip / brotli 版（main.xxxx.js.gz / .br）を Accept-Encoding に応じて返し、
+ファイル名にハッシュを含むファイルは内容が変わらないので長期間（immutable）キャッシュさせる。
+index.html はメモリに保持し、ETag で再検証させる。
+
+圧縮版はビルド後に作成する（brotli が入っていなければ gzip のみ）:
+
+    cd backend
+    python -m app.static_assets static
+"""
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Dict, Optional, Set
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.staticfiles import NotModifiedResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 圧縮版を作る拡張子と最小サイズ（小さいファイルは圧縮してもほとんど減らない）
+COMPRESSIBLE_EXTENSIONS = ('.js', '.css', '.html', '.json', '.map', '.svg', '.txt')
+MIN_COMPRESS_BYTES = 1024
+
+# 優先順（Accept-Encoding の値, 拡張子）
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# CRA のビルドは main.1f39d3a5.css のように内容のハッシュをファイル名に含む
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+def accepted_encodings(accept_encoding: str) -> Set[str]:
+    """Accept-Encoding ヘッダーから受け付けるエンコーディング（q=0 は除く）"""
+    encodings = set()
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        quality = params.strip().removeprefix('q=')
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            pass
+        if name.strip():
+            encodings.add(name.strip().lower())
+    return encodings
+
+def precompress_directory(directory: str, min_bytes: int = MIN_COMPRESS_BYTES) -> Dict[str, int]:
+    """ディレクトリ以下の圧縮対象ファイルの gzip / brotli 版を作成（元ファイルより新しいものは作り直さない）"""
+    stats = {'files': 0, 'original_bytes': 0, 'gzip_bytes': 0, 'brotli_bytes': 0}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            size = os.path.getsize(path)
+            if size < min_bytes:
+                continue
+
+            with open(path, 'rb') as f:
+                content = f.read()
+            stats['files'] += 1
+            stats['original_bytes'] += size
+
+            variants = [('.gz', 'gzip_bytes', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append(('.br', 'brotli_bytes', lambda data: brotli.compress(data, quality=11)))
+            for suffix, key, compress in variants:
+                target = path + suffix
+                if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(path):
+                    with open(target, 'wb') as f:
+                        f.write(compress(content))
+                stats[key] += os.path.getsize(target)
+    return stats
+
+class PrecompressedStaticFiles(StaticFiles):
+    """圧縮版があればそれを返し、ハッシュ付きのファイル名には immutable を付ける StaticFiles"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 起動時に圧縮版の有無を調べておき、リクエストごとにファイルを探さない
+        self.variants: Set[str] = set()
+        if self.directory is not None and os.path.isdir(self.directory):
+            for root, _, names in os.walk(self.directory):
+                self.variants.update(
+                    os.path.realpath(os.path.join(root, name)) for name in names if name.endswith(('.br', '.gz'))
+                )
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        request = Request(scope)
+        path = str(full_path)
+        headers = {
+            'Cache-Control': IMMUTABLE_CACHE_CONTROL if HASHED_NAME.search(os.path.basename(path))
+                             else REVALIDATE_CACHE_CONTROL
+        }
+
+        if path.endswith(COMPRESSIBLE_EXTENSIONS):
+            headers['Vary'] = 'Accept-Encoding'
+            accepted = accepted_encodings(request.headers.get('accept-encoding', ''))
+            for encoding, suffix in ENCODINGS:
+                variant = os.path.realpath(path) + suffix
+                if encoding in accepted and variant in self.variants:
+                    response = FileResponse(
+                        variant, status_code=status_code, stat_result=os.stat(variant),
+                        media_type=mimetypes.guess_type(path)[0], headers={**headers, 'Content-Encoding': encoding}
+                    )
+                    break
+            else:
+                response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        else:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+
+        if self.is_not_modified(response.headers, request.headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+class IndexPage:
+    """メモリに保持した index.html（圧縮版と ETag も起動時に作る）"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            content = f.read()
+        self.etag = '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+        self.bodies: Dict[Optional[str], bytes] = {None: content, 'gzip': gzip.compress(content, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(content)
+
+    def response(self, request: Request) -> Response:
+        """If-None-Match が一致すれば 304、それ以外は受け付けるエンコーディングで本文を返す"""
+        # ビルド時の圧縮（main）ではDBの設定を読み込まないよう使う時点で読み込む
+        from .etag import encoded_etag, etag_matches
+
+        accepted = accepted_encodings(request.headers.get('accept-encoding', ''))
+        encoding = next((name for name, _ in ENCODINGS if name in accepted and name in self.bodies), None)
+        # エンコーディングごとに本文が違うので ETag も分ける
+        etag = encoded_etag(self.etag, encoding)
+        headers = {'ETag': etag, 'Cache-Control': REVALIDATE_CACHE_CONTROL, 'Vary': 'Accept-Encoding'}
+
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+        return Response(content=self.bodies[encoding], media_type='text/html', headers=headers)
+
+def main():
+    parser = argparse.ArgumentParser(description="フロントエンドのビルド成果物の gzip / brotli 版を作成")
+    parser.add_argument('directory', help="ビルド成果物のディレクトリ（例: static）")
+    parser.add_argument('--min-bytes', type=int, default=MIN_COMPRESS_BYTES)
+    args = parser.parse_args()
+
+    stats = precompress_directory(args.directory, args.min_bytes)
+    print(f"{stats['files']}ファイル {stats['original_bytes'] / 1024:.0f}KB → gzip {stats['gzip_bytes'] / 1024:.0f}KB"
+          + (f" / brotli {stats['brotli_bytes'] / 1024:.0f}KB" if brotli is not None else "（brotli 未インストール）"))
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,109 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Tuple, Dict, Any, Optional
+from typing import Tuple, Dict, Any, Optional, List, Union
+from concurrent.futures import ProcessPoolExecutor
+from decouple import config
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+import hashlib
 import io
+import json
 import os
 import pickle
+import zipfile
 
-from .user_models import User, UserData, UserModel
-from .models import SalesPredictionModel
+from .user_models import User, UserData, UserModel, UserDataSnapshot, UserDataVersion
+from .models import SalesPredictionModel, StoreShardedModel, UnknownStoreError, DEFAULT_ENGINE, INCREMENTAL_MAX_UPDATES
+from .feature_store import FeatureStore
+from .data_processor import FEATURE_SPEC, compact_dtypes
+from .prediction_cache import prediction_cache
+from .memory_monitor import memory_monitor, init_worker_memory, check_worker_memory
+
+# 予測用スナップショットに保持する直近日数（履歴特徴量の計算に必要な行数以上）
+SNAPSHOT_DAYS = max(30, FEATURE_SPEC.history_rows)
+
+# 訓練モード（auto: 可能なら差分再訓練、full: 常に全件で再訓練）
+TRAINING_MODES = ('auto', 'full')
+
+# 一括アップロード：CSVを並列に解析するプロセス数、ファイル数と展開後サイズの上限
+UPLOAD_PARSE_WORKERS = config('UPLOAD_PARSE_WORKERS', default=os.cpu_count() or 1, cast=int)
+BULK_UPLOAD_MAX_FILES = config('BULK_UPLOAD_MAX_FILES', default=500, cast=int)
+BULK_UPLOAD_MAX_BYTES = config('BULK_UPLOAD_MAX_BYTES', default=500 * 1024 * 1024, cast=int)
+
+# DBへの一括挿入で1回に送る行数
+INSERT_CHUNK_ROWS = 5000
+
+# 差分保存で比較する列（店舗×月ごとにこの列の値をハッシュする）
+PARTITION_HASH_COLUMNS = [
+    'store_id', 'store_name', 'date', 'weather', 'sales', 'target_achievement_rate',
+    'yoy_same_day_ratio', 'customers', 'avg_spending', 'labor_cost_rate', 'cost_rate'
+]
+
+def partition_hashes(df: pd.DataFrame) -> Dict[str, str]:
+    """店舗×月ごとの行内容のハッシュ {"店舗ID|YYYY-MM": sha1}"""
+    if len(df) == 0:
+        return {}
+    
+    ordered = df.sort_values(['store_id', 'date'], kind='stable')
+    columns = [col for col in PARTITION_HASH_COLUMNS if col in ordered.columns]
+    row_hashes = pd.util.hash_pandas_object(ordered[columns], index=False).to_numpy()
+    keys = ordered['store_id'].astype(str).to_numpy() + '|' + ordered['date'].dt.strftime('%Y-%m').to_numpy()
+    
+    groups = pd.Series(np.arange(len(keys))).groupby(keys, sort=True).indices
+    return {key: hashlib.sha1(row_hashes[idx].tobytes()).hexdigest() for key, idx in groups.items()}
+
+def _partition_range(key: str) -> Tuple[str, datetime, datetime]:
+    """パーティションキー → (店舗ID, 月初, 翌月初)"""
+    store_id, month = key.rsplit('|', 1)
+    start = datetime.strptime(month, '%Y-%m')
+    end = (start + timedelta(days=32)).replace(day=1)
+    return store_id, start, end
+
+def _parse_csv_file(item: Tuple[str, bytes]) -> Tuple[str, pd.DataFrame]:
+    """1ファイル分のCSV解析（プロセスプールから呼ばれる）"""
+    from .data_processor import DataProcessor
+    name, content = item
+    # 上限の超過はファイルの解析エラーに包まない（プロセス間では例外の連鎖が残らない）
+    check_worker_memory()
+    try:
+        df = DataProcessor().process_csv_data(content)
+    except Exception as e:
+        raise Exception(f"{name}: {str(e)}")
+    check_worker_memory()
+    return name, df
+
+def expand_upload_files(files: List[Tuple[str, bytes]]) -> List[Tuple[str, bytes]]:
+    """アップロードされたファイルのうちZIPを展開し、(ファイル名, CSVの中身) の一覧にする"""
+    expanded = []
+    total_bytes = 0
+    for name, content in files:
+        if zipfile.is_zipfile(io.BytesIO(content)):
+            with zipfile.ZipFile(io.BytesIO(content)) as archive:
+                members = sorted(
+                    (info for info in archive.infolist()
+                     if not info.is_dir() and info.filename.lower().endswith('.csv')
+                     and not info.filename.startswith('__MACOSX/')),
+                    key=lambda info: info.filename
+                )
+                for info in members:
+                    # 展開前に宣言サイズで上限を確認する（ZIP爆弾対策）
+                    total_bytes += info.file_size
+                    if total_bytes > BULK_UPLOAD_MAX_BYTES:
+                        raise Exception(f"展開後のサイズが上限（{BULK_UPLOAD_MAX_BYTES // 1024 // 1024}MB）を超えています")
+                    expanded.append((f"{name}/{info.filename}", archive.read(info)))
+        else:
+            total_bytes += len(content)
+            if total_bytes > BULK_UPLOAD_MAX_BYTES:
+                raise Exception(f"ファイルの合計サイズが上限（{BULK_UPLOAD_MAX_BYTES // 1024 // 1024}MB）を超えています")
+            expanded.append((name, content))
+        
+        if len(expanded) > BULK_UPLOAD_MAX_FILES:
+            raise Exception(f"ファイル数が上限（{BULK_UPLOAD_MAX_FILES}件）を超えています")
+    
+    if not expanded:
+        raise Exception("CSVファイルがありません")
+    return expanded
 
 class UserDataProcessor:
     def __init__(self, user_id: int, db: Session):
@@ -16,8 +111,10 @@ class UserDataProcessor:
         self.db = db
         self.data = None
         self.processed_data = None
+        self.feature_store = FeatureStore(user_id)
         
-    def process_user_csv_data(self, csv_content: bytes) -> pd.DataFrame:
+    @memory_monitor.job('upload')
+    def process_user_csv_data(self, csv_content: bytes, content_hash: Optional[str] = None) -> pd.DataFrame:
         """ユーザーのCSVデータを処理してデータベースに保存"""
         try:
             # 既存のデータ処理ロジックを使用
@@ -25,114 +122,403 @@ class UserDataProcessor:
             processor = DataProcessor()
             df = processor.process_csv_data(csv_content)
             
-            # データベースに保存
-            self._save_to_database(df)
-            
-            self.data = df
+            self._store_data(df, content_hash)
             return df
             
         except Exception as e:
             raise Exception(f"ユーザーCSV処理エラー: {str(e)}")
     
-    def _save_to_database(self, df: pd.DataFrame):
-        """DataFrameをデータベースに保存"""
-        # 既存のユーザーデータを削除（新しいデータで置き換え）
-        self.db.query(UserData).filter(UserData.user_id == self.user_id).delete()
+    @memory_monitor.job('upload')
+    def upload_user_csv(self, csv_content: bytes) -> Dict[str, Any]:
+        """CSVを取り込みアップロード結果を返す（前回と同じファイルなら解析せずに前回の結果を返す）"""
+        content_hash = hashlib.sha256(csv_content).hexdigest()
+        state = self._get_data_version()
+        if state is not None and state.content_hash == content_hash and state.upload_result \
+                and state.synced_version == state.version:
+            return {**json.loads(state.upload_result), 'unchanged': True, 'data_version': state.version}
         
-        # 新しいデータを挿入
-        for _, row in df.iterrows():
-            # 数値型の値を適切に処理（NaNをNoneに変換）
-            user_data = UserData(
-                user_id=self.user_id,
-                store_id=str(row.get('store_id', 'default')),
-                store_name=str(row.get('store_name', '店舗名なし')),
-                date=row['date'],
-                weather=str(row.get('weather', 'unknown')),
-                sales=float(row['sales']) if pd.notna(row['sales']) else 0.0,
-                target_achievement_rate=float(row.get('target_achievement_rate', 100.0)) if pd.notna(row.get('target_achievement_rate')) else 100.0,
-                yoy_same_day_ratio=float(row.get('yoy_same_day_ratio', 100.0)) if pd.notna(row.get('yoy_same_day_ratio')) else 100.0,
-                customers=int(row['customers']) if pd.notna(row['customers']) else 0,
-                avg_spending=float(row.get('avg_spending', 0.0)) if pd.notna(row.get('avg_spending')) else 0.0,
-                labor_cost_rate=float(row.get('labor_cost_rate', 30.0)) if pd.notna(row.get('labor_cost_rate')) else 30.0,
-                cost_rate=float(row.get('cost_rate', 30.0)) if pd.notna(row.get('cost_rate')) else 30.0
+        df = self.process_user_csv_data(csv_content, content_hash)
+        result = self.upload_result(df)
+        
+        state = self._get_data_version()
+        state.upload_result = json.dumps(result, ensure_ascii=False, default=str)
+        self.db.commit()
+        return {**result, 'unchanged': False, 'data_version': state.version}
+    
+    def upload_result(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """アップロードのレスポンス（件数・期間・統計情報）"""
+        return {
+            'records_count': len(df),
+            'date_range': {
+                'start': df['date'].min().strftime('%Y-%m-%d'),
+                'end': df['date'].max().strftime('%Y-%m-%d')
+            },
+            'stats': self.get_user_stats()
+        }
+    
+    def _get_data_version(self) -> Optional[UserDataVersion]:
+        return self.db.query(UserDataVersion).filter(UserDataVersion.user_id == self.user_id).first()
+    
+    @memory_monitor.job('bulk_upload')
+    def process_user_csv_files(self, files: List[Tuple[str, bytes]], replace: bool = False) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """複数のCSV・ZIPをまとめて取り込む（並列に解析し、(store_id, date) で重複を除いて保存）
+        
+        同じ店舗・日付の行は後のファイルを優先する。replace=False では既存データに統合する。
+        """
+        try:
+            items = expand_upload_files(files)
+            
+            workers = min(UPLOAD_PARSE_WORKERS, len(items))
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers, initializer=init_worker_memory,
+                                         initargs=(memory_monitor.worker_limit_bytes(),)) as executor:
+                    parsed = list(executor.map(_parse_csv_file, items))
+            else:
+                parsed = [_parse_csv_file(item) for item in items]
+            
+            frames = [frame for _, frame in parsed]
+            existing_rows = 0
+            if not replace:
+                existing = self.load_user_data()
+                if existing is not None:
+                    existing_rows = len(existing)
+                    frames.insert(0, existing)
+            
+            # カテゴリの値がファイルごとに違うので文字列に戻してから結合する
+            combined = pd.concat(
+                [frame.astype({col: str for col in ('store_id', 'store_name', 'weather')}) for frame in frames],
+                ignore_index=True
             )
-            self.db.add(user_data)
+            parsed_rows = len(combined) - existing_rows
+            df = combined.drop_duplicates(subset=['store_id', 'date'], keep='last')\
+                .sort_values(['store_id', 'date'], kind='stable')\
+                .reset_index(drop=True)
+            df = compact_dtypes(df)
+            
+            partitions = self._store_data(df)
+            
+            return df, {
+                **partitions,
+                'files': [{'name': name, 'rows': len(frame)} for name, frame in parsed],
+                'parsed_rows': parsed_rows,
+                'duplicate_rows': len(combined) - len(df),
+                'existing_rows': existing_rows,
+                'total_rows': len(df),
+                'replaced': replace
+            }
+            
+        except Exception as e:
+            raise Exception(f"一括アップロード処理エラー: {str(e)}")
+    
+    def _store_data(self, df: pd.DataFrame, content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """処理済みデータを保存し、特徴量ストア・スナップショット・キャッシュを更新
+        
+        店舗×月ごとのハッシュを前回と比べ、変わったパーティションの行だけを書き換える。
+        後処理が終わったバージョンを synced_version に記録し、途中で失敗したら次の取り込みでやり直す。
+        """
+        hashes = partition_hashes(df)
+        state = self._get_data_version()
+        previous = json.loads(state.partition_hashes) if state is not None else None
+        self.data = df
+        
+        if previous is None:
+            # 初回（または以前のバージョンで保存したデータ）は全件を書き込む
+            changed, removed = sorted(hashes), []
+            self._save_to_database(df, commit=False)
+        else:
+            changed = sorted(key for key, value in hashes.items() if previous.get(key) != value)
+            removed = sorted(set(previous) - set(hashes))
+            if changed or removed:
+                self._save_partitions(df, changed + removed)
+        
+        if state is None:
+            state = UserDataVersion(user_id=self.user_id, version=0)
+            self.db.add(state)
+        data_changed = previous is None or bool(changed or removed)
+        if data_changed:
+            state.version += 1
+        state.content_hash = content_hash
+        state.partition_hashes = json.dumps(hashes)
+        state.upload_result = None
+        
+        try:
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        
+        # 前回の後処理が失敗していれば、データが変わっていなくてもここでやり直す
+        if data_changed or state.synced_version != state.version:
+            # コミット済みのデータに合わせる後処理はメモリ上限を超えても途中で止めない
+            with memory_monitor.no_abort():
+                # 特徴量ストアを更新（新しい日付だけ追記）
+                self.feature_store.sync(df)
+                
+                # 予測用の直近スナップショットを更新
+                self._save_snapshot(df)
+                
+                # データが変わったので予測キャッシュを破棄
+                prediction_cache.invalidate_user(self.user_id)
+            
+            state.synced_version = state.version
+            self.db.commit()
+        
+        return {'changed_partitions': len(changed), 'removed_partitions': len(removed), 'total_partitions': len(hashes)}
+    
+    @memory_monitor.stage('save_partitions')
+    def _save_partitions(self, df: pd.DataFrame, keys: List[str]):
+        """指定した店舗×月の行を削除し、dfにある行を挿入（コミットは呼び出し側）"""
+        from sqlalchemy import and_, delete, or_
+        
+        ranges = [_partition_range(key) for key in keys]
+        for offset in range(0, len(ranges), 500):
+            self.db.execute(delete(UserData).where(
+                UserData.user_id == self.user_id,
+                or_(*[
+                    and_(UserData.store_id == store_id, UserData.date >= start, UserData.date < end)
+                    for store_id, start, end in ranges[offset:offset + 500]
+                ])
+            ))
+        
+        months = df['date'].dt.strftime('%Y-%m')
+        row_keys = df['store_id'].astype(str) + '|' + months
+        self._insert_rows(df[row_keys.isin(set(keys)).to_numpy()])
+    
+    @memory_monitor.stage('save_to_database')
+    def _save_to_database(self, df: pd.DataFrame, commit: bool = True):
+        """DataFrameをデータベースに保存（既存データの削除と一括挿入を1トランザクションで行う）"""
+        try:
+            # 既存のユーザーデータを削除（新しいデータで置き換え）
+            self.db.query(UserData).filter(UserData.user_id == self.user_id).delete()
+            self._insert_rows(df)
+            if commit:
+                self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+    
+    def _insert_rows(self, df: pd.DataFrame):
+        """DataFrameの行を一括挿入（コミットは呼び出し側）"""
+        # 列がない・欠損している場合の既定値
+        defaults = {
+            'store_id': 'default', 'store_name': '店舗名なし', 'weather': 'unknown',
+            'sales': 0.0, 'target_achievement_rate': 100.0, 'yoy_same_day_ratio': 100.0,
+            'customers': 0, 'avg_spending': 0.0, 'labor_cost_rate': 30.0, 'cost_rate': 30.0
+        }
+        columns = {'user_id': np.full(len(df), self.user_id), 'date': df['date'].to_numpy()}
+        for col, default in defaults.items():
+            if col not in df.columns:
+                columns[col] = np.full(len(df), default, dtype=object)
+            elif isinstance(default, str):
+                columns[col] = df[col].astype(object).where(df[col].notna(), default).astype(str).to_numpy()
+            elif isinstance(default, int):
+                columns[col] = df[col].fillna(default).astype(np.int64).to_numpy()
+            else:
+                columns[col] = df[col].astype(np.float64).fillna(default).to_numpy()
+        records = pd.DataFrame(columns).to_dict('records')
+        
+        for offset in range(0, len(records), INSERT_CHUNK_ROWS):
+            self.db.execute(insert(UserData), records[offset:offset + INSERT_CHUNK_ROWS])
+    
+    def _save_snapshot(self, df: pd.DataFrame):
+        """店舗ごとの直近N日分の売上・客数をJSONで保存"""
+        import json
+        
+        recent = df.assign(store_id=df['store_id'].astype(str))\
+            .sort_values('date', kind='stable')\
+            .groupby('store_id', sort=False)\
+            .tail(SNAPSHOT_DAYS)
+        
+        self.db.query(UserDataSnapshot).filter(UserDataSnapshot.user_id == self.user_id).delete()
+        
+        for store_id, rows in recent.groupby('store_id', sort=False):
+            self.db.add(UserDataSnapshot(
+                user_id=self.user_id,
+                store_id=store_id,
+                snapshot=json.dumps({
+                    'dates': rows['date'].dt.strftime('%Y-%m-%d').tolist(),
+                    'sales': rows['sales'].astype(float).tolist(),
+                    'customers': rows['customers'].astype(float).tolist()
+                }),
+                last_date=rows['date'].max().to_pydatetime()
+            ))
         
         self.db.commit()
     
+    def load_snapshot(self, store_id: Optional[str] = None) -> Optional[pd.DataFrame]:
+        """直近スナップショットを小さなDataFrameとして取得"""
+        import json
+        
+        query = self.db.query(UserDataSnapshot).filter(UserDataSnapshot.user_id == self.user_id)
+        if store_id is not None:
+            query = query.filter(UserDataSnapshot.store_id == store_id)
+        snapshots = query.all()
+        
+        if not snapshots:
+            return None
+        
+        frames = []
+        for snapshot in snapshots:
+            data = json.loads(snapshot.snapshot)
+            frames.append(pd.DataFrame({
+                'store_id': snapshot.store_id,
+                'date': pd.to_datetime(data['dates']),
+                'sales': data['sales'],
+                'customers': data['customers']
+            }))
+        
+        return pd.concat(frames, ignore_index=True).sort_values('date', kind='stable')
+    
+    @memory_monitor.stage('load_user_data')
     def load_user_data(self) -> Optional[pd.DataFrame]:
         """データベースからユーザーデータを読み込み"""
-        user_data = self.db.query(UserData).filter(UserData.user_id == self.user_id).all()
+        # ORMオブジェクトを作らずに必要なカラムだけ取得
+        columns = [
+            UserData.store_id, UserData.store_name, UserData.date, UserData.weather,
+            UserData.sales, UserData.target_achievement_rate, UserData.yoy_same_day_ratio,
+            UserData.customers, UserData.avg_spending, UserData.labor_cost_rate, UserData.cost_rate
+        ]
+        rows = self.db.query(*columns).filter(UserData.user_id == self.user_id).all()
         
-        if not user_data:
+        if not rows:
             return None
         
-        # DataFrameに変換
-        data_list = []
-        for data in user_data:
-            data_dict = {
-                'store_id': data.store_id,
-                'store_name': data.store_name,
-                'date': data.date,
-                'weather': data.weather,
-                'sales': data.sales,
-                'target_achievement_rate': data.target_achievement_rate,
-                'yoy_same_day_ratio': data.yoy_same_day_ratio,
-                'customers': data.customers,
-                'avg_spending': data.avg_spending,
-                'labor_cost_rate': data.labor_cost_rate,
-                'cost_rate': data.cost_rate
-            }
-            data_list.append(data_dict)
-        
-        df = pd.DataFrame(data_list)
+        # DataFrameに変換（店舗・天気はカテゴリ型、数値は小さい型）
+        df = compact_dtypes(pd.DataFrame.from_records(rows, columns=[c.key for c in columns]))
         self.data = df
         return df
     
     def create_user_features(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
-        """ユーザーデータから特徴量を作成"""
-        if self.data is None:
-            self.load_user_data()
-        
-        if self.data is None or len(self.data) == 0:
-            raise Exception("ユーザーデータが存在しません")
-        
-        # 既存の特徴量エンジニアリングロジックを使用
-        from .data_processor import DataProcessor
-        processor = DataProcessor()
-        processor.data = self.data
+        """特徴量ストアから特徴量を取得（未作成ならユーザーデータから構築）"""
+        if not self.feature_store.exists():
+            if self.data is None:
+                self.load_user_data()
+            
+            if self.data is None or len(self.data) == 0:
+                raise Exception("ユーザーデータが存在しません")
+            
+            self.feature_store.rebuild(self.data)
         
-        return processor.create_features(self.data)
+        self.processed_data = self.feature_store.load()
+        return self.feature_store.get_training_data()
     
-    def train_user_model(self) -> Dict[str, Any]:
-        """ユーザー専用モデルを訓練"""
+    @memory_monitor.job('train')
+    def train_user_model(self, mode: str = 'auto', max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """ユーザー専用モデルを訓練（auto では前回の訓練後に増えた行だけで差分再訓練を試みる）"""
         try:
+            if mode not in TRAINING_MODES:
+                raise ValueError(f"未対応の訓練モードです: {mode}")
+            
             # 特徴量作成
             features, targets = self.create_user_features()
             
             if len(features) < 10:
                 raise Exception("訓練には最低10件のデータが必要です")
             
-            # モデル訓練
-            model = SalesPredictionModel()
-            metrics = model.train(features, targets)
+            store_ids = self.processed_data['store_id']
+            dates = self.processed_data['date']
+            engine = self.get_model_engine()
+            
+            model, metrics, reason = None, None, 'requested'
+            if mode == 'auto':
+                model, metrics, reason = self._update_user_model(features, targets, store_ids, dates, engine)
+            
+            if metrics is None:
+                # モデル訓練（ユーザー設定の学習エンジンを使用）
+                if store_ids.nunique() > 1:
+                    # 複数店舗の場合は店舗ごとにモデルを分割して並列訓練
+                    model = StoreShardedModel(engine=engine, max_workers=max_workers)
+                    metrics = model.train(features, targets, store_ids)
+                else:
+                    model = SalesPredictionModel(engine=engine)
+                    metrics = model.train(features, targets)
+                metrics.update({'mode': 'full', 'full_retrain_reason': reason})
+            
+            # 次回の差分再訓練のために訓練済みの範囲を記録
+            model.trained_until = dates.max()
+            model.training_rows = len(features)
+            model.feature_spec = FEATURE_SPEC.key
             
             # モデル保存
             model_dir = f"models/users/{self.user_id}"
             os.makedirs(model_dir, exist_ok=True)
             model_path = f"{model_dir}/sales_model.pkl"
             
-            with open(model_path, 'wb') as f:
+            # 予測中のリクエストが書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える
+            import uuid
+            temp_path = f"{model_path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, 'wb') as f:
                 pickle.dump(model, f)
+            os.replace(temp_path, model_path)
             
             # データベースにモデル情報を保存
             self._save_model_info(model_path, metrics, len(features))
             
+            # モデルが変わったので予測キャッシュを破棄
+            prediction_cache.invalidate_user(self.user_id)
+            
             return metrics
             
         except Exception as e:
             raise Exception(f"ユーザーモデル訓練エラー: {str(e)}")
     
+    def _update_user_model(self, features: pd.DataFrame, targets: pd.DataFrame, store_ids: pd.Series,
+                           dates: pd.Series, engine: str) -> Tuple[Any, Optional[Dict[str, Any]], str]:
+        """差分再訓練を試みる（できなければ (None, None, 全件再訓練の理由)）"""
+        previous = self.load_user_model()
+        if previous is None:
+            return None, None, 'no_model'
+        if previous.engine != engine or not previous.can_update():
+            return None, None, 'engine'
+        if previous.trained_until is None:
+            return None, None, 'no_history'
+        # 特徴量の定義が変わっていれば過去の行の特徴量も変わる
+        if previous.feature_spec != FEATURE_SPEC.key:
+            return None, None, 'feature_spec'
+        if previous.update_count >= INCREMENTAL_MAX_UPDATES:
+            return None, None, 'scheduled'
+        # 単一店舗と複数店舗が切り替わった場合はモデルの種類が変わる
+        if isinstance(previous, StoreShardedModel) != (store_ids.nunique() > 1):
+            return None, None, 'store_layout'
+        
+        new_mask = (dates > previous.trained_until).to_numpy()
+        # 訓練済みの期間の行数が変わっていれば過去データが差し替えられている
+        if len(features) - new_mask.sum() != previous.training_rows:
+            return None, None, 'history_changed'
+        if not new_mask.any():
+            return None, None, 'no_new_rows'
+        
+        if isinstance(previous, StoreShardedModel):
+            metrics = previous.update(features, targets, store_ids, new_mask)
+        else:
+            metrics = previous.update(features, targets, new_mask)
+        if metrics is None:
+            return None, None, 'drift'
+        return previous, metrics, None
+    
+    def backtest_user_model(self, n_folds: int = 50, horizon_days: int = 7) -> Dict[str, Any]:
+        """ユーザーデータでウォークフォワード・バックテストを実行"""
+        if self.data is None:
+            self.load_user_data()
+        
+        if self.data is None or len(self.data) == 0:
+            raise Exception("ユーザーデータが存在しません")
+        
+        from .backtest import WalkForwardBacktester
+        backtester = WalkForwardBacktester(
+            n_folds=n_folds,
+            horizon_days=horizon_days,
+            engine=self.get_model_engine()
+        )
+        return backtester.run(self.data)
+    
+    def get_model_engine(self) -> str:
+        """ユーザーが設定した学習エンジンを取得"""
+        user = self.db.query(User).filter(User.id == self.user_id).first()
+        if user is None or not user.model_engine:
+            return DEFAULT_ENGINE
+        return user.model_engine
+    
     def _save_model_info(self, model_path: str, metrics: Dict[str, Any], data_count: int):
         """モデル情報をデータベースに保存"""
         import json
@@ -152,7 +538,7 @@ class UserDataProcessor:
         self.db.add(user_model)
         self.db.commit()
     
-    def load_user_model(self) -> Optional[SalesPredictionModel]:
+    def load_user_model(self) -> Optional[Union[SalesPredictionModel, StoreShardedModel]]:
         """ユーザー専用モデルを読み込み"""
         model_info = self.db.query(UserModel)\
             .filter(UserModel.user_id == self.user_id)\
@@ -190,6 +576,17 @@ class UserDataProcessor:
             .count()
         return count > 0
     
+    def get_model_version(self) -> Optional[str]:
+        """モデルのバージョン（再訓練ごとに変わる）。モデルがなければNone"""
+        model_info = self.db.query(UserModel)\
+            .filter(UserModel.user_id == self.user_id)\
+            .first()
+        
+        if model_info is None or not os.path.exists(model_info.model_path):
+            return None
+        
+        return f"{model_info.id}:{model_info.created_at}:{os.path.getmtime(model_info.model_path)}"
+    
     def has_model(self) -> bool:
         """ユーザーモデルが存在するかチェック"""
         model_info = self.db.query(UserModel)\
@@ -198,30 +595,148 @@ class UserDataProcessor:
         
         return model_info is not None and os.path.exists(model_info.model_path)
     
-    def predict_sales(self, prediction_date: datetime, weather_data: dict) -> Tuple[float, int, Dict[str, float]]:
-        """ユーザーモデルで売上予測"""
+    def predict_sales(self, prediction_date: datetime, weather_data: dict, store_id: Optional[str] = None,
+                      weather_by_date: Optional[Dict[str, str]] = None) -> Tuple[float, int, Dict[str, float]]:
+        """ユーザーモデルで売上予測（複数店舗のモデルで store_id がなければ全店舗の合計）
+        
+        weather_by_date はデータの最終日から予測日の前日までを埋めるときに使う天気（なければ不明）。
+        """
         model = self.load_user_model()
         if model is None:
             raise Exception("ユーザーモデルが訓練されていません")
         
-        # 特徴量作成
-        features = self._create_prediction_features(prediction_date, weather_data)
+        if self._is_store_total(model, store_id):
+            results = [
+                self._predict_store(model.get_store_model(sid), prediction_date, weather_data, sid, weather_by_date)
+                for sid in model.get_store_ids()
+            ]
+            return (
+                float(sum(sales for sales, _, _ in results)),
+                int(sum(customers for _, customers, _ in results)),
+                {key: float(sum(confidence[key] for _, _, confidence in results)) for key in results[0][2]}
+            )
         
-        # 予測実行
-        return model.predict(features)
+        model, store_id = self._resolve_store_model(model, store_id)
+        return self._predict_store(model, prediction_date, weather_data, store_id, weather_by_date)
     
-    def _create_prediction_features(self, target_date: datetime, weather_data: dict) -> pd.DataFrame:
-        """予測用特徴量作成"""
-        # 既存のロジックを使用
-        from .data_processor import DataProcessor
-        processor = DataProcessor()
+    def _resolve_store_model(self, model: Any, store_id: Optional[str]) -> Tuple[SalesPredictionModel, Optional[str]]:
+        """予測に使う店舗のモデルと店舗IDを決める
         
-        # ユーザーの過去データを設定
-        if self.data is None:
-            self.load_user_data()
-        processor.processed_data = self.data
+        店舗別モデルで店舗の指定がなければ、モデルを持つ唯一の店舗の履歴で特徴量を作る
+        （訓練件数が足りない店舗はモデルがないため、データの店舗数より少ないことがある）。
+        """
+        if not isinstance(model, StoreShardedModel):
+            return model, store_id
+        if store_id is None:
+            store_model = model.get_store_model()
+            return store_model, model.get_store_ids()[0]
+        return model.get_store_model(store_id), store_id
+    
+    def _predict_store(self, model: SalesPredictionModel, prediction_date: datetime, weather_data: dict,
+                       store_id: Optional[str], weather_by_date: Optional[Dict[str, str]] = None
+                       ) -> Tuple[float, int, Dict[str, float]]:
+        """1店舗（単一店舗のモデル）の予測
+        
+        複数日予測と同じく、データの最終日から予測日の前日までは予測値で履歴を埋めてから予測する。
+        """
+        from .forecaster import HorizonForecaster
+        
+        target = prediction_date.strftime('%Y-%m-%d')
+        forecast = HorizonForecaster(model).forecast(
+            self._get_snapshot(store_id), prediction_date.date(), 1,
+            {**(weather_by_date or {}), target: weather_data.get('weather', '不明')}
+        )[0]
+        return forecast['predicted_sales'], forecast['predicted_customers'], forecast['confidence_interval']
+    
+    def _is_store_total(self, model: Any, store_id: Optional[str]) -> bool:
+        """全店舗の合計を予測するか（複数店舗のモデルで店舗の指定がない場合）
+        
+        信頼区間は各店舗の区間の上限・下限の和（店舗間の相関を考えない保守的な幅）。
+        """
+        return store_id is None and isinstance(model, StoreShardedModel) and len(model.store_models) > 1
+    
+    def forecast_horizon(self, start_date: datetime, days: int, weather_by_date: Dict[str, str],
+                         store_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """複数日の再帰予測"""
+        model = self.load_user_model()
+        if model is None:
+            raise Exception("ユーザーモデルが訓練されていません")
+        
+        from .forecaster import HorizonForecaster
+        
+        if self._is_store_total(model, store_id):
+            # 店舗ごとに再帰予測し、日付ごとに合計する
+            per_store = [
+                HorizonForecaster(model.get_store_model(sid))
+                    .forecast(self._get_snapshot(sid), start_date.date(), days, weather_by_date)
+                for sid in model.get_store_ids()
+            ]
+            return [
+                {
+                    **day,
+                    'predicted_sales': float(sum(f[i]['predicted_sales'] for f in per_store)),
+                    'predicted_customers': int(sum(f[i]['predicted_customers'] for f in per_store)),
+                    'confidence_interval': {
+                        key: float(sum(f[i]['confidence_interval'][key] for f in per_store))
+                        for key in day['confidence_interval']
+                    }
+                }
+                for i, day in enumerate(per_store[0])
+            ]
+        
+        model, store_id = self._resolve_store_model(model, store_id)
+        forecaster = HorizonForecaster(model)
+        return forecaster.forecast(self._get_snapshot(store_id), start_date.date(), days, weather_by_date)
+    
+    def _get_snapshot(self, store_id: Optional[str] = None) -> Optional[pd.DataFrame]:
+        """直近スナップショットを取得（ユーザーのスナップショットが1件もなければここで作成）"""
+        snapshot = self.load_snapshot(store_id)
+        if snapshot is not None:
+            return snapshot
         
-        return processor.create_prediction_features(target_date.date(), weather_data)
+        has_snapshot = self.db.query(UserDataSnapshot.id)\
+            .filter(UserDataSnapshot.user_id == self.user_id).first() is not None
+        if not has_snapshot:
+            # 旧バージョンでアップロードされたデータは一度だけここでスナップショットを作成
+            if self.data is None:
+                self.load_user_data()
+            if self.data is not None:
+                self._save_snapshot(self.data)
+                snapshot = self.load_snapshot(store_id)
+                has_snapshot = True
+        
+        # 他の店舗のスナップショットはあるのに見つからない店舗は、データにない店舗
+        if snapshot is None and has_snapshot and store_id is not None:
+            raise UnknownStoreError(f"店舗 {store_id} のデータがありません")
+        return snapshot
+    
+    def get_store_list(self) -> List[Dict[str, Any]]:
+        """ユーザーデータに含まれる店舗一覧"""
+        from sqlalchemy import func
+        
+        rows = self.db.query(
+            UserData.store_id,
+            func.max(UserData.store_name),
+            func.count(UserData.id),
+            func.min(UserData.date),
+            func.max(UserData.date)
+        ).filter(UserData.user_id == self.user_id)\
+            .group_by(UserData.store_id)\
+            .order_by(UserData.store_id)\
+            .all()
+        
+        return [
+            {
+                'store_id': store_id,
+                'store_name': store_name,
+                'records_count': count,
+                'date_range': {
+                    'start': start.strftime('%Y-%m-%d'),
+                    'end': end.strftime('%Y-%m-%d')
+                }
+            }
+            for store_id, store_name, count, start, end in rows
+        ]
     
     def delete_user_data(self):
         """ユーザーデータ・モデル・ファイルを完全削除"""
@@ -229,6 +744,9 @@ class UserDataProcessor:
             # データベースからデータ削除
             self.db.query(UserData).filter(UserData.user_id == self.user_id).delete()
             
+            # 特徴量ストア削除
+            self.feature_store.clear()
+            
             # モデル情報を取得してファイル削除
             model_info = self.db.query(UserModel).filter(UserModel.user_id == self.user_id).first()
             if model_info and os.path.exists(model_info.model_path):
@@ -241,11 +759,18 @@ class UserDataProcessor:
             # データベースからモデル情報削除
             self.db.query(UserModel).filter(UserModel.user_id == self.user_id).delete()
             
+            # 直近スナップショット削除
+            self.db.query(UserDataSnapshot).filter(UserDataSnapshot.user_id == self.user_id).delete()
+            
+            # 取り込み済み内容のハッシュ削除
+            self.db.query(UserDataVersion).filter(UserDataVersion.user_id == self.user_id).delete()
+            
             # 予測履歴削除
             from .user_models import PredictionHistory
             self.db.query(PredictionHistory).filter(PredictionHistory.user_id == self.user_id).delete()
             
             self.db.commit()
+            prediction_cache.invalidate_user(self.user_id)
             
             # インスタンス変数をリセット
             self.data = None
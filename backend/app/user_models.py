@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -13,6 +13,7 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     store_name = Column(String(200), nullable=True)  # 店舗名
     postal_code = Column(String(10), nullable=True)  # 郵便番号
+    model_engine = Column(String(50), nullable=True)  # 学習エンジン（未設定ならrandom_forest）
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -45,6 +46,11 @@ class UserData(Base):
     
     # リレーション
     user = relationship("User", back_populates="user_data")
+    
+    # キーセットページング用（user_id, date, id）
+    __table_args__ = (
+        Index("ix_user_data_user_date_id", "user_id", "date", "id"),
+    )
 
 class PredictionHistory(Base):
     """予測履歴テーブル"""
@@ -53,6 +59,7 @@ class PredictionHistory(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
+    store_id = Column(String(50), nullable=True)  # 予測対象店舗（単一店舗・全店舗の合計ならNone）
     prediction_date = Column(DateTime, nullable=False)  # 予測対象日
     predicted_sales = Column(Float, nullable=False)
     predicted_customers = Column(Integer, nullable=False)
@@ -67,6 +74,11 @@ class PredictionHistory(Base):
     
     # リレーション
     user = relationship("User", back_populates="prediction_history")
+    
+    # キーセットページング用（user_id, created_at, id）
+    __table_args__ = (
+        Index("ix_prediction_history_user_created_id", "user_id", "created_at", "id"),
+    )
 
 class UserModel(Base):
     """ユーザーごとの学習済みモデル"""
@@ -84,4 +96,38 @@ class UserModel(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # リレーション
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+class UserDataSnapshot(Base):
+    """店舗ごとの直近データ（予測用の履歴特徴量をこの行だけから作る）"""
+    __tablename__ = "user_data_snapshots"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    store_id = Column(String(50), nullable=True)
+    
+    # 直近N日分の {"dates": [...], "sales": [...], "customers": [...]}（日付昇順）
+    snapshot = Column(Text, nullable=False)
+    last_date = Column(DateTime, nullable=False)
+    
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class UserDataVersion(Base):
+    """ユーザーデータのバージョンと取り込み済み内容のハッシュ（同じアップロードの再処理を省く）"""
+    __tablename__ = "user_data_versions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, unique=True, index=True)
+    
+    # データが変わるたびに1つ増える
+    version = Column(Integer, nullable=False, default=1)
+    # 特徴量ストア・スナップショットの更新まで終わったバージョン（version と違えば次の取り込みで作り直す）
+    synced_version = Column(Integer, nullable=True)
+    # 直近にアップロードされたファイルのSHA-256（一括アップロードではNULL）
+    content_hash = Column(String(64), nullable=True)
+    # 店舗×月ごとの行のハッシュ {"店舗ID|YYYY-MM": "..."}（JSON）
+    partition_hashes = Column(Text, nullable=False)
+    # 直近のアップロード結果（同じファイルが再度アップロードされたときに返す、JSON）
+    upload_result = Column(Text, nullable=True)
+    
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
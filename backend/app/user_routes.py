@@ -1,14 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import timedelta
-from typing import List
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
 
-from .database import get_db
+from .database import get_db, get_async_db
 from .auth import (
     AuthService, authenticate_user, create_user, get_current_active_user,
     get_user_by_email, get_user_by_username
 )
 from .user_models import User, UserData, PredictionHistory
+from .pagination import keyset_page_async
+from .exporter import DataExporter
+from .etag import etag_matches, matching_etag, not_modified, set_etag, tenant_etag_async
+from .fast_json import json_response, rows_to_dicts
 from .schemas import (
     UserCreate, UserResponse, UserUpdate, LoginRequest, TokenResponse,
     UserDataResponse, PredictionHistoryResponse, DashboardStats
@@ -17,23 +25,23 @@ from .schemas import (
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
 @router.post("/register", response_model=TokenResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """ユーザー登録"""
     # 既存ユーザーチェック
-    if get_user_by_email(db, user_data.email):
+    if await get_user_by_email(db, user_data.email):
         raise HTTPException(
             status_code=400,
             detail="このメールアドレスは既に登録されています"
         )
     
-    if get_user_by_username(db, user_data.username):
+    if await get_user_by_username(db, user_data.username):
         raise HTTPException(
             status_code=400,
             detail="このユーザー名は既に使用されています"
         )
     
     # ユーザー作成
-    user = create_user(
+    user = await create_user(
         db=db,
         email=user_data.email,
         username=user_data.username,
@@ -55,9 +63,9 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
 
 @router.post("/login", response_model=TokenResponse)
-async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     """ログイン"""
-    user = authenticate_user(db, login_data.email, login_data.password)
+    user = await authenticate_user(db, login_data.email, login_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -86,12 +94,12 @@ async def get_current_user_info(current_user: User = Depends(get_current_active_
 async def update_current_user(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """現在のユーザー情報更新"""
+    """現在のユーザー情報更新（current_user は同じ非同期セッションで取得済み）"""
     # ユーザー名の重複チェック
     if user_update.username and user_update.username != current_user.username:
-        existing_user = get_user_by_username(db, user_update.username)
+        existing_user = await get_user_by_username(db, user_update.username)
         if existing_user:
             raise HTTPException(
                 status_code=400,
@@ -104,11 +112,19 @@ async def update_current_user(
         current_user.store_name = user_update.store_name
     if user_update.postal_code is not None:
         current_user.postal_code = user_update.postal_code
+    if user_update.model_engine is not None:
+        from .models import SUPPORTED_ENGINES
+        if user_update.model_engine not in SUPPORTED_ENGINES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"未対応の学習エンジンです。利用可能: {', '.join(SUPPORTED_ENGINES)}"
+            )
+        current_user.model_engine = user_update.model_engine
     if user_update.password:
-        current_user.hashed_password = AuthService.get_password_hash(user_update.password)
+        current_user.hashed_password = await asyncio.to_thread(AuthService.get_password_hash, user_update.password)
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
     
     return UserResponse.from_orm(current_user)
 
@@ -117,12 +133,22 @@ user_router = APIRouter(prefix="/api/user", tags=["user_data"])
 
 @user_router.get("/dashboard", response_model=DashboardStats)
 async def get_dashboard_stats(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """ダッシュボード統計情報取得"""
-    # ユーザーのデータ統計
-    user_data = db.query(UserData).filter(UserData.user_id == current_user.id).all()
+    """ダッシュボード統計情報取得（データ・予測履歴が変わっていなければ 304）"""
+    etag = await tenant_etag_async(db, request, 'dashboard', current_user.id, ('data', 'predictions'))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    
+    # ユーザーのデータ統計（集計に使うカラムだけ取得）
+    result = await db.execute(
+        select(UserData.date, UserData.sales, UserData.weather).where(UserData.user_id == current_user.id)
+    )
+    user_data = result.all()
     
     if not user_data:
         return DashboardStats(
@@ -142,10 +168,13 @@ async def get_dashboard_stats(
     }
     
     # 最新の予測
-    latest_prediction = db.query(PredictionHistory)\
-        .filter(PredictionHistory.user_id == current_user.id)\
-        .order_by(PredictionHistory.created_at.desc())\
-        .first()
+    result = await db.execute(
+        select(PredictionHistory)
+        .where(PredictionHistory.user_id == current_user.id)
+        .order_by(PredictionHistory.created_at.desc())
+        .limit(1)
+    )
+    latest_prediction = result.scalars().first()
     
     # 売上トレンド（月別）
     sales_by_month = {}
@@ -184,36 +213,102 @@ async def get_dashboard_stats(
 
 @user_router.get("/data", response_model=List[UserDataResponse])
 async def get_user_data(
+    request: Request,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to")
+):
+    """ユーザーデータ一覧取得（(date, id) のキーセットページング、次ページは X-Next-Cursor）"""
+    # DBの値をそのまま返すので行ごとのPydanticの検証は省き、レスポンスの項目の列だけ取得する
+    keys = list(UserDataResponse.model_fields)
+    statement = select(*(getattr(UserData, key) for key in keys)).where(UserData.user_id == current_user.id)
+    
+    if from_date:
+        statement = statement.where(UserData.date >= datetime.combine(from_date, time.min))
+    if to_date:
+        statement = statement.where(UserData.date < datetime.combine(to_date + timedelta(days=1), time.min))
+    
+    user_data, next_cursor = await keyset_page_async(
+        db, statement, UserData.date, UserData.id, cursor, limit, offset=skip, scalars=False
+    )
+    
+    return json_response(request, rows_to_dicts(user_data, keys),
+                         headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+@user_router.get("/stores")
+async def get_user_stores(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
 ):
-    """ユーザーデータ一覧取得"""
-    user_data = db.query(UserData)\
-        .filter(UserData.user_id == current_user.id)\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
-    
-    return [UserDataResponse.from_orm(data) for data in user_data]
+    """店舗一覧取得"""
+    from .user_data_processor import UserDataProcessor
+    user_processor = UserDataProcessor(current_user.id, db)
+    return await asyncio.to_thread(user_processor.get_store_list)
 
 @user_router.get("/predictions", response_model=List[PredictionHistoryResponse])
 async def get_prediction_history(
+    request: Request,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to")
+):
+    """予測履歴取得（(created_at, id) の新しい順キーセットページング、次ページは X-Next-Cursor）"""
+    etag = await tenant_etag_async(db, request, 'predictions', current_user.id, ('predictions',))
+    # 本文は gzip で返すことがあるので、圧縮版のETagでも一致とする
+    matched = matching_etag(request, etag, encodings=('gzip',))
+    if matched is not None:
+        return not_modified(matched)
+    
+    keys = list(PredictionHistoryResponse.model_fields)
+    statement = select(*(getattr(PredictionHistory, key) for key in keys))\
+        .where(PredictionHistory.user_id == current_user.id)
+    
+    if from_date:
+        statement = statement.where(PredictionHistory.created_at >= datetime.combine(from_date, time.min))
+    if to_date:
+        statement = statement.where(PredictionHistory.created_at < datetime.combine(to_date + timedelta(days=1), time.min))
+    
+    predictions, next_cursor = await keyset_page_async(
+        db, statement, PredictionHistory.created_at, PredictionHistory.id, cursor, limit,
+        descending=True, offset=skip, scalars=False
+    )
+    
+    result = json_response(request, rows_to_dicts(predictions, keys),
+                           headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+    set_etag(result, etag)
+    return result
+
+@user_router.get("/export/{table}")
+async def export_user_data(
+    table: str,
+    current_user: User = Depends(get_current_active_user),
+    export_format: str = Query("csv", alias="format"),
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to")
 ):
-    """予測履歴取得"""
-    predictions = db.query(PredictionHistory)\
-        .filter(PredictionHistory.user_id == current_user.id)\
-        .order_by(PredictionHistory.created_at.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
-    
-    return [PredictionHistoryResponse.from_orm(pred) for pred in predictions]
+    """ユーザーデータ（data）・予測履歴（predictions）のストリーミングエクスポート（csv / ndjson / parquet / arrow）"""
+    try:
+        exporter = DataExporter(
+            current_user.id, table, export_format,
+            start=datetime.combine(from_date, time.min) if from_date else None,
+            end=datetime.combine(to_date + timedelta(days=1), time.min) if to_date else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return StreamingResponse(
+        exporter.stream(),
+        media_type=exporter.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{exporter.filename}"'}
+    )
 
 @user_router.delete("/data")
 async def delete_user_data(
@@ -225,7 +320,7 @@ async def delete_user_data(
         # ユーザー専用データ処理クラスで完全削除
         from .user_data_processor import UserDataProcessor
         user_processor = UserDataProcessor(current_user.id, db)
-        user_processor.delete_user_data()
+        await asyncio.to_thread(user_processor.delete_user_data)
         
         return {"message": "ユーザーデータが完全に削除されました"}
     except Exception as e:
@@ -0,0 +1,77 @@
+import asyncio
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from decouple import config
+
+# 起動後に機械学習スタックを裏で読み込むか、ポート待受開始から何秒後に始めるか
+ML_WARMUP_ENABLED = config('ML_WARMUP_ENABLED', default=True, cast=bool)
+ML_WARMUP_DELAY = config('ML_WARMUP_DELAY', default=1.0, cast=float)
+
+# 読み込みに時間がかかるモジュール（初回の予測・訓練で必要になるもの）
+ML_MODULES = [
+    'numpy', 'pandas', 'sklearn.ensemble', 'sklearn.preprocessing',
+    '.data_processor', '.models', '.feature_store', '.forecaster', '.user_data_processor'
+]
+
+class MLWarmup:
+    """機械学習スタックのバックグラウンド読み込み（起動を待たせずに初回リクエストを速くする）"""
+
+    def __init__(self, enabled: bool = ML_WARMUP_ENABLED, delay_seconds: float = ML_WARMUP_DELAY):
+        self.enabled = enabled
+        self.delay_seconds = delay_seconds
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def is_warmed(self) -> bool:
+        """機械学習スタックが読み込み済みか（リクエストで先に読み込まれた場合も含む）"""
+        return self.finished_at is not None or all(
+            importlib.util.resolve_name(name, __package__) in sys.modules for name in ML_MODULES
+        )
+
+    def schedule(self):
+        """イベントループ上で delay_seconds 後に読み込みを開始（startupから呼ぶ）"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run_later())
+
+    async def _run_later(self):
+        # startup完了後にポートの待受が始まるので、少し待ってから読み込む
+        await asyncio.sleep(self.delay_seconds)
+        await asyncio.to_thread(self.warm)
+
+    def warm(self):
+        """モジュールを読み込む（複数回呼ばれても1回だけ実行）"""
+        with self._lock:
+            if self.finished_at is not None:
+                return
+            self.started_at = time.perf_counter()
+            try:
+                for name in ML_MODULES:
+                    importlib.import_module(name, __package__)
+            except Exception as e:
+                self.error = str(e)
+                print(f"機械学習スタックの読み込みエラー: {e}")
+                return
+            self.finished_at = time.perf_counter()
+            print(f"機械学習スタックを読み込みました（{self.finished_at - self.started_at:.2f}秒）")
+
+    def status(self) -> Dict[str, Any]:
+        """読み込み状況"""
+        return {
+            'enabled': self.enabled,
+            'warmed': self.is_warmed,
+            'warmup_seconds': round(self.finished_at - self.started_at, 3) if self.finished_at else None,
+            'error': self.error
+        }
+
+# アプリ全体で共有するウォームアップ
+ml_warmup = MLWarmup()
@@ -1,24 +1,41 @@
 import requests
 import asyncio
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Tuple
+from decouple import config
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
+
+# 天気予報のキャッシュ有効期限（秒）
+WEATHER_CACHE_TTL = config('WEATHER_CACHE_TTL', default=30 * 60, cast=int)
+
+# 天気予報API（負荷試験ではローカルのスタブサーバーに差し替える）
+WEATHER_API_URL = config('WEATHER_API_URL', default='https://weather.tsukumijima.net/api/forecast')
 
 class WeatherService:
     def __init__(self):
-        self.livedoor_base_url = "https://weather.tsukumijima.net/api/forecast"
+        self.livedoor_base_url = WEATHER_API_URL
         self.openweather_base_url = "https://api.openweathermap.org/data/2.5"
         self.openweather_api_key = None  # 必要に応じて設定
+        # 都市コード → (有効期限, 予報)
+        self._forecast_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
         
     async def get_weather_forecast(self, postal_code: str = "1000001") -> Dict[str, Any]:
         """天気予報取得（Livedoor Weather互換API使用）"""
         try:
             # 郵便番号から地域コードを取得
-            city_code = self._get_city_code(postal_code)
+            city_code = self.get_city_code(postal_code)
+            
+            # 同じ地域の予報は有効期限内ならキャッシュを返す
+            cached = self._forecast_cache.get(city_code)
+            if cached is not None and cached[0] > time.monotonic():
+                return dict(cached[1])
+            
             print(f"郵便番号 {postal_code} -> 都市コード {city_code}")
             
-            # Livedoor Weather互換APIから天気予報取得
-            response = requests.get(
+            # Livedoor Weather互換APIから天気予報取得（イベントループを止めないようにスレッドで実行）
+            response = await asyncio.to_thread(
+                requests.get,
                 self.livedoor_base_url,
                 params={"city": city_code},
                 timeout=10
@@ -26,7 +43,10 @@ class WeatherService:
             
             if response.status_code == 200:
                 data = response.json()
-                return self._parse_livedoor_response(data)
+                forecast = self._parse_livedoor_response(data)
+                if forecast.get("source") == "livedoor":
+                    self._forecast_cache[city_code] = (time.monotonic() + WEATHER_CACHE_TTL, forecast)
+                return dict(forecast)
             else:
                 # フォールバック: デフォルト天気情報
                 return self._get_default_weather()
@@ -35,7 +55,7 @@ class WeatherService:
             print(f"天気予報取得エラー: {e}")
             return self._get_default_weather()
     
-    def _get_city_code(self, postal_code: str) -> str:
+    def get_city_code(self, postal_code: str) -> str:
         """郵便番号から都市コードを取得"""
         # 主要な郵便番号と都市コードのマッピング
         postal_to_city = {
@@ -142,6 +162,15 @@ class WeatherService:
                 return {
                     "source": "livedoor",
                     "location": location_name,
+                    "forecasts": [
+                        {
+                            "date": forecast.get("date"),
+                            "weather": forecast.get("telop", "不明"),
+                            "max_temp": (forecast.get("temperature", {}).get("max") or {}).get("celsius"),
+                            "min_temp": (forecast.get("temperature", {}).get("min") or {}).get("celsius")
+                        }
+                        for forecast in forecasts
+                    ],
                     "today": {
                         "date": today_forecast.get("date"),
                         "weather": today_forecast.get("telop", "不明"),
@@ -173,6 +202,10 @@ class WeatherService:
         return {
             "source": "default",
             "location": "東京",
+            "forecasts": [
+                {"date": datetime.now().strftime("%Y-%m-%d"), "weather": "晴れ", "max_temp": 20, "min_temp": 15},
+                {"date": tomorrow.strftime("%Y-%m-%d"), "weather": "晴れ", "max_temp": 20, "min_temp": 15}
+            ],
             "today": {
                 "date": datetime.now().strftime("%Y-%m-%d"),
                 "weather": "晴れ",
@@ -191,6 +224,33 @@ class WeatherService:
             "temperature": 20
         }
     
+    def get_weather_for_date(self, weather_data: Dict[str, Any], target_date: date) -> Dict[str, Any]:
+        """予報から対象日の天気を選び、予測用の weather / temperature を差し替える"""
+        target = target_date.strftime("%Y-%m-%d")
+        matched = next(
+            (f for f in weather_data.get("forecasts", []) if f.get("date") == target),
+            None
+        )
+        
+        result = dict(weather_data)
+        if matched is not None:
+            result["weather"] = matched.get("weather", "不明")
+            result["temperature"] = matched.get("max_temp")
+        elif "forecasts" in weather_data:
+            # 予報期間外の日付は天気不明として扱う
+            result["weather"] = "不明"
+            result["temperature"] = None
+        result["forecast_date"] = target if matched is not None else None
+        return result
+    
+    def get_weather_by_date(self, weather_data: Dict[str, Any]) -> Dict[str, str]:
+        """日付（YYYY-MM-DD）→ 天気の対応表"""
+        return {
+            f["date"]: f.get("weather", "不明")
+            for f in weather_data.get("forecasts", [])
+            if f.get("date")
+        }
+    
     async def get_openweather_forecast(self, postal_code: str) -> Dict[str, Any]:
         """OpenWeatherMap APIから天気予報取得（バックアップ用）"""
         if not self.openweather_api_key:
@@ -0,0 +1,48 @@
+"""ウォークフォワード・バックテストの所要時間計測
+
+同梱の実データ（data/raw）で50フォールドのバックテストを実行する。
+
+    cd backend
+    python -m benchmarks.bench_backtest --folds 50 --workers 1 4
+"""
+import argparse
+import time
+
+from app.backtest import WalkForwardBacktester
+from app.data_processor import DataProcessor
+
+DEFAULT_CSV = "../data/raw/airmate_rawdata_seiseki_201912-202506.csv"
+
+def main():
+    parser = argparse.ArgumentParser(description="バックテスト所要時間ベンチマーク")
+    parser.add_argument('--csv', default=DEFAULT_CSV)
+    parser.add_argument('--folds', type=int, default=50)
+    parser.add_argument('--horizon', type=int, default=7)
+    parser.add_argument('--engine', default='random_forest')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 0])
+    args = parser.parse_args()
+    
+    with open(args.csv, 'rb') as f:
+        df = DataProcessor().process_csv_data(f.read())
+    
+    for workers in args.workers:
+        backtester = WalkForwardBacktester(
+            n_folds=args.folds,
+            horizon_days=args.horizon,
+            engine=args.engine,
+            max_workers=workers or None
+        )
+        start_time = time.perf_counter()
+        result = backtester.run(df)
+        elapsed = time.perf_counter() - start_time
+        
+        print(
+            f"workers={backtester.max_workers:>3d} folds={result['n_folds']} "
+            f"elapsed={elapsed:.2f}s "
+            f"sales_mae={result['sales_metrics']['mae']:.1f} "
+            f"sales_mape={result['sales_metrics']['mape']:.2f}% "
+            f"customers_mae={result['customers_metrics']['mae']:.2f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""並列予測負荷でのレイテンシ計測（p50 / p95 / p99）
+
+一時ディレクトリのSQLiteでアプリをプロセス内に起動し（天気予報はデフォルト値に固定）、
+/api/predict と軽いGET（/api/user/predictions）を同時に投げてルートごとのレイテンシを計測する。
+--db-latency-ms でクエリごとの待ち時間を加え、ネットワーク越しのPostgreSQLを模擬する。
+変更前と比較する場合は別のチェックアウトを --app-dir に指定する。
+
+    cd backend
+    python -m benchmarks.bench_concurrency --requests 400 --concurrency 32
+    git worktree add /tmp/before <比較したいコミット>
+    python -m benchmarks.bench_concurrency --app-dir /tmp/before/backend
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_PATH = os.path.join(BACKEND_DIR, '..', 'data', 'raw', 'airmate_rawdata_seiseki_201912-202506.csv')
+
+def add_query_latency(latency_ms: float):
+    """SQLiteの各クエリに待ち時間を足してネットワーク越しのPostgreSQLを模擬する
+
+    待ちは sqlite3 を呼んだスレッドで発生する（同期セッションならそのスレッド、aiosqlite なら専用スレッド）
+    """
+    import sqlite3
+
+    class SlowCursor(sqlite3.Cursor):
+        def execute(self, *args, **kwargs):
+            time.sleep(latency_ms / 1000)
+            return super().execute(*args, **kwargs)
+
+        def executemany(self, *args, **kwargs):
+            time.sleep(latency_ms / 1000)
+            return super().executemany(*args, **kwargs)
+
+    class SlowConnection(sqlite3.Connection):
+        def cursor(self, factory=SlowCursor):
+            return super().cursor(factory)
+
+    original_connect = sqlite3.connect
+
+    def connect(*args, **kwargs):
+        kwargs.setdefault('factory', SlowConnection)
+        return original_connect(*args, **kwargs)
+
+    sqlite3.connect = connect
+    sqlite3.dbapi2.connect = connect
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+async def run(args):
+    import httpx
+    from app import main, weather_service
+
+    # 外部の天気APIには繋がない
+    async def default_forecast(self, postal_code="1000001"):
+        return self._get_default_weather()
+    weather_service.WeatherService.get_weather_forecast = default_forecast
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            r = await client.post('/api/auth/register', json={
+                'email': 'bench@example.com', 'username': 'bench', 'password': 'bench-password'
+            })
+            headers = {'Authorization': f"Bearer {r.json()['access_token']}"}
+            with open(CSV_PATH, 'rb') as f:
+                r = await client.post('/api/upload-data', files={'file': ('data.csv', f.read(), 'text/csv')}, headers=headers)
+            r.raise_for_status()
+            (await client.post('/api/train-model', headers=headers)).raise_for_status()
+
+            latencies = {'POST /api/predict': [], 'GET /api/user/predictions': []}
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def call(i: int):
+                async with semaphore:
+                    start_time = time.perf_counter()
+                    if i % 2 == 0:
+                        route = 'POST /api/predict'
+                        target = (date(2025, 7, 1) + timedelta(days=i % 365)).isoformat()
+                        response = await client.post('/api/predict', json={'date': target}, headers=headers)
+                    else:
+                        route = 'GET /api/user/predictions'
+                        response = await client.get('/api/user/predictions?limit=20', headers=headers)
+                    response.raise_for_status()
+                    latencies[route].append((time.perf_counter() - start_time) * 1000)
+
+            wall_start = time.perf_counter()
+            await asyncio.gather(*(call(i) for i in range(args.requests)))
+            wall = time.perf_counter() - wall_start
+
+    print(f"{args.requests}リクエスト 同時{args.concurrency} 合計{wall:.2f}秒 ({args.requests / wall:.1f} req/s)")
+    for route, values in latencies.items():
+        print(f"  {route:<28s} p50={statistics.median(values):>8.1f}ms "
+              f"p95={percentile(values, 0.95):>8.1f}ms p99={percentile(values, 0.99):>8.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="並列予測負荷でのレイテンシ計測")
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--app-dir', default=BACKEND_DIR, help="app パッケージを含むディレクトリ")
+    parser.add_argument('--db-latency-ms', type=float, default=2.0, help="クエリごとに加える待ち時間（0で無効）")
+    args = parser.parse_args()
+    
+    if args.db_latency_ms > 0:
+        add_query_latency(args.db_latency_ms)
+
+    # 予測キャッシュを無効にして毎回モデルで予測させる
+    os.environ['ENVIRONMENT'] = 'development'
+    os.environ['PREDICTION_CACHE_SIZE'] = '0'
+    os.environ['ML_WARMUP_ENABLED'] = 'False'
+    sys.path.insert(0, os.path.abspath(args.app_dir))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""学習エンジン比較ベンチマーク
+
+合成データを行数を変えて生成し、エンジンごとの訓練時間・モデルサイズ・精度を比較する。
+
+    cd backend
+    python -m benchmarks.bench_engines --rows 10000 100000 300000
+"""
+import argparse
+import json
+import pickle
+import time
+
+from app.data_processor import DataProcessor
+from app.models import SalesPredictionModel, SUPPORTED_ENGINES
+from benchmarks.synthetic import make_sales_frame
+
+def run_engine(engine: str, X, y) -> dict:
+    """1エンジン分の計測"""
+    model = SalesPredictionModel(engine=engine)
+    
+    start_time = time.perf_counter()
+    metrics = model.train(X, y)
+    fit_seconds = time.perf_counter() - start_time
+    
+    model_bytes = len(pickle.dumps(model))
+    
+    return {
+        'engine': engine,
+        'rows': len(X),
+        'fit_seconds': round(fit_seconds, 3),
+        'model_bytes': model_bytes,
+        'sales_mae': round(metrics['sales_metrics']['mae'], 1),
+        'sales_mape': round(metrics['sales_metrics']['mape'], 2),
+        'customers_mae': round(metrics['customers_metrics']['mae'], 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="学習エンジン比較ベンチマーク")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--stores', type=int, default=20)
+    parser.add_argument('--engines', nargs='+', default=list(SUPPORTED_ENGINES))
+    parser.add_argument('--output', help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+    
+    processor = DataProcessor()
+    results = []
+    
+    for rows in args.rows:
+        df = make_sales_frame(rows, n_stores=args.stores)
+        X, y = processor.create_features(df)
+        
+        for engine in args.engines:
+            try:
+                result = run_engine(engine, X, y)
+            except ImportError as e:
+                print(f"{engine}: スキップ（{e}）")
+                continue
+            results.append(result)
+            print(
+                f"{engine:24s} rows={rows:>8d} fit={result['fit_seconds']:>8.2f}s "
+                f"size={result['model_bytes'] / 1024 / 1024:>8.2f}MB "
+                f"sales_mae={result['sales_mae']:>10.1f} sales_mape={result['sales_mape']:>6.2f}%"
+            )
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""エクスポートの所要時間とピークメモリ比較（JSONページング と ストリーミング）
+
+一時SQLiteにユーザーデータを作成し、全件をJSONページングで取得した場合と
+各形式のストリーミングエクスポートの時間・ピークメモリ（tracemalloc）を比較する。
+
+    cd backend
+    python -m benchmarks.bench_export --rows 200000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy.orm import sessionmaker
+
+# app.database の既定接続先（PostgreSQL）に繋ぎに行かないようにする
+os.environ.setdefault('ENVIRONMENT', 'development')
+
+from app.exporter import DataExporter, EXPORT_FORMATS
+from app.pagination import keyset_page
+from app.schemas import UserDataResponse
+from app.user_models import UserData
+from benchmarks.bench_pagination import setup_database
+
+def measure(func):
+    """(秒, 出力バイト数, ピークメモリMB)：tracemallocの負荷が時間に乗らないよう別々に計測"""
+    start_time = time.perf_counter()
+    size = func()
+    elapsed = time.perf_counter() - start_time
+    
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, size, peak / 1024 / 1024
+
+def json_paging(Session, limit: int) -> int:
+    """/api/user/data を全ページ辿るのと同じ処理"""
+    db = Session()
+    size = 0
+    cursor = None
+    try:
+        while True:
+            query = db.query(UserData).filter(UserData.user_id == 1)
+            rows, cursor = keyset_page(query, UserData.date, UserData.id, cursor, limit)
+            size += sum(len(UserDataResponse.model_validate(row).model_dump_json()) for row in rows)
+            db.expunge_all()
+            if not cursor:
+                return size
+    finally:
+        db.close()
+
+def streaming(Session, export_format: str) -> int:
+    """ストリーミングエクスポートを最後まで読む"""
+    exporter = DataExporter(1, 'data', export_format, session_factory=Session)
+    return sum(len(chunk) for chunk in exporter.stream())
+
+def main():
+    parser = argparse.ArgumentParser(description="エクスポートの時間・メモリ比較")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--limit', type=int, default=1000)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = setup_database(os.path.join(tmp_dir, "bench.db"), args.rows)
+        Session = sessionmaker(bind=db.get_bind())
+        db.close()
+        
+        cases = [('json paging', lambda: json_paging(Session, args.limit))]
+        for export_format in EXPORT_FORMATS:
+            try:
+                DataExporter(1, 'data', export_format, session_factory=Session)
+            except ValueError as e:
+                print(f"{export_format}: スキップ（{e}）")
+                continue
+            cases.append((export_format, lambda f=export_format: streaming(Session, f)))
+        
+        for name, func in cases:
+            elapsed, size, peak_mb = measure(func)
+            print(f"{name:<12s} {elapsed:>7.2f}s {size / 1024 / 1024:>8.1f}MB出力 ピーク{peak_mb:>7.1f}MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""履歴特徴量（ラグ・移動集計）の計算の比較（pandas のグループ処理と FeatureSpec）
+
+合成データ（店舗×日数）に対して、同じ定義の特徴量を pandas（店舗ごとの shift / rolling を
+特徴量ごとに実行）と FeatureSpec.compute_history（全特徴量を NumPy で一度に計算）で作り、
+所要時間と値の最大差を比べる。既定の特徴量と、ラグ・窓を増やした拡張版の2通りを計測する。
+
+    cd backend
+    python -m benchmarks.bench_features --rows 100000 1000000 --stores 50
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from app.data_processor import FEATURE_SPEC
+from app.feature_spec import FeatureSpec, Lag, Rolling, group_starts
+from benchmarks.bench_pagination import measure
+from benchmarks.synthetic import make_sales_frame
+
+# ラグ1〜28日・前年同曜日、7/14/28日の移動集計を加えた拡張版
+EXTENDED_SPEC = FeatureSpec(history=list(FEATURE_SPEC.history) + [
+    *(Lag(col, lag) for col in ('sales', 'customers') for lag in (1, 2, 3, 14, 21, 28)),
+    Lag('sales', 364),
+    *(Rolling('sales', window, agg) for window in (7, 14, 28) for agg in ('mean', 'std', 'min', 'max')),
+    Rolling('customers', 28, 'mean')
+])
+
+def pandas_history(df: pd.DataFrame, spec: FeatureSpec) -> dict:
+    """pandas のグループ処理で同じ定義の特徴量を計算（当日を含まない窓）"""
+    grouped = df.groupby('store_id', sort=False, observed=True)
+    result = {}
+    for feature in spec.history:
+        if isinstance(feature, Lag):
+            result[feature.name] = grouped[feature.column].shift(feature.lag).to_numpy(dtype=np.float64)
+        else:
+            shifted = grouped[feature.column].shift(1)
+            rolling = shifted.groupby(df['store_id'], sort=False, observed=True)\
+                .rolling(feature.window, min_periods=1)
+            result[feature.name] = getattr(rolling, feature.agg)().to_numpy(dtype=np.float64)
+    return result
+
+def spec_history(df: pd.DataFrame, spec: FeatureSpec) -> dict:
+    """FeatureSpec で全特徴量を一度に計算"""
+    starts = group_starts(df['store_id'].cat.codes.to_numpy())
+    return spec.compute_history({col: df[col].to_numpy(dtype=np.float64) for col in spec.source_columns}, starts)
+
+def max_difference(expected: dict, actual: dict) -> float:
+    """欠損の位置が同じことを確かめた上での最大の差（相対）"""
+    worst = 0.0
+    for name, values in expected.items():
+        if not np.array_equal(np.isnan(values), np.isnan(actual[name])):
+            raise AssertionError(f"{name}: 欠損の位置が一致しません")
+        present = ~np.isnan(values)
+        diff = np.abs(values[present] - actual[name][present]) / np.maximum(1.0, np.abs(values[present]))
+        worst = max(worst, float(diff.max()) if len(diff) else 0.0)
+    return worst
+
+def main():
+    parser = argparse.ArgumentParser(description="履歴特徴量の計算の比較")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--stores', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'行数':>10s} {'特徴量':>8s} {'pandas':>12s} {'FeatureSpec':>12s} {'倍率':>8s} {'最大差':>10s}")
+    for rows in args.rows:
+        df = make_sales_frame(rows, n_stores=args.stores)
+        df = df.assign(store_id=df['store_id'].astype('category')).sort_values(['store_id', 'date'], kind='stable')
+        for name, spec in [('既定', FEATURE_SPEC), ('拡張', EXTENDED_SPEC)]:
+            difference = max_difference(pandas_history(df, spec), spec_history(df, spec))
+            pandas_ms = measure(lambda: pandas_history(df, spec), args.repeat)
+            spec_ms = measure(lambda: spec_history(df, spec), args.repeat)
+            print(f"{len(df):>10d} {name}{len(spec.history):>3d}個 {pandas_ms:>10.1f}ms {spec_ms:>10.1f}ms "
+                  f"{pandas_ms / spec_ms:>7.1f}x {difference:>10.1e}")
+
+if __name__ == "__main__":
+    main()
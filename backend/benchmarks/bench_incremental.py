@@ -0,0 +1,70 @@
+"""差分再訓練と全件再訓練の比較（1日ずつデータが増える運用を再現）
+
+合成データの末尾を検証期間として残し、その直前の N 日を1日ずつ追加しながら
+毎日「全件で再訓練」と「差分再訓練（古い木の一部を置き換え）」を行い、
+1回あたりの所要時間と、検証期間での誤差を比較する。
+
+    cd backend
+    python -m benchmarks.bench_incremental --days 2000 --updates 14
+"""
+import argparse
+import copy
+import statistics
+import time
+
+import numpy as np
+
+from app.data_processor import DataProcessor
+from app.models import SalesPredictionModel
+from benchmarks.synthetic import make_sales_frame
+
+def holdout_mae(model: SalesPredictionModel, X, y) -> float:
+    sales_pred, _ = model.predict_arrays(X[model.feature_columns].to_numpy())
+    return float(np.mean(np.abs(y['sales'].to_numpy() - sales_pred)))
+
+def main():
+    parser = argparse.ArgumentParser(description="差分再訓練と全件再訓練の比較")
+    parser.add_argument('--days', type=int, default=2000, help="合成データの日数（1店舗）")
+    parser.add_argument('--updates', type=int, default=14, help="1日ずつ追加する回数")
+    parser.add_argument('--holdout', type=int, default=60, help="誤差を測る末尾の日数")
+    args = parser.parse_args()
+
+    X, y = DataProcessor().create_features(make_sales_frame(args.days))
+    start = len(X) - args.holdout - args.updates
+    X_holdout, y_holdout = X.iloc[-args.holdout:], y.iloc[-args.holdout:]
+
+    initial = SalesPredictionModel()
+    initial.train(X.iloc[:start], y.iloc[:start])
+    incremental = copy.deepcopy(initial)
+
+    full_seconds, incremental_seconds, fallbacks = [], [], 0
+    for step in range(1, args.updates + 1):
+        end = start + step
+        X_seen, y_seen = X.iloc[:end], y.iloc[:end]
+
+        start_time = time.perf_counter()
+        full = SalesPredictionModel()
+        full.train(X_seen, y_seen)
+        full_seconds.append(time.perf_counter() - start_time)
+
+        new_mask = np.zeros(end, dtype=bool)
+        new_mask[-1] = True
+        start_time = time.perf_counter()
+        if incremental.update(X_seen, y_seen, new_mask) is None:
+            # ドリフト検出時はアプリと同じく全件で再訓練
+            fallbacks += 1
+            incremental = SalesPredictionModel()
+            incremental.train(X_seen, y_seen)
+        incremental_seconds.append(time.perf_counter() - start_time)
+
+    full_median = statistics.median(full_seconds)
+    incremental_median = statistics.median(incremental_seconds)
+    print(f"訓練データ {start}〜{start + args.updates} 行、{args.updates} 回更新、検証 {args.holdout} 日")
+    print(f"全件再訓練  1回 {full_median:>8.3f}s  検証MAE {holdout_mae(full, X_holdout, y_holdout):>10.1f}")
+    print(f"差分再訓練  1回 {incremental_median:>8.3f}s  検証MAE {holdout_mae(incremental, X_holdout, y_holdout):>10.1f}"
+          f"  （全件へのフォールバック {fallbacks} 回）")
+    print(f"再訓練なし              検証MAE {holdout_mae(initial, X_holdout, y_holdout):>10.1f}")
+    print(f"高速化 {full_median / incremental_median:.1f}倍")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""一覧・統計レスポンスのJSON出力の比較（Pydantic + 標準json と 行の辞書化 + orjson）
+
+一時SQLiteにユーザーデータを作成し、/api/user/data の1ページ分（既定1万行）を
+従来の方法（ORMオブジェクト → 行ごとの Pydantic 検証 → jsonable_encoder → json.dumps）と
+高速な方法（列を直接取得 → 辞書 → orjson）で出力し、所要時間とバイト数、gzip 後のバイト数を比べる。
+/api/data-stats の pandas の集計結果の出力も同様に比べる。
+
+    cd backend
+    python -m benchmarks.bench_json --rows 10000
+"""
+import argparse
+import gzip
+import json
+import os
+import tempfile
+
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+# app.database の既定接続先（PostgreSQL）に繋ぎに行かないようにする
+os.environ.setdefault('ENVIRONMENT', 'development')
+
+from fastapi.encoders import jsonable_encoder
+
+from app.data_processor import DataProcessor
+from app.fast_json import JSON_GZIP_LEVEL, dumps, orjson, rows_to_dicts
+from app.schemas import UserDataResponse
+from app.user_models import UserData
+from benchmarks.bench_pagination import measure, setup_database
+from benchmarks.synthetic import make_sales_frame
+
+def default_json(content) -> bytes:
+    """FastAPI の既定の出力（JSONResponse.render と同じ設定）"""
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(',', ':')).encode('utf-8')
+
+def main():
+    parser = argparse.ArgumentParser(description="一覧・統計レスポンスのJSON出力の比較")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("orjson が未インストールのため高速な方法も標準jsonで計測します")
+
+    keys = list(UserDataResponse.model_fields)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = setup_database(os.path.join(tmp_dir, "bench.db"), args.rows)
+        Session = sessionmaker(bind=db.get_bind())
+        db.close()
+
+        def query_objects():
+            session = Session()
+            try:
+                rows = session.query(UserData).filter(UserData.user_id == 1)\
+                    .order_by(UserData.date, UserData.id).limit(args.rows).all()
+                session.expunge_all()
+                return rows
+            finally:
+                session.close()
+
+        def query_tuples():
+            session = Session()
+            try:
+                return session.execute(
+                    select(*(getattr(UserData, key) for key in keys)).where(UserData.user_id == 1)
+                    .order_by(UserData.date, UserData.id).limit(args.rows)
+                ).all()
+            finally:
+                session.close()
+
+        objects, tuples = query_objects(), query_tuples()
+        cases = [
+            ('Pydantic + json', lambda: default_json([UserDataResponse.model_validate(row) for row in objects]),
+             lambda: default_json([UserDataResponse.model_validate(row) for row in query_objects()])),
+            ('辞書 + orjson', lambda: dumps(rows_to_dicts(tuples, keys)),
+             lambda: dumps(rows_to_dicts(query_tuples(), keys)))
+        ]
+        print(f"/api/user/data {len(tuples)}行        出力のみ   DB読み込み込み      サイズ")
+        for name, serialize, end_to_end in cases:
+            body = serialize()
+            print(f"  {name:<16s} {measure(serialize, args.repeat):>8.1f}ms {measure(end_to_end, args.repeat):>12.1f}ms "
+                  f"{len(body) / 1024:>10.1f}KB")
+        gzip_ms = measure(lambda: gzip.compress(body, compresslevel=JSON_GZIP_LEVEL), args.repeat)
+        print(f"  gzip（レベル{JSON_GZIP_LEVEL}）   {gzip_ms:>8.1f}ms {'':>14s} "
+              f"{len(gzip.compress(body, compresslevel=JSON_GZIP_LEVEL)) / 1024:>10.1f}KB")
+
+    # /api/data-stats（pandas の集計結果の辞書）
+    processor = DataProcessor()
+    processor.data = make_sales_frame(args.rows, n_stores=10)
+    stats = processor.get_detailed_stats()
+    print(f"/api/data-stats {args.rows}行の集計結果")
+    for name, func in [('jsonable + json', lambda: default_json(stats)), ('orjson', lambda: dumps(stats))]:
+        body = func()
+        elapsed = measure(func, args.repeat)
+        print(f"  {name:<16s} {elapsed:>8.2f}ms {len(body) / 1024:>10.1f}KB")
+
+if __name__ == "__main__":
+    main()
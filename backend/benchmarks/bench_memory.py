@@ -0,0 +1,62 @@
+"""テナントあたりのDataFrameメモリ量（従来の型と省メモリ型）
+
+同梱のCSVを店舗数方向に N 倍（既定100倍）に複製し、生データと特徴量の
+メモリ量（memory_usage(deep=True)）を従来の型（object / int64 / float64）と比較する。
+
+    cd backend
+    python -m benchmarks.bench_memory --scale 100
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.data_processor import CATEGORY_COLUMNS, DataProcessor, compact_dtypes
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'raw',
+                        'airmate_rawdata_seiseki_201912-202506.csv')
+
+def scale_frame(df: pd.DataFrame, scale: int) -> pd.DataFrame:
+    """店舗IDを変えて scale 店舗分に複製"""
+    store_ids = df['store_id'].astype(str).to_numpy()
+    frames = [df.assign(store_id=np.char.add(store_ids, f"-{i:03d}")) for i in range(scale)]
+    return compact_dtypes(pd.concat(frames, ignore_index=True))
+
+def legacy_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """変更前と同じ型（文字列は object、数値は64bit）に戻す"""
+    widened = {}
+    for col, dtype in df.dtypes.items():
+        if col in CATEGORY_COLUMNS:
+            widened[col] = object
+        elif pd.api.types.is_integer_dtype(dtype):
+            widened[col] = np.int64
+        elif pd.api.types.is_float_dtype(dtype):
+            widened[col] = np.float64
+    return df.astype(widened)
+
+def megabytes(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 1024 / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description="DataFrameのメモリ量比較")
+    parser.add_argument('--scale', type=int, default=100)
+    parser.add_argument('--csv', default=CSV_PATH)
+    args = parser.parse_args()
+    
+    with open(args.csv, 'rb') as f:
+        raw = DataProcessor().process_csv_data(f.read())
+    
+    data = scale_frame(raw, args.scale)
+    processor = DataProcessor()
+    processor.create_features(data)
+    features = processor.processed_data
+    
+    print(f"{len(data):,}行（{args.scale}店舗）")
+    for name, df in [('生データ', data), ('特徴量', features)]:
+        before = megabytes(legacy_dtypes(df))
+        after = megabytes(df)
+        print(f"{name:<6s} 従来 {before:>8.2f}MB  省メモリ {after:>8.2f}MB  ({after / before:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""モデルの訓練・推論ベンチマーク（モデルクラス × データ量）
+
+合成データを行数を変えて生成し、モデルごとに訓練時間・1行予測と一括予測のレイテンシ・
+シリアライズ後のサイズ・復元時間・精度を1つの表にまとめる。
+ランダムフォレストは --n-estimators / --max-depth で木の本数・深さも振れる。
+
+    cd backend
+    python -m benchmarks.bench_models --rows 1000 10000 100000
+    python -m benchmarks.bench_models --models random_forest --n-estimators 50 100 200 --max-depth 6 10 0
+"""
+import argparse
+import json
+import pickle
+import statistics
+import time
+
+from app.data_processor import DataProcessor
+from app.models import EnsembleModel, SalesPredictionModel, SUPPORTED_ENGINES
+
+from benchmarks.synthetic import make_sales_frame
+
+MODELS = list(SUPPORTED_ENGINES) + ['ensemble']
+
+# 1行予測は /api/predict と同じ predict（信頼区間を含む）を繰り返して中央値を取る
+SINGLE_PREDICT_REPEAT = 50
+BATCH_PREDICT_ROWS = 10000
+
+def build_model(name: str, n_estimators=None, max_depth=None):
+    """ベンチマーク対象のモデルを生成"""
+    if name == 'ensemble':
+        return EnsembleModel()
+
+    model = SalesPredictionModel(engine=name)
+    if name == 'random_forest':
+        params = {}
+        if n_estimators is not None:
+            params['n_estimators'] = n_estimators
+        if max_depth is not None:
+            # 0 は深さ制限なし
+            params['max_depth'] = max_depth or None
+        model.sales_model.set_params(**params)
+        model.customers_model.set_params(**params)
+    return model
+
+def median_seconds(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings)
+
+def run_model(name: str, X, y, n_estimators=None, max_depth=None) -> dict:
+    """1モデル分の計測"""
+    model = build_model(name, n_estimators, max_depth)
+
+    start_time = time.perf_counter()
+    metrics = model.train(X, y)
+    fit_seconds = time.perf_counter() - start_time
+
+    # 訓練に使っていない末尾（テスト期間）で予測する
+    test_start = len(X) - metrics['test_samples']
+    single_row = X.iloc[[test_start]]
+    batch = X.iloc[test_start:test_start + BATCH_PREDICT_ROWS].to_numpy()
+
+    single_seconds = median_seconds(lambda: model.predict(single_row), SINGLE_PREDICT_REPEAT)
+    batch_seconds = median_seconds(lambda: model.predict_arrays(batch), 3)
+
+    payload = pickle.dumps(model)
+    load_seconds = median_seconds(lambda: pickle.loads(payload), 3)
+
+    return {
+        'model': name,
+        'n_estimators': n_estimators,
+        'max_depth': max_depth,
+        'rows': len(X),
+        'fit_seconds': round(fit_seconds, 3),
+        'predict_one_ms': round(single_seconds * 1000, 3),
+        'predict_batch_rows': len(batch),
+        'predict_batch_ms': round(batch_seconds * 1000, 3),
+        'model_bytes': len(payload),
+        'load_ms': round(load_seconds * 1000, 3),
+        'sales_mae': round(metrics['sales_metrics']['mae'], 1),
+        'sales_mape': round(metrics['sales_metrics']['mape'], 2),
+        'customers_mae': round(metrics['customers_metrics']['mae'], 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="モデルの訓練・推論ベンチマーク")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--stores', type=int, default=20)
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=MODELS)
+    parser.add_argument('--n-estimators', type=int, nargs='+', default=[None],
+                        help="ランダムフォレストの木の本数（既定はアプリの設定）")
+    parser.add_argument('--max-depth', type=int, nargs='+', default=[None],
+                        help="ランダムフォレストの最大深さ（0は制限なし、既定はアプリの設定）")
+    parser.add_argument('--output', help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    processor = DataProcessor()
+    results = []
+
+    print(f"{'model':<24s} {'rows':>8s} {'trees':>5s} {'depth':>5s} {'fit(s)':>8s} {'1行(ms)':>8s} "
+          f"{'一括(ms)':>9s} {'size(MB)':>8s} {'load(ms)':>8s} {'sales_mae':>10s} {'mape(%)':>7s}")
+    for rows in args.rows:
+        df = make_sales_frame(rows, n_stores=args.stores)
+        X, y = processor.create_features(df)
+
+        for name in args.models:
+            grid = [(n, d) for n in args.n_estimators for d in args.max_depth] \
+                if name == 'random_forest' else [(None, None)]
+            for n_estimators, max_depth in grid:
+                try:
+                    result = run_model(name, X, y, n_estimators, max_depth)
+                except ImportError as e:
+                    print(f"{name}: スキップ（{e}）")
+                    break
+                results.append(result)
+                print(
+                    f"{name:<24s} {rows:>8d} {str(n_estimators or '-'):>5s} {str(max_depth if max_depth is not None else '-'):>5s} "
+                    f"{result['fit_seconds']:>8.2f} {result['predict_one_ms']:>8.2f} "
+                    f"{result['predict_batch_ms']:>9.1f} {result['model_bytes'] / 1024 / 1024:>8.2f} "
+                    f"{result['load_ms']:>8.1f} {result['sales_mae']:>10.1f} {result['sales_mape']:>7.2f}"
+                )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
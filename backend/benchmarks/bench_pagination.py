@@ -0,0 +1,92 @@
+"""ページングのレイテンシ比較（offset と キーセット）
+
+一時SQLiteに10万行のユーザーデータを作成し、1ページ目と1,000ページ目の取得時間を比較する。
+
+    cd backend
+    python -m benchmarks.bench_pagination --rows 100000 --limit 100
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+# app.database の既定接続先（PostgreSQL）に繋ぎに行かないようにする
+os.environ.setdefault('ENVIRONMENT', 'development')
+
+from app.database import Base
+from app.pagination import encode_cursor, keyset_page
+from app.user_models import User, UserData
+
+def setup_database(path: str, rows: int):
+    """ベンチマーク用のデータベースを作成"""
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    
+    db.add(User(id=1, email="bench@example.com", username="bench", hashed_password="x"))
+    db.commit()
+    
+    start = datetime(2000, 1, 1)
+    for offset in range(0, rows, 10000):
+        db.execute(insert(UserData), [
+            {
+                'user_id': 1, 'store_id': f"AKR{i % 100:04d}", 'store_name': '店舗',
+                'date': start + timedelta(days=i // 100), 'weather': 'sunny',
+                'sales': 50000.0, 'customers': 50
+            }
+            for i in range(offset, min(offset + 10000, rows))
+        ])
+    db.commit()
+    return db
+
+def measure(func, repeat: int) -> float:
+    """中央値（ミリ秒）"""
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="ページングのレイテンシ比較")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 1000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = setup_database(os.path.join(tmp_dir, "bench.db"), args.rows)
+        base_query = lambda: db.query(UserData).filter(UserData.user_id == 1)
+        ordered = base_query().order_by(UserData.date, UserData.id)
+        
+        for page in args.pages:
+            skip = (page - 1) * args.limit
+            if skip >= args.rows:
+                print(f"page={page}: 行数が足りないためスキップ")
+                continue
+            
+            # 前ページ最後の行からキーセットのカーソルを作る
+            cursor = None
+            if skip > 0:
+                previous = ordered.offset(skip - 1).first()
+                cursor = encode_cursor(previous.date, previous.id)
+            
+            offset_ms = measure(lambda: ordered.offset(skip).limit(args.limit).all(), args.repeat)
+            keyset_ms = measure(
+                lambda: keyset_page(base_query(), UserData.date, UserData.id, cursor, args.limit),
+                args.repeat
+            )
+            print(f"page={page:>5d} offset={offset_ms:>8.2f}ms keyset={keyset_ms:>8.2f}ms")
+        
+        db.close()
+
+if __name__ == "__main__":
+    main()
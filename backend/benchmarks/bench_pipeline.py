@@ -0,0 +1,164 @@
+"""データパイプラインの段階別ベンチマーク（所要時間とピークメモリ）
+
+同梱の実データを店舗数×年数に拡大したAirmate形式CSVを生成し、
+CSV読み込み・特徴量作成・統計集計・DB保存・DB読み込みの各段階を計測する。
+結果はJSONで保存でき、--baseline で以前の結果と比べて遅くなった段階を検出する。
+
+    cd backend
+    python -m benchmarks.bench_pipeline --stores 1 10 50 --years 1 5 --output pipeline.json
+    python -m benchmarks.bench_pipeline --baseline pipeline.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# app.database の既定接続先（PostgreSQL）に繋ぎに行かないようにする
+os.environ.setdefault('ENVIRONMENT', 'development')
+
+from app.data_processor import DataProcessor
+from app.database import Base
+from app.user_data_processor import UserDataProcessor
+from app.user_models import User
+from benchmarks.synthetic import make_airmate_csv
+
+STAGES = ['process_csv_data', 'create_features', 'get_detailed_stats', '_save_to_database', 'load_user_data']
+
+def measure(func, with_memory: bool = True) -> dict:
+    """秒とピークメモリMB：tracemallocの負荷が時間に乗らないよう別々に計測"""
+    start_time = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start_time
+
+    result = {'seconds': round(elapsed, 4)}
+    if with_memory:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['peak_mb'] = round(peak / 1024 / 1024, 2)
+    return result
+
+def run_case(stores: int, years: float, stages, workdir: str, with_memory: bool, seed: int) -> dict:
+    """1つの規模（店舗数×年数）で各段階を計測"""
+    start_time = time.perf_counter()
+    csv_content = make_airmate_csv(stores, years, seed=seed)
+    generate_seconds = time.perf_counter() - start_time
+
+    processor = DataProcessor()
+    df = processor.process_csv_data(csv_content)
+
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, f'pipeline_{stores}_{years}.db')}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add(User(id=1, email="bench@example.com", username="bench", hashed_password="x"))
+    db.commit()
+    user_processor = UserDataProcessor(1, db)
+
+    def detailed_stats():
+        stats_processor = DataProcessor()
+        stats_processor.data = df
+        stats_processor.get_detailed_stats()
+
+    stage_funcs = {
+        'process_csv_data': lambda: DataProcessor().process_csv_data(csv_content),
+        # create_features は受け取ったフレームの型を揃えるので毎回コピーを渡す
+        'create_features': lambda: processor.create_features(df.copy()),
+        'get_detailed_stats': detailed_stats,
+        # 既存データを削除してから挿入するので繰り返し実行しても同じ結果になる
+        '_save_to_database': lambda: user_processor._save_to_database(df),
+        'load_user_data': user_processor.load_user_data
+    }
+
+    results = {}
+    try:
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            if stage == 'load_user_data' and '_save_to_database' not in stages:
+                user_processor._save_to_database(df)
+            results[stage] = measure(stage_funcs[stage], with_memory)
+    finally:
+        db.close()
+        engine.dispose()
+
+    return {
+        'stores': stores,
+        'years': years,
+        'csv_rows': csv_content.count(b'\n') - 1,
+        'csv_mb': round(len(csv_content) / 1024 / 1024, 2),
+        'rows': len(df),
+        'generate_seconds': round(generate_seconds, 3),
+        'stages': results
+    }
+
+def find_regressions(results, baseline, tolerance: float):
+    """基準結果より (1 + tolerance) 倍以上遅くなった段階"""
+    base_cases = {(c['stores'], c['years']): c for c in baseline['results']}
+    regressions = []
+    for case in results:
+        base_case = base_cases.get((case['stores'], case['years']))
+        if base_case is None:
+            continue
+        for stage, stats in case['stages'].items():
+            base_stats = base_case['stages'].get(stage)
+            if base_stats and stats['seconds'] > base_stats['seconds'] * (1 + tolerance):
+                regressions.append({
+                    'stores': case['stores'], 'years': case['years'], 'stage': stage,
+                    'baseline_seconds': base_stats['seconds'], 'seconds': stats['seconds']
+                })
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="データパイプラインの段階別ベンチマーク")
+    parser.add_argument('--stores', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 5])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--no-memory', action='store_true', help="ピークメモリを計測しない（実行時間が半分になる）")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="結果をJSONで保存するパス")
+    parser.add_argument('--baseline', help="比較する以前の結果JSON")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="遅くなったとみなす割合")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for stores in args.stores:
+            for years in args.years:
+                case = run_case(stores, years, args.stages, workdir, not args.no_memory, args.seed)
+                results.append(case)
+                print(f"stores={stores:>4d} years={years:>4g} rows={case['rows']:>9d} csv={case['csv_mb']:>8.1f}MB")
+                for stage, stats in case['stages'].items():
+                    peak = f" peak={stats['peak_mb']:>9.1f}MB" if 'peak_mb' in stats else ''
+                    print(f"  {stage:<20s} {stats['seconds']:>9.3f}s{peak}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'timestamp': datetime.now(timezone.utc).isoformat(),
+                    'python': platform.python_version(),
+                    'seed': args.seed
+                },
+                'results': results
+            }, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f"遅くなった段階: stores={r['stores']} years={r['years']} {r['stage']} "
+                  f"{r['baseline_seconds']:.3f}s → {r['seconds']:.3f}s")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
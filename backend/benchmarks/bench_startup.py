@@ -0,0 +1,68 @@
+"""起動時間の計測（python -X importtime で app.main の読み込みを分析）
+
+別プロセスで `import app.main` を実行し、累積インポート時間の中央値と
+時間のかかっているモジュール、機械学習スタックが起動時に読み込まれていないかを表示する。
+続けてバックグラウンドのウォームアップ（ml_warmup.warm）にかかる時間も計測する。
+
+    cd backend
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import time:  self [us] | cumulative | imported package
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+ML_PACKAGES = ('numpy', 'pandas', 'sklearn', 'xgboost', 'holidays')
+
+def run_importtime(code: str):
+    """-X importtime 付きでコードを実行し、(モジュール, 深さ, 累積マイクロ秒) の一覧を返す"""
+    env = dict(os.environ, ENVIRONMENT=os.environ.get('ENVIRONMENT', 'development'))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            entries.append((match.group(4), len(match.group(3)) // 2, int(match.group(2))))
+    return entries
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時間の計測")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+    
+    totals = []
+    entries = []
+    for _ in range(args.runs):
+        entries = run_importtime("import app.main")
+        totals.append(next(us for name, _, us in entries if name == 'app.main'))
+    
+    print(f"import app.main: 中央値 {statistics.median(totals) / 1000:.0f}ms（{args.runs}回）")
+    
+    # app.main 直下で読み込まれたモジュールを累積時間順に表示
+    direct = sorted(((us, name) for name, depth, us in entries if depth == 1), reverse=True)
+    print(f"\n累積時間の大きいモジュール（上位{args.top}）")
+    for us, name in direct[:args.top]:
+        print(f"  {name:<40s} {us / 1000:>8.1f}ms")
+    
+    loaded = sorted({name.split('.')[0] for name, _, _ in entries} & set(ML_PACKAGES))
+    print(f"\n起動時に読み込まれた機械学習パッケージ: {', '.join(loaded) if loaded else 'なし'}")
+    
+    # ウォームアップ（起動後にバックグラウンドで実行される読み込み）
+    warm = run_importtime("import app.main; from app.warmup import ml_warmup; ml_warmup.warm()")
+    startup_roots = {name for name, depth, _ in entries if depth == 0}
+    warm_us = sum(us for name, depth, us in warm if depth == 0 and name not in startup_roots)
+    print(f"ウォームアップで追加読み込み: {warm_us / 1000:.0f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""天気予報APIのスタブサーバー（weather.tsukumijima.net 互換のレスポンスを返す）
+
+負荷試験で外部APIに依存しないように使う。アプリには WEATHER_API_URL で向き先を渡す。
+
+    cd backend
+    python -m benchmarks.stub_weather --port 8081
+    WEATHER_API_URL=http://127.0.0.1:8081/api/forecast uvicorn app.main:app
+"""
+import argparse
+import json
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Tuple
+from urllib.parse import parse_qs, urlparse
+
+TELOPS = ['晴れ', '曇り', '雨', '晴時々曇', '曇時々雨']
+
+def make_forecast(city_code: str, days: int = 3) -> Dict[str, Any]:
+    """都市コードと日付から決まる（再現性のある）3日分の予報"""
+    forecasts = []
+    for offset in range(days):
+        target = date.today() + timedelta(days=offset)
+        seed = zlib.crc32(f"{city_code}:{target.isoformat()}".encode())
+        max_temp = 10 + seed % 20
+        forecasts.append({
+            'date': target.isoformat(),
+            'dateLabel': ['今日', '明日', '明後日'][offset] if offset < 3 else '',
+            'telop': TELOPS[seed % len(TELOPS)],
+            'temperature': {
+                'min': {'celsius': str(max_temp - 6), 'fahrenheit': None},
+                'max': {'celsius': str(max_temp), 'fahrenheit': None}
+            },
+            'chanceOfRain': {'T00_06': '10%', 'T06_12': '20%', 'T12_18': '30%', 'T18_24': '10%'}
+        })
+    return {
+        'publicTime': f"{date.today().isoformat()}T05:00:00+09:00",
+        'title': f"スタブ {city_code} の天気",
+        'location': {'area': 'スタブ', 'prefecture': 'スタブ', 'district': 'スタブ', 'city': f"スタブ{city_code}"},
+        'forecasts': forecasts
+    }
+
+def make_handler(latency_ms: float):
+    class StubWeatherHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/api/forecast':
+                self.send_error(404)
+                return
+            if latency_ms > 0:
+                time.sleep(latency_ms / 1000)
+
+            city_code = parse_qs(url.query).get('city', ['130010'])[0]
+            body = json.dumps(make_forecast(city_code), ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubWeatherHandler
+
+def start_stub_server(port: int = 0, latency_ms: float = 0.0) -> Tuple[ThreadingHTTPServer, str]:
+    """別スレッドでスタブサーバーを起動し、(サーバー, APIのURL) を返す（port=0 で空きポート）"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(latency_ms))
+    threading.Thread(target=server.serve_forever, name="stub-weather", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/forecast"
+
+def main():
+    parser = argparse.ArgumentParser(description="天気予報APIのスタブサーバー")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="レスポンスまでの待ち時間")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args.latency_ms))
+    print(f"スタブ天気APIを起動: http://127.0.0.1:{args.port}/api/forecast")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+
+AIRMATE_CSV_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'raw',
+                                'airmate_rawdata_seiseki_201912-202506.csv')
+
+# Airmate CSVのカラム（日本語ヘッダー）
+AIRMATE_COLUMNS = ['AKR', '店舗名', '日付', '天気', '売上', '目標達成率', '前年同曜日比',
+                   '客数', '客単価', '人件費率', '原価率']
+
+WEATHERS = ['sunny', 'cloudy', 'rainy', 'sleet', 'snow', 'unknown']
+WEATHER_PROBS = [0.45, 0.3, 0.2, 0.01, 0.01, 0.03]
+
+def make_sales_frame(n_rows: int, n_stores: int = 1, seed: int = 42) -> pd.DataFrame:
+    """DataProcessor.process_csv_data と同じ形式の合成売上データを生成"""
+    rng = np.random.default_rng(seed)
+    days_per_store = max(1, n_rows // n_stores)
+    dates = pd.date_range('2000-01-01', periods=days_per_store, freq='D')
+    
+    store_ids = np.repeat([f"AKR{i:010d}" for i in range(n_stores)], days_per_store)
+    all_dates = np.tile(dates.values, n_stores)
+    weekday = pd.DatetimeIndex(all_dates).weekday.values
+    month = pd.DatetimeIndex(all_dates).month.values
+    weather = rng.choice(WEATHERS, size=len(all_dates), p=WEATHER_PROBS)
+    
+    # 曜日・季節・天気・店舗規模の効果を持つ売上
+    store_scale = np.repeat(rng.uniform(0.5, 2.0, n_stores), days_per_store)
+    weekday_effect = np.where(weekday >= 5, 1.3, 1.0)
+    season_effect = 1.0 + 0.15 * np.cos((month - 1) / 12 * 2 * np.pi)
+    weather_effect = np.where(weather == 'rainy', 0.8, 1.0)
+    base = 60000 * store_scale * weekday_effect * season_effect * weather_effect
+    sales = np.maximum(1000, base * rng.normal(1.0, 0.15, len(base))).round()
+    customers = np.maximum(1, sales / rng.normal(900, 80, len(base))).round()
+    
+    return pd.DataFrame({
+        'store_id': store_ids,
+        'store_name': np.char.add('店舗', store_ids.astype(str)),
+        'date': all_dates,
+        'weather': weather,
+        'sales': sales,
+        'target_achievement_rate': 100.0,
+        'yoy_same_day_ratio': 100.0,
+        'customers': customers,
+        'avg_spending': (sales / customers).round(),
+        'labor_cost_rate': 30.0,
+        'cost_rate': 30.0
+    })
+
+def make_airmate_csv(n_stores: int, n_years: float, seed: int = 42,
+                     csv_path: str = AIRMATE_CSV_PATH) -> bytes:
+    """同梱の実データを店舗数×年数に拡大したAirmate形式CSV（Shift_JIS）を生成
+    
+    実データの日次系列を曜日が揃うように週単位で繰り返し、店舗ごとに規模係数と
+    日々のばらつきを掛ける。天気・比率の列と休業日（売上0）は実データのまま使う。
+    """
+    rng = np.random.default_rng(seed)
+    source = pd.read_csv(csv_path, encoding='shift_jis', dtype=str, keep_default_na=False)
+    source_dates = pd.to_datetime(source['日付'])
+    source_sales = pd.to_numeric(source['売上'].str.replace(',', ''), errors='coerce').fillna(0).to_numpy()
+    source_customers = pd.to_numeric(source['客数'].str.replace(',', ''), errors='coerce').fillna(0).to_numpy()
+    
+    # 実データの最終日で終わる期間を、曜日がずれない周期（7日の倍数）で実データに対応付ける
+    n_days = max(1, int(round(n_years * 365)))
+    dates = pd.date_range(end=source_dates.iloc[-1], periods=n_days, freq='D')
+    period = len(source) // 7 * 7
+    index = (dates - source_dates.iloc[0]).days.to_numpy() % period
+    
+    store_index = np.repeat(np.arange(n_stores), n_days)
+    day_index = np.tile(index, n_stores)
+    store_scale = np.repeat(rng.lognormal(0.0, 0.35, n_stores), n_days)
+    noise = rng.normal(1.0, 0.08, len(day_index)).clip(0.5, 1.5)
+    sales = np.round(source_sales[day_index] * store_scale * noise).astype(np.int64)
+    customers = np.round(source_customers[day_index] * store_scale * noise).astype(np.int64)
+    avg_spending = np.divide(sales, customers, out=np.zeros(len(sales)), where=customers > 0).round().astype(np.int64)
+    
+    store_ids = np.array([f"AKR{9000000000 + i}" for i in range(n_stores)])
+    store_names = np.array([f"店舗{i + 1:03d}" for i in range(n_stores)])
+    df = pd.DataFrame({
+        'AKR': store_ids[store_index],
+        '店舗名': store_names[store_index],
+        '日付': np.tile(dates.strftime('%Y-%m-%d').to_numpy(), n_stores),
+        '天気': source['天気'].to_numpy()[day_index],
+        '売上': sales,
+        '目標達成率': source['目標達成率'].to_numpy()[day_index],
+        '前年同曜日比': source['前年同曜日比'].to_numpy()[day_index],
+        '客数': customers,
+        '客単価': avg_spending,
+        '人件費率': source['人件費率'].to_numpy()[day_index],
+        '原価率': source['原価率'].to_numpy()[day_index]
+    }, columns=AIRMATE_COLUMNS)
+    
+    return df.to_csv(index=False, quoting=csv.QUOTE_ALL, lineterminator='\n').encode('shift_jis')